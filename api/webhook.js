@@ -68,6 +68,12 @@ module.exports = async function handler(req, res) {
     const dataCombinada = combinarFechaHora(datosReserva.FechaReserva, datosReserva.HoraReserva);
     console.log('📅 Fecha y hora combinadas:', dataCombinada);
 
+    // Clave de idempotencia de los clientes en Python (make_idempotency_key en
+    // src/database_handler.py): un reintento o el respaldo local con la misma
+    // clave no duplican la reserva (índice único de database/add-idempotency-key-reserva.sql)
+    const idempotencyKey = req.headers['idempotency-key'];
+    const claveIdempotencia = /^[0-9a-f]{64}$/.test(idempotencyKey || '') ? idempotencyKey : null;
+
     // Comenzar transacción
     console.log('🔍 Conectando a la base de datos...');
     const connection = await require('../lib/database').createConnection();
@@ -97,22 +103,40 @@ module.exports = async function handler(req, res) {
 
       // 2. Insertar reserva en tabla RESERVA con nombres CORRECTOS de columnas
       console.log('🔍 Insertando reserva...');
-      const reservaQuery = `
-        INSERT INTO RESERVA 
-        (data_reserva, num_persones, telefon, nom_persona_reserva, observacions, conversa_completa) 
-        VALUES (?, ?, ?, ?, ?, ?)
-      `;
-      
-      const [result] = await connection.execute(reservaQuery, [
+      const reservaParams = [
         dataCombinada,
         datosReserva.NumeroReserva,
         datosReserva.TelefonReserva,
         datosReserva.NomReserva,
         datosReserva.Observacions,
         conversacionCompleta
-      ]);
-
-      const idReserva = result.insertId;
+      ];
+      let idReserva;
+      if (claveIdempotencia) {
+        // Si la clave ya existe la fila no cambia e insertId pasa a ser 0
+        const [result] = await connection.execute(`
+          INSERT INTO RESERVA 
+          (data_reserva, num_persones, telefon, nom_persona_reserva, observacions, conversa_completa, idempotency_key) 
+          VALUES (?, ?, ?, ?, ?, ?, ?) 
+          ON DUPLICATE KEY UPDATE id_reserva = id_reserva + LAST_INSERT_ID(0)
+        `, [...reservaParams, claveIdempotencia]);
+        idReserva = result.insertId;
+        if (!idReserva) {
+          const [rows] = await connection.execute(
+            'SELECT id_reserva FROM RESERVA WHERE idempotency_key = ?', [claveIdempotencia]
+          );
+          idReserva = rows[0].id_reserva;
+          console.log('♻️ Reserva ya registrada con ID:', idReserva, '(reintento)');
+        }
+      } else {
+        const reservaQuery = `
+          INSERT INTO RESERVA 
+          (data_reserva, num_persones, telefon, nom_persona_reserva, observacions, conversa_completa) 
+          VALUES (?, ?, ?, ?, ?, ?)
+        `;
+        const [result] = await connection.execute(reservaQuery, reservaParams);
+        idReserva = result.insertId;
+      }
       console.log('✅ Reserva insertada con ID:', idReserva);
 
       // Confirmar transacción
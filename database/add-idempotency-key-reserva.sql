@@ -0,0 +1,16 @@
+-- Script para añadir la clave de idempotencia a RESERVA
+-- La clave (SHA-256 de sesión + teléfono + fecha/hora, ver
+-- make_idempotency_key en src/database_handler.py) tiene un índice único:
+-- reintentar una reserva ya registrada devuelve la existente en lugar de duplicarla.
+-- Las filas sin clave (NULL) no se ven afectadas por el índice.
+--
+-- Ejecutar ANTES de desplegar las versiones de src/database_handler.py y
+-- api/webhook.js que escriben esta columna (api/webhook.js la usa cuando la
+-- petición trae la cabecera Idempotency-Key).
+
+ALTER TABLE RESERVA
+    ADD COLUMN idempotency_key CHAR(64) NULL DEFAULT NULL COMMENT 'Clave de idempotencia (sesión + teléfono + franja)',
+    ADD UNIQUE KEY uk_reserva_idempotency_key (idempotency_key);
+
+-- Verificar el cambio
+DESCRIBE RESERVA;
@@ -0,0 +1,17 @@
+-- Script para añadir a RESERVA los índices compuestos que usan las consultas de DatabaseHandler
+-- Detectados con src/index_advisor.py (EXPLAIN de cada consulta):
+--   idx_reserva_telefon: historial de un cliente (get_reservas_by_telefon,
+--     iter_reservas_by_telefon) sin recorrer la tabla ni ordenar en memoria
+--   idx_reserva_data: ventanas de capacidad (iter_reservas, rebuild_occupancy
+--     y la consulta de lib/capacity.js)
+-- InnoDB añade id_reserva (clave primaria) al final de cada índice, así que
+-- ORDER BY data_reserva, id_reserva también se resuelve con el índice.
+--
+-- Si alguno ya existe con otro nombre, quitar su línea antes de ejecutar.
+
+ALTER TABLE RESERVA
+    ADD KEY idx_reserva_telefon (telefon, data_reserva),
+    ADD KEY idx_reserva_data (data_reserva);
+
+-- Verificar el cambio
+SHOW INDEX FROM RESERVA;
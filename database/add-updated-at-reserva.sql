@@ -0,0 +1,16 @@
+-- Script para añadir updated_at a RESERVA (feed de cambios incremental)
+-- MySQL actualiza la columna en cada UPDATE; DatabaseHandler.iter_changes y
+-- scripts/stream_reserva_changes.py leen solo las reservas cambiadas desde la
+-- última marca (updated_at, id_reserva), con el índice compuesto para recorrerlas
+-- en orden sin filesort.
+--
+-- Al añadir la columna todas las filas existentes toman la hora actual, así que
+-- la primera sincronización de cada consumidor es completa.
+-- Los borrados no aparecen en el feed (la fila deja de existir).
+
+ALTER TABLE RESERVA
+    ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6) COMMENT 'Última modificación',
+    ADD KEY idx_reserva_updated_at (updated_at, id_reserva);
+
+-- Verificar el cambio
+DESCRIBE RESERVA;
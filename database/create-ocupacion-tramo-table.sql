@@ -0,0 +1,27 @@
+-- Script para crear la tabla OCUPACION_TRAMO
+-- Un contador por día y tramo de 15 minutos con las personas que cuentan contra
+-- una reserva que empiece en ese tramo (misma regla que lib/capacity.js: duración
+-- de la reserva + ventana de solapamiento). DatabaseHandler.reserve_if_available
+-- reserva sitio con un UPDATE condicional sobre la fila del tramo
+-- (... WHERE comensales + N <= capacidad), así que dos llamadas simultáneas solo
+-- compiten si piden el mismo tramo y nunca se bloquea la tabla entera.
+--
+-- insert_reserva, book_reservation, update_reserva y delete_reserva mantienen la
+-- tabla en la misma transacción que la reserva; las escrituras que no pasan por
+-- DatabaseHandler (webhook en JS) se corrigen con:
+--   python database/rebuild_ocupacion_tramo.py
+-- Las filas se crean a demanda la primera vez que se toca un tramo.
+-- Ejecutar ANTES de desplegar la versión de src/database_handler.py que usa esta tabla.
+
+CREATE TABLE IF NOT EXISTS OCUPACION_TRAMO (
+    fecha DATE NOT NULL COMMENT 'Día del tramo',
+    tramo SMALLINT UNSIGNED NOT NULL COMMENT 'Índice del tramo de 15 minutos desde medianoche (0-95)',
+    comensales INT NOT NULL DEFAULT 0 COMMENT 'Personas que cuentan contra una reserva que empiece en el tramo',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    
+    PRIMARY KEY (fecha, tramo)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Ocupación por tramo para reservas sin sobreventa';
+
+-- Verificar que se creó correctamente
+SELECT 'Tabla OCUPACION_TRAMO creada correctamente' as mensaje;
+DESCRIBE OCUPACION_TRAMO;
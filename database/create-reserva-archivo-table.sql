@@ -0,0 +1,33 @@
+-- Script para crear la tabla RESERVA_ARCHIVO
+-- Reservas antiguas movidas fuera de RESERVA por src/reservation_archive.py, para
+-- que la tabla que atiende las reservas en vivo se mantenga pequeña. La
+-- conversación comprimida de RESERVA_CONVERSA se guarda en la misma fila
+-- (columna conversa).
+--
+-- Particionada por mes de data_reserva: el archivador añade las particiones de
+-- los meses que va archivando (pYYYYMM) y un mes antiguo se puede borrar entero
+-- con DROP PARTITION. Por eso no tiene claves foráneas y la clave primaria
+-- incluye data_reserva.
+
+CREATE TABLE IF NOT EXISTS RESERVA_ARCHIVO (
+    id_reserva INT(11) NOT NULL COMMENT 'ID original en RESERVA',
+    data_reserva DATETIME NOT NULL,
+    num_persones INT NOT NULL,
+    telefon VARCHAR(20) NOT NULL,
+    nom_persona_reserva VARCHAR(100),
+    observacions TEXT,
+    conversa_completa TEXT COMMENT 'Conversación sin migrar (columna antigua)',
+    conversa MEDIUMBLOB COMMENT 'Conversación comprimida con zlib (RESERVA_CONVERSA)',
+    idempotency_key CHAR(64) NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    PRIMARY KEY (id_reserva, data_reserva),
+    KEY idx_archivo_telefon (telefon, data_reserva)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Reservas archivadas'
+PARTITION BY RANGE COLUMNS (data_reserva) (
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+-- Verificar que se creó correctamente
+SELECT 'Tabla RESERVA_ARCHIVO creada correctamente' as mensaje;
+DESCRIBE RESERVA_ARCHIVO;
@@ -0,0 +1,23 @@
+-- Script para crear la tabla RESERVA_CONVERSA
+-- Guarda la conversación completa de cada reserva comprimida con zlib (UTF-8),
+-- fuera de la fila de RESERVA, para que las búsquedas por teléfono o por fecha
+-- recorran filas estrechas. La conversación solo se lee cuando se pide
+-- (DatabaseHandler.get_transcript).
+--
+-- Ejecutar ANTES de desplegar la versión de src/database_handler.py que escribe
+-- en esta tabla. Para mover las conversaciones existentes:
+--   python database/migrate_conversa_completa.py
+
+CREATE TABLE IF NOT EXISTS RESERVA_CONVERSA (
+    id_reserva INT(11) NOT NULL PRIMARY KEY COMMENT 'ID de la reserva (RESERVA.id_reserva)',
+    conversa MEDIUMBLOB NOT NULL COMMENT 'Conversación completa comprimida con zlib',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    CONSTRAINT fk_reserva_conversa_reserva
+        FOREIGN KEY (id_reserva) REFERENCES RESERVA (id_reserva)
+        ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Conversaciones de reservas comprimidas';
+
+-- Verificar que se creó correctamente
+SELECT 'Tabla RESERVA_CONVERSA creada correctamente' as mensaje;
+DESCRIBE RESERVA_CONVERSA;
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Migra RESERVA.conversa_completa a RESERVA_CONVERSA (comprimida con zlib)
+
+Recorre RESERVA por id_reserva en bloques, guarda cada conversación
+comprimida en RESERVA_CONVERSA y deja la columna original a NULL, todo en
+la misma transacción por bloque. Se puede ejecutar varias veces: solo
+procesa las filas que aún tienen conversa_completa (por ejemplo las que
+siguen escribiendo las rutas en JS).
+
+Uso:
+    python database/migrate_conversa_completa.py [tamaño_bloque] [pausa_segundos]
+"""
+
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Agregar el directorio src al path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from database_handler import DatabaseHandler, TRANSCRIPT_UPSERT_SQL, compress_transcript
+
+CREATE_TABLE_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'create-reserva-conversa-table.sql')
+
+
+def create_table(db):
+    """Crea RESERVA_CONVERSA si no existe"""
+    with open(CREATE_TABLE_SQL, encoding='utf-8') as f:
+        sql = f.read()
+    start = sql.index('CREATE TABLE')
+    create = sql[start:sql.index(';', start)]
+    with db.pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(create)
+        finally:
+            cursor.close()
+
+
+def migrate(db, chunk_size=500, pause=0.1):
+    """
+    Mueve las conversaciones en bloques de `chunk_size` filas
+
+    Returns:
+        int: Número de conversaciones migradas
+    """
+    select_query = """
+    SELECT id_reserva, conversa_completa FROM RESERVA 
+    WHERE id_reserva > %s AND conversa_completa IS NOT NULL 
+    ORDER BY id_reserva 
+    LIMIT %s
+    FOR UPDATE
+    """
+    migrated = 0
+    last_id = 0
+
+    while True:
+        with db.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                cursor.execute(select_query, (last_id, chunk_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    conn.commit()
+                    break
+
+                cursor.executemany(
+                    TRANSCRIPT_UPSERT_SQL,
+                    [(reserva_id, compress_transcript(conversa)) for reserva_id, conversa in rows]
+                )
+                ids = [reserva_id for reserva_id, _ in rows]
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(
+                    f"UPDATE RESERVA SET conversa_completa = NULL WHERE id_reserva IN ({placeholders})",
+                    ids
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        migrated += len(rows)
+        last_id = rows[-1][0]
+        print(f"   {migrated} conversaciones migradas (hasta id_reserva {last_id})")
+
+        # No saturar la base de datos que atiende las reservas en vivo
+        time.sleep(pause)
+
+    return migrated
+
+
+def main():
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    pause = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    print("MIGRACIÓN DE CONVERSACIONES A RESERVA_CONVERSA")
+    print("=" * 50)
+
+    db = DatabaseHandler()
+    if not db.connect():
+        return
+
+    try:
+        create_table(db)
+        print("✅ Tabla RESERVA_CONVERSA lista")
+        migrated = migrate(db, chunk_size, pause)
+        print(f"✅ Migración completada: {migrated} conversaciones")
+        print("💡 Ejecuta OPTIMIZE TABLE RESERVA para recuperar el espacio de la tabla")
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
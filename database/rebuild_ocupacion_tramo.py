@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Recalcula OCUPACION_TRAMO a partir de RESERVA
+
+DatabaseHandler mantiene la ocupación por tramo en la misma transacción que
+cada alta, cambio o baja, pero el webhook en JS escribe en RESERVA
+directamente y no la actualiza. Este script corrige esos desvíos día a día
+(cada día en su propia transacción). Se puede ejecutar tantas veces como
+haga falta, por ejemplo desde un cron cada pocos minutos para los próximos días.
+
+Uso:
+    python database/rebuild_ocupacion_tramo.py [desde YYYY-MM-DD] [días] [pausa_segundos]
+
+Por defecto recalcula desde hoy los próximos 30 días.
+"""
+
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Agregar el directorio src al path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from database_handler import DatabaseHandler
+
+CREATE_TABLE_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'create-ocupacion-tramo-table.sql')
+
+
+def create_table(db):
+    """Crea OCUPACION_TRAMO si no existe"""
+    with open(CREATE_TABLE_SQL, encoding='utf-8') as f:
+        sql = f.read()
+    start = sql.index('CREATE TABLE')
+    create = sql[start:sql.index(';', start)]
+    with db.pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(create)
+        finally:
+            cursor.close()
+
+
+def rebuild(db, start_day, days=30, pause=0.1):
+    """
+    Recalcula `days` días a partir de `start_day`
+
+    Returns:
+        int: Días recalculados, None si hubo un error
+    """
+    rebuilt = 0
+    for offset in range(days):
+        day = start_day + timedelta(days=offset)
+        if db.rebuild_occupancy(day) is None:
+            return None
+        rebuilt += 1
+
+        # No saturar la base de datos que atiende las reservas en vivo
+        time.sleep(pause)
+
+    return rebuilt
+
+
+def main():
+    start_day = datetime.strptime(sys.argv[1], "%Y-%m-%d").date() if len(sys.argv) > 1 else date.today()
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    pause = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    print("RECÁLCULO DE LA OCUPACIÓN POR TRAMO (OCUPACION_TRAMO)")
+    print("=" * 50)
+
+    db = DatabaseHandler()
+    if not db.connect():
+        return
+
+    try:
+        create_table(db)
+        print("✅ Tabla OCUPACION_TRAMO lista")
+        rebuilt = rebuild(db, start_day, days, pause)
+        if rebuilt is None:
+            print("❌ Recálculo interrumpido")
+        else:
+            print(f"✅ Recálculo completado: {rebuilt} días desde {start_day}")
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark de inserción de reservas: fila a fila vs insert_reservas_bulk
+
+Uso:
+    python scripts/benchmark_bulk_insert.py [filas] [chunk_size]
+
+Las reservas de prueba usan teléfonos con el prefijo +00999 y se borran
+al terminar.
+"""
+
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Agregar el directorio src al path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from database_handler import DatabaseHandler
+
+TEST_PREFIX = '+00999'
+
+
+def generate_rows(count):
+    """Genera reservas de prueba (10 reservas por teléfono)"""
+    for i in range(count):
+        yield {
+            'data_reserva': f"2030-01-{(i % 28) + 1:02d} 20:00:00",
+            'num_persones': (i % 6) + 1,
+            'telefon': f"{TEST_PREFIX}{i // 10:06d}",
+            'nom_persona_reserva': f"Benchmark {i // 10}",
+            'observacions': 'Benchmark carga masiva',
+            'conversa_completa': None
+        }
+
+
+def cleanup(db):
+    """Elimina las reservas y clientes de prueba"""
+    with db.pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM RESERVA WHERE telefon LIKE %s", (f"{TEST_PREFIX}%",))
+            cursor.execute("DELETE FROM CLIENT WHERE TELEFON LIKE %s", (f"{TEST_PREFIX}%",))
+        finally:
+            cursor.close()
+
+
+def benchmark_row_at_a_time(db, count):
+    start = time.perf_counter()
+    for row in generate_rows(count):
+        db.insert_client(row['nom_persona_reserva'], row['telefon'])
+        db.insert_reserva(**row)
+    return time.perf_counter() - start
+
+
+def benchmark_bulk(db, count, chunk_size):
+    start = time.perf_counter()
+    report = db.insert_reservas_bulk(generate_rows(count), chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    if report['failed']:
+        print(f"⚠️ Filas fallidas: {report['failed'][:5]}")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    print("BENCHMARK DE INSERCIÓN DE RESERVAS")
+    print("=" * 50)
+
+    db = DatabaseHandler()
+    if not db.connect():
+        return
+
+    try:
+        cleanup(db)
+
+        elapsed = benchmark_row_at_a_time(db, count)
+        row_rate = count / elapsed
+        cleanup(db)
+
+        elapsed_bulk = benchmark_bulk(db, count, chunk_size)
+        bulk_rate = count / elapsed_bulk
+    finally:
+        cleanup(db)
+        db.disconnect()
+
+    print("\n📊 Resultados")
+    print(f"   Filas: {count} (chunk_size={chunk_size})")
+    print(f"   Fila a fila: {elapsed:.2f}s → {row_rate:.0f} filas/s")
+    print(f"   Bulk:        {elapsed_bulk:.2f}s → {bulk_rate:.0f} filas/s")
+    print(f"   Aceleración: x{bulk_rate / row_rate:.1f}")
+
+
+if __name__ == "__main__":
+    main()
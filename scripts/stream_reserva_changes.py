@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Emite como JSON lines las reservas nuevas o modificadas desde la última ejecución
+
+Pensado para sincronizar el panel de AppSheet y los informes sin volcar
+la tabla entera: cada línea de la salida estándar es una reserva, y la
+marca (updated_at, id_reserva) de lo ya emitido se guarda en un fichero
+después de cada bloque. Si se interrumpe, la siguiente ejecución continúa
+desde el último bloque completo (como mucho repite ese bloque).
+
+Uso:
+    python scripts/stream_reserva_changes.py [fichero_marca] [tamaño_bloque] > cambios.jsonl
+
+Por defecto la marca se guarda en logs/reserva_changes.watermark.json.
+"""
+
+import os
+import sys
+import json
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Agregar el directorio src al path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from database_handler import DatabaseHandler
+
+
+def load_watermark(path):
+    """Lee la marca guardada; None si es la primera ejecución"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return datetime.fromisoformat(data['updated_at']), int(data['id_reserva'])
+
+
+def save_watermark(path, watermark):
+    """Guarda la marca de forma atómica (fichero temporal + rename)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    updated_at, id_reserva = watermark
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'updated_at': updated_at.isoformat(), 'id_reserva': id_reserva}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'logs/reserva_changes.watermark.json'
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    # stdout solo lleva las reservas: los mensajes (también los de
+    # DatabaseHandler) van a stderr
+    out = sys.stdout
+    sys.stdout = sys.stderr
+
+    db = DatabaseHandler()
+    watermark = load_watermark(path)
+    print(f"🔄 Cambios desde {watermark or 'el principio'}")
+
+    emitted = 0
+    try:
+        for rows, watermark in db.iter_changes(watermark, chunk_size=chunk_size):
+            for row in rows:
+                out.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+            out.flush()
+            save_watermark(path, watermark)
+            emitted += len(rows)
+    finally:
+        db.disconnect()
+
+    print(f"✅ {emitted} reservas emitidas; marca: {watermark}")
+
+
+if __name__ == "__main__":
+    main()
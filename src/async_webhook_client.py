@@ -0,0 +1,196 @@
+# src/async_webhook_client.py
+"""
+Cliente asyncio del webhook de reservas con concurrencia limitada
+
+Permite lanzar cientos de reservas desde un único bucle de eventos (reenvío
+de lotes, simulaciones con muchas llamadas a la vez) con el mismo formato
+de petición que VoiceReservationSystem._format_parameters_for_webhook.
+
+Las peticiones van con aiohttp sobre una única ClientSession (conexiones
+keep-alive compartidas, como la requests.Session de WebhookClient): cientos
+de peticiones en curso no necesitan ningún hilo.
+
+Uso:
+    python src/async_webhook_client.py fichero.jsonl [concurrencia]
+
+Cada línea del fichero es una petición completa (ver build_payload) o un
+objeto {"session": ..., "parameters": {...}} con parámetros de Dialogflow.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import aiohttp
+from webhook_client import DEFAULT_WEBHOOK_URL, build_payload, format_parameters, idempotency_headers, parse_fulfillment_text
+
+
+def reservation_payload(session, parameters, language_code="es-ES"):
+    """Petición al webhook para unos parámetros de Dialogflow (NomReserva, TelefonReserva...)"""
+    return build_payload(session, format_parameters(parameters), language_code)
+
+
+class AsyncWebhookClient:
+    def __init__(self, webhook_url=None, concurrency=None, connect_timeout=None, read_timeout=None):
+        """
+        Cliente asyncio del webhook
+
+        La sesión HTTP se abre en el bucle de eventos con la primera
+        petición; hay que cerrarla con `await close()` (o usar el cliente
+        con `async with`).
+
+        Args:
+            webhook_url (str): URL del webhook (WEBHOOK_URL)
+            concurrency (int): Peticiones en curso a la vez como máximo, y
+                conexiones abiertas (WEBHOOK_CONCURRENCY)
+            connect_timeout (float): Segundos para conectar (WEBHOOK_CONNECT_TIMEOUT)
+            read_timeout (float): Segundos esperando la respuesta (WEBHOOK_READ_TIMEOUT)
+        """
+        self.webhook_url = webhook_url or os.getenv('WEBHOOK_URL', DEFAULT_WEBHOOK_URL)
+        self.concurrency = int(concurrency or os.getenv('WEBHOOK_CONCURRENCY', 20))
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=float(connect_timeout or os.getenv('WEBHOOK_CONNECT_TIMEOUT', 3.05)),
+            sock_read=float(read_timeout or os.getenv('WEBHOOK_READ_TIMEOUT', 30))
+        )
+        self._session = None
+        self._semaphore = None
+
+    def _get_session(self):
+        """ClientSession compartida (se crea dentro del bucle de eventos)"""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=self.timeout,
+                headers={'Content-Type': 'application/json'}
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def submit(self, payload, idempotency_key=None):
+        """
+        Envía una petición respetando el límite de concurrencia
+
+        Args:
+            payload (dict): Cuerpo JSON (ver build_payload / reservation_payload)
+            idempotency_key (str): Clave de make_idempotency_key (opcional)
+
+        Returns:
+            dict: {'session', 'ok', 'status', 'text', 'error', 'elapsed_ms'};
+                los errores de red vienen en 'error', nunca como excepción
+        """
+        session = self._get_session()
+        result = {
+            'session': payload.get('sessionInfo', {}).get('session'),
+            'ok': False,
+            'status': None,
+            'text': None,
+            'error': None
+        }
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                async with session.post(self.webhook_url, json=payload, headers=idempotency_headers(idempotency_key)) as response:
+                    result['status'] = response.status
+                    if response.status == 200:
+                        result['text'] = parse_fulfillment_text(await response.json(content_type=None))
+                        result['ok'] = True
+                    else:
+                        result['error'] = (await response.text())[:200]
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                result['error'] = str(e) or type(e).__name__
+            result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        return result
+
+    async def _submit_indexed(self, index, payload):
+        result = await self.submit(payload)
+        result['index'] = index
+        return result
+
+    async def submit_many(self, payloads):
+        """
+        Envía muchas peticiones y devuelve los resultados según terminan
+
+        Las peticiones se van creando a medida que hay hueco, así que
+        `payloads` puede ser un generador largo sin cargarlo en memoria.
+
+        Args:
+            payloads (iterable): Peticiones (ver build_payload / reservation_payload)
+
+        Yields:
+            dict: Resultado de submit() más 'index', la posición de la
+                petición en `payloads`, en orden de finalización
+        """
+        pending = set()
+        try:
+            for index, payload in enumerate(payloads):
+                pending.add(asyncio.ensure_future(self._submit_indexed(index, payload)))
+                # Un poco más que la concurrencia para que nunca falten peticiones listas
+                if len(pending) >= 2 * self.concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # El consumidor ha dejado de leer: no lanzar las que faltan
+            for task in pending:
+                task.cancel()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def load_payloads(path):
+    """Lee las peticiones de un fichero JSON lines"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if 'sessionInfo' in data:
+                yield data
+            else:
+                yield reservation_payload(data.get('session', 'async-webhook-client'), data.get('parameters', {}))
+
+
+async def _run(path, concurrency):
+    start = time.perf_counter()
+    sent = failed = 0
+    async with AsyncWebhookClient(concurrency=concurrency) as client:
+        async for result in client.submit_many(load_payloads(path)):
+            sent += 1
+            if not result['ok']:
+                failed += 1
+                print(f"❌ Petición {result['index']} ({result['session']}): {result['status']} {result['error']}")
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {sent} peticiones en {elapsed:.1f} s ({sent / elapsed if elapsed else 0:.0f}/s), {failed} fallidas")
+
+
+def main():
+    from dotenv import load_dotenv
+
+    # Cargar variables de entorno
+    load_dotenv()
+
+    if len(sys.argv) < 2:
+        print("Uso: python src/async_webhook_client.py fichero.jsonl [concurrencia]")
+        return
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    asyncio.run(_run(sys.argv[1], concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# src/availability.py
+import os
+import time
+from datetime import datetime, timedelta, time as dtime
+from restaurant_config import get_restaurant_config
+from structured_logging import get_logger
+
+BIN_MINUTES = 15
+
+logger = get_logger('availability')
+
+
+def _to_minutes(value):
+    """Minutos desde medianoche de un 'HH:MM', time o datetime"""
+    if isinstance(value, str):
+        hours, minutes = value.split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    return value.hour * 60 + value.minute
+
+
+def parse_slot(value):
+    """Convierte 'YYYY-MM-DD HH:MM[:SS]' o datetime en datetime"""
+    if isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha/hora de reserva no válida: {value}")
+
+
+def affected_slots(data_reserva, duration_minutes, overlap_minutes, bin_minutes=BIN_MINUTES):
+    """
+    Tramos (fecha, tramo) a los que cuenta una reserva que empieza en data_reserva
+
+    Es la misma regla que AvailabilityIndex: la reserva cuenta para las
+    horas T con R - duración - solapamiento < T <= R + solapamiento. Los
+    tramos pueden caer en el día anterior o el siguiente.
+
+    Returns:
+        list: Pares (date, índice de tramo) en orden cronológico
+    """
+    start = parse_slot(data_reserva)
+    midnight = datetime.combine(start.date(), dtime())
+    offset = int((start - midnight).total_seconds() // 60)
+    first = (offset - duration_minutes - overlap_minutes) // bin_minutes + 1
+    last = (offset + overlap_minutes) // bin_minutes
+
+    bins_per_day = 24 * 60 // bin_minutes
+    slots = []
+    for b in range(first, last + 1):
+        day = start.date() + timedelta(days=b // bins_per_day)
+        slots.append((day, b % bins_per_day))
+    return slots
+
+
+def slot_of(data_reserva, bin_minutes=BIN_MINUTES):
+    """Tramo (fecha, tramo) en el que empieza una reserva"""
+    start = parse_slot(data_reserva)
+    return start.date(), (start.hour * 60 + start.minute) // bin_minutes
+
+
+class AvailabilityIndex:
+    def __init__(self, day, capacity, duration_minutes, overlap_minutes, bin_minutes=BIN_MINUTES):
+        """
+        Índice de ocupación de un día de servicio en tramos fijos
+
+        Reproduce la regla de lib/capacity.js: una reserva de N personas a la
+        hora T cabe si las personas de las reservas que empiezan en la
+        ventana [T - solapamiento, T + duración + solapamiento) más N no
+        superan la capacidad. Para cada tramo se guarda directamente ese
+        total, así que cada consulta es una lectura O(1) y cada alta o
+        cancelación actualiza solo los tramos a los que afecta.
+
+        Args:
+            day (date): Día de servicio
+            capacity (int): Capacidad máxima en personas
+            duration_minutes (int): Duración estimada de una reserva
+            overlap_minutes (int): Ventana de solapamiento antes y después
+            bin_minutes (int): Tamaño de tramo en minutos
+        """
+        self.day = day
+        self.capacity = capacity
+        self.duration_minutes = duration_minutes
+        self.overlap_minutes = overlap_minutes
+        self.bin_minutes = bin_minutes
+        self.num_bins = 24 * 60 // bin_minutes
+        # load[b] = personas que cuentan contra una reserva que empiece en el tramo b
+        self.load = [0] * self.num_bins
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load_day(cls, database_handler, day, config=None, bin_minutes=BIN_MINUTES):
+        """
+        Construye el índice de un día leyendo RESERVA una sola vez
+
+        Args:
+            database_handler (DatabaseHandler): Acceso a la base de datos
+            day (date): Día de servicio
+            config (dict): Configuración del restaurante (por defecto get_restaurant_config)
+        """
+        config = config or get_restaurant_config(database_handler)
+        index = cls(
+            day,
+            config['capacidad_maxima'],
+            config['duracion_reserva_minutos'],
+            config['ventana_solapamiento'],
+            bin_minutes
+        )
+
+        # Reservas que pueden afectar a alguna hora del día, incluidas las
+        # de los bordes del día anterior y siguiente
+        midnight = datetime.combine(day, dtime())
+        start = midnight - timedelta(minutes=index.overlap_minutes)
+        end = midnight + timedelta(days=1, minutes=index.duration_minutes + index.overlap_minutes)
+
+        for reserva in database_handler.iter_reservas(start, end):
+            # Las canceladas tienen 'CANCELADA' en observacions
+            if 'CANCELADA' in (reserva.get('observacions') or ''):
+                continue
+            index.add(reserva['data_reserva'], reserva['num_persones'])
+        return index
+
+    @classmethod
+    def load_occupancy(cls, database_handler, day, config=None, bin_minutes=BIN_MINUTES):
+        """
+        Construye el índice de un día desde OCUPACION_TRAMO
+
+        Es una sola lectura por clave primaria (get_day_occupancy) en lugar
+        de recorrer RESERVA. Si no se puede leer la tabla se usa load_day.
+        """
+        config = config or get_restaurant_config(database_handler)
+        load = database_handler.get_day_occupancy(day) if bin_minutes == BIN_MINUTES else None
+        if load is None:
+            return cls.load_day(database_handler, day, config, bin_minutes)
+
+        index = cls(
+            day,
+            config['capacidad_maxima'],
+            config['duracion_reserva_minutos'],
+            config['ventana_solapamiento'],
+            bin_minutes
+        )
+        index.load = list(load)
+        return index
+
+    def _offset(self, when):
+        """Minutos desde la medianoche del día del índice (negativo o > 24h en los bordes)"""
+        if isinstance(when, datetime):
+            return int((when - datetime.combine(self.day, dtime())).total_seconds() // 60)
+        return _to_minutes(when)
+
+    def _apply(self, when, covers):
+        # Una reserva que empieza en R cuenta para las horas T con
+        # T - solapamiento <= R < T + duración + solapamiento,
+        # es decir R - duración - solapamiento < T <= R + solapamiento
+        start = self._offset(when)
+        first = (start - self.duration_minutes - self.overlap_minutes) // self.bin_minutes + 1
+        last = (start + self.overlap_minutes) // self.bin_minutes
+        for b in range(max(first, 0), min(last, self.num_bins - 1) + 1):
+            self.load[b] += covers
+
+    def add(self, when, covers):
+        """Registra una reserva nueva (hora o datetime de inicio, personas)"""
+        self._apply(when, int(covers))
+
+    def remove(self, when, covers):
+        """Descuenta una reserva cancelada"""
+        self._apply(when, -int(covers))
+
+    def occupied(self, when):
+        """Personas que cuentan contra una reserva que empiece a esa hora"""
+        return self.load[self._offset(when) // self.bin_minutes]
+
+    def can_seat(self, when, party_size):
+        """
+        Indica si caben `party_size` personas a esa hora
+
+        Args:
+            when: 'HH:MM', time o datetime del mismo día
+            party_size (int): Número de personas
+
+        Returns:
+            bool: True si hay capacidad
+        """
+        return self.occupied(when) + int(party_size) <= self.capacity
+
+    def suggest_slots(self, when, party_size, windows, k=3, earliest=None):
+        """
+        Busca las k horas de inicio con sitio más cercanas a la pedida
+
+        Args:
+            when: Hora pedida ('HH:MM', time o datetime)
+            party_size (int): Número de personas
+            windows (list): Tramos de servicio [('13:00', '15:00'), ...];
+                se proponen inicios dentro de [apertura, cierre)
+            k (int): Número máximo de propuestas
+            earliest (int): Minuto del día a partir del cual proponer (antelación mínima)
+
+        Returns:
+            list: Horas 'HH:MM' ordenadas de más cercana a más lejana
+        """
+        target = self._offset(when)
+        limit = self.capacity - int(party_size)
+
+        candidates = []
+        for window_start, window_end in windows:
+            first = -(-_to_minutes(window_start) // self.bin_minutes)
+            last = -(-_to_minutes(window_end) // self.bin_minutes)
+            for b in range(max(first, 0), min(last, self.num_bins)):
+                minute = b * self.bin_minutes
+                if self.load[b] <= limit and (earliest is None or minute >= earliest):
+                    candidates.append(minute)
+
+        candidates.sort(key=lambda minute: (abs(minute - target), minute))
+        return [f"{minute // 60:02d}:{minute % 60:02d}" for minute in candidates[:k]]
+
+
+class AvailabilityService:
+    def __init__(self, database_handler, max_age=None, source=None):
+        """
+        Mantiene un AvailabilityIndex por día de servicio
+
+        Los índices se recargan pasados `max_age` segundos
+        (AVAILABILITY_INDEX_TTL) porque el webhook en JS también inserta
+        reservas en la misma tabla.
+
+        Con source='ocupacion' (AVAILABILITY_SOURCE) los índices se cargan
+        de OCUPACION_TRAMO en lugar de recorrer RESERVA. Como las rutas en
+        JS no mantienen esa tabla, requiere ejecutar periódicamente
+        database/rebuild_ocupacion_tramo.py.
+        """
+        self.database_handler = database_handler
+        self.max_age = float(max_age if max_age is not None else os.getenv('AVAILABILITY_INDEX_TTL', 60))
+        self.source = source or os.getenv('AVAILABILITY_SOURCE', 'reservas')
+        self._indexes = {}
+
+    def get_index(self, day):
+        index = self._indexes.get(day)
+        if index is None or time.monotonic() - index.loaded_at > self.max_age:
+            if self.source == 'ocupacion':
+                index = AvailabilityIndex.load_occupancy(self.database_handler, day)
+            else:
+                index = AvailabilityIndex.load_day(self.database_handler, day)
+            self._indexes[day] = index
+        return index
+
+    def can_seat(self, data_reserva, party_size):
+        """Comprueba la capacidad para un datetime de reserva"""
+        return self.get_index(data_reserva.date()).can_seat(data_reserva, party_size)
+
+    def suggest_slots(self, day, when, party_size, k=3):
+        """
+        Propone las k horas con sitio más cercanas dentro del horario
+
+        Los tramos de servicio (comida y cena) y la antelación mínima salen
+        de la tabla configuracion.
+
+        Args:
+            day (date): Día de la reserva
+            when: Hora pedida ('HH:MM', time o datetime)
+            party_size (int): Número de personas
+            k (int): Número máximo de propuestas
+
+        Returns:
+            list: Horas 'HH:MM' ordenadas por cercanía a la pedida
+        """
+        config = get_restaurant_config(self.database_handler)
+        if int(party_size) > config['max_personas_mesa']:
+            return []
+
+        earliest = None
+        now = datetime.now()
+        if day < now.date():
+            return []
+        if day == now.date():
+            earliest_time = now + timedelta(hours=config['min_antelacion_horas'])
+            if earliest_time.date() > day:
+                return []
+            earliest = earliest_time.hour * 60 + earliest_time.minute
+
+        windows = [
+            (config['lunch_start'], config['lunch_end']),
+            (config['dinner_start'], config['dinner_end'])
+        ]
+        return self.get_index(day).suggest_slots(when, party_size, windows, k, earliest)
+
+    def _affected_indexes(self, data_reserva):
+        # Una reserva cerca de medianoche también cuenta en el día vecino
+        day = data_reserva.date()
+        for offset in (-1, 0, 1):
+            index = self._indexes.get(day + timedelta(days=offset))
+            if index is not None:
+                yield index
+
+    def record(self, data_reserva, party_size):
+        """Actualiza los índices cargados tras confirmar una reserva"""
+        for index in self._affected_indexes(data_reserva):
+            index.add(data_reserva, party_size)
+
+    def cancel(self, data_reserva, party_size):
+        """Actualiza los índices cargados tras cancelar una reserva"""
+        for index in self._affected_indexes(data_reserva):
+            index.remove(data_reserva, party_size)
+
+
+def simulator_availability():
+    """
+    AvailabilityService de los simuladores conversacionales (SIMULATOR_DB_BACKEND)
+
+    Por omisión los simuladores no comprueban la capacidad: sin la variable
+    nunca se conectan a la base de datos de producción. Con sqlite se usa
+    SIMULATOR_SQLITE_PATH (o DB_SQLITE_PATH); con mysql hace falta DB_HOST
+    explícito.
+
+    Returns:
+        AvailabilityService: El servicio, None si no se comprueba la capacidad
+
+    Raises:
+        ValueError: Si SIMULATOR_DB_BACKEND=mysql sin DB_HOST
+    """
+    from database_handler import DatabaseHandler
+
+    backend = os.getenv('SIMULATOR_DB_BACKEND', '').lower()
+    if not backend:
+        return None
+    if backend == 'sqlite':
+        return AvailabilityService(DatabaseHandler(backend='sqlite', sqlite_path=os.getenv('SIMULATOR_SQLITE_PATH')))
+    # Sin DB_HOST, DatabaseHandler usaría el servidor de producción
+    if not os.getenv('DB_HOST'):
+        raise ValueError("SIMULATOR_DB_BACKEND=mysql requiere DB_HOST explícito")
+    return AvailabilityService(DatabaseHandler(backend=backend))
+
+
+def slot_alternatives(availability, fecha, hora, party_size, k=3):
+    """
+    Horas alternativas si a esa hora no caben `party_size` personas
+
+    Para los simuladores: si no se puede comprobar la capacidad se sigue
+    sin comprobarla.
+
+    Args:
+        availability (AvailabilityService): Servicio (None = no comprobar)
+        fecha (str): Fecha 'YYYY-MM-DD'
+        hora (str): Hora 'HH:MM'
+        party_size (int): Número de personas
+        k (int): Número máximo de propuestas
+
+    Returns:
+        list: Horas 'HH:MM' con sitio ese día (vacía si no queda ninguna),
+            None si hay sitio o no se ha podido comprobar
+    """
+    if not availability:
+        return None
+    try:
+        fecha_hora = datetime.strptime(f"{fecha} {hora}", "%Y-%m-%d %H:%M")
+        if availability.can_seat(fecha_hora, party_size):
+            return None
+        return availability.suggest_slots(fecha_hora.date(), fecha_hora, party_size, k)
+    except Exception as e:
+        logger.warning("⚠️ No se pudo comprobar la disponibilidad: %s", e)
+        return None
@@ -0,0 +1,161 @@
+# src/circuit_breaker.py
+import os
+import time
+import random
+import threading
+from collections import deque
+from structured_logging import get_logger
+
+logger = get_logger('webhook')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """
+    Espera antes del reintento `attempt` (1, 2, ...): backoff exponencial
+    con jitter completo, uniforme entre 0 y min(cap, base * 2^attempt)
+
+    Args:
+        base (float): Segundos base (WEBHOOK_RETRY_BASE)
+        cap (float): Espera máxima en segundos (WEBHOOK_RETRY_CAP)
+    """
+    base = float(base if base is not None else os.getenv('WEBHOOK_RETRY_BASE', 0.2))
+    cap = float(cap if cap is not None else os.getenv('WEBHOOK_RETRY_CAP', 2))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, name='webhook', failure_rate=None, slow_call_ms=None, slow_call_rate=None,
+                 window=None, min_calls=None, open_seconds=None):
+        """
+        Circuit breaker por tasa de fallos y de llamadas lentas
+
+        Cerrado: las llamadas pasan y se guarda el resultado de las últimas
+        `window`. Si con al menos `min_calls` la tasa de fallos o de
+        llamadas lentas llega a su umbral, se abre. Abierto: allow()
+        devuelve False sin esperar a la red. Pasados `open_seconds` pasa a
+        semiabierto y deja pasar una sola llamada de prueba: si va bien y
+        rápida se cierra; si no, vuelve a abrirse.
+
+        Args:
+            name (str): Nombre para los mensajes y las métricas
+            failure_rate (float): Fracción de fallos que abre el circuito
+                (WEBHOOK_BREAKER_FAILURE_RATE)
+            slow_call_ms (float): Duración a partir de la cual una llamada es
+                lenta (WEBHOOK_BREAKER_SLOW_MS)
+            slow_call_rate (float): Fracción de llamadas lentas que abre el
+                circuito (WEBHOOK_BREAKER_SLOW_RATE)
+            window (int): Llamadas recientes que se evalúan (WEBHOOK_BREAKER_WINDOW)
+            min_calls (int): Llamadas mínimas antes de evaluar (WEBHOOK_BREAKER_MIN_CALLS)
+            open_seconds (float): Tiempo abierto antes de probar
+                (WEBHOOK_BREAKER_OPEN_SECONDS)
+        """
+        self.name = name
+        self.failure_rate = float(failure_rate or os.getenv('WEBHOOK_BREAKER_FAILURE_RATE', 0.5))
+        self.slow_call_ms = float(slow_call_ms or os.getenv('WEBHOOK_BREAKER_SLOW_MS', 5000))
+        self.slow_call_rate = float(slow_call_rate or os.getenv('WEBHOOK_BREAKER_SLOW_RATE', 0.8))
+        self.min_calls = int(min_calls or os.getenv('WEBHOOK_BREAKER_MIN_CALLS', 5))
+        self.open_seconds = float(open_seconds or os.getenv('WEBHOOK_BREAKER_OPEN_SECONDS', 30))
+        # (fallo, lenta) de las últimas llamadas
+        self._outcomes = deque(maxlen=int(window or os.getenv('WEBHOOK_BREAKER_WINDOW', 20)))
+
+        self.state = CLOSED
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._counters = {'calls': 0, 'failures': 0, 'slow': 0, 'rejected': 0, 'opened': 0, 'probes': 0}
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        # Llamar con el lock tomado
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._counters['opened'] += 1
+            logger.warning("⚡ Circuito '%s' abierto durante %.0f s", self.name, self.open_seconds)
+        elif state == CLOSED:
+            self._outcomes.clear()
+            logger.info("✅ Circuito '%s' cerrado: el servicio se ha recuperado", self.name)
+
+    def allow(self):
+        """
+        Indica si se puede hacer la llamada
+
+        En semiabierto solo la llamada de prueba recibe True; quien la
+        recibe debe llamar a record() cuando termine.
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._counters['probes'] += 1
+                return True
+            if self.state == CLOSED:
+                return True
+            self._counters['rejected'] += 1
+            return False
+
+    def record(self, success, elapsed_ms=0.0):
+        """
+        Registra el resultado de una llamada autorizada por allow()
+
+        Args:
+            success (bool): False si el servicio falló (error de red, 5xx)
+            elapsed_ms (float): Duración de la llamada
+        """
+        slow = elapsed_ms >= self.slow_call_ms
+        with self._lock:
+            self._counters['calls'] += 1
+            if not success:
+                self._counters['failures'] += 1
+            if slow:
+                self._counters['slow'] += 1
+
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._transition(CLOSED if success and not slow else OPEN)
+                return
+            if self.state != CLOSED:
+                return
+
+            self._outcomes.append((not success, slow))
+            if len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for failed, _ in self._outcomes if failed)
+                slow_calls = sum(1 for _, was_slow in self._outcomes if was_slow)
+                if (failures / len(self._outcomes) >= self.failure_rate
+                        or slow_calls / len(self._outcomes) >= self.slow_call_rate):
+                    self._transition(OPEN)
+
+    def cancel(self):
+        """Libera una autorización de allow() sin resultado (la llamada no se llegó a hacer)"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def stats(self):
+        """
+        Estado y contadores del circuito
+
+        Returns:
+            dict: state, contadores (calls, failures, slow, rejected, opened,
+                probes), tasas de la ventana actual y segundos hasta la
+                siguiente prueba si está abierto
+        """
+        with self._lock:
+            outcomes = list(self._outcomes)
+            result = dict(self._counters)
+            result['state'] = self.state
+            result['window_failure_rate'] = (
+                sum(1 for failed, _ in outcomes if failed) / len(outcomes) if outcomes else 0.0
+            )
+            result['window_slow_rate'] = (
+                sum(1 for _, slow in outcomes if slow) / len(outcomes) if outcomes else 0.0
+            )
+            result['retry_in_s'] = (
+                max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+                if self.state == OPEN else 0.0
+            )
+        return result
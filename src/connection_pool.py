@@ -0,0 +1,161 @@
+# src/connection_pool.py
+import os
+import time
+import threading
+from contextlib import contextmanager
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import PoolError, InterfaceError, OperationalError
+
+
+class ConnectionPool:
+    def __init__(self, config, size=None, timeout=None, ping_interval=None):
+        """
+        Pool acotado de conexiones MySQL
+
+        Las conexiones se crean de forma perezosa (solo cuando hacen falta)
+        hasta un máximo de `size`. Al prestar una conexión que lleva ociosa
+        más de `ping_interval` segundos se le hace ping y, si se ha caído,
+        se reconecta antes de entregarla.
+
+        Args:
+            config (dict): Parámetros para mysql.connector.connect
+            size (int): Número máximo de conexiones abiertas (DB_POOL_SIZE)
+            timeout (float): Segundos de espera cuando el pool está agotado (DB_POOL_TIMEOUT)
+            ping_interval (float): Segundos de inactividad a partir de los cuales
+                se hace ping al prestar (DB_POOL_PING_INTERVAL, 0 = siempre)
+        """
+        self.config = config
+        self.size = int(size or os.getenv('DB_POOL_SIZE', 5))
+        self.timeout = float(timeout if timeout is not None else os.getenv('DB_POOL_TIMEOUT', 10))
+        self.ping_interval = float(
+            ping_interval if ping_interval is not None else os.getenv('DB_POOL_PING_INTERVAL', 5)
+        )
+
+        # LIFO: reutilizar primero la conexión más reciente (la más "caliente")
+        self._idle = []
+        self._created = 0
+        # Un solo Condition protege las ociosas y el contador de abiertas:
+        # quien espera se despierta tanto si se devuelve una conexión como si
+        # se descarta una rota y queda hueco para abrir otra
+        self._cond = threading.Condition()
+
+    def _new_connection(self):
+        """Abre una conexión nueva (handshake TCP+TLS+auth completo)"""
+        return mysql.connector.connect(**self.config)
+
+    def _free_slot(self):
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def _open(self):
+        """Abre una conexión en un hueco ya reservado (lo libera si falla)"""
+        try:
+            return self._new_connection()
+        except Error:
+            self._free_slot()
+            raise
+
+    def _take(self):
+        """
+        Espera a una conexión ociosa o a un hueco para abrir una nueva
+
+        Returns:
+            tuple: (conn, last_used) o (None, None) si hay que abrir una nueva
+                (el hueco ya está reservado)
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(f"Pool de conexiones agotado ({self.size} en uso)")
+                self._cond.wait(remaining)
+
+    def acquire(self):
+        """
+        Presta una conexión del pool
+
+        Returns:
+            MySQLConnection: Conexión lista para usar
+
+        Raises:
+            PoolError: Si el pool está agotado durante más de `timeout` segundos
+            Error: Si no se puede abrir una conexión nueva
+        """
+        conn, last_used = self._take()
+        if conn is None:
+            return self._open()
+
+        # Ping solo si la conexión lleva tiempo ociosa: en ráfagas de llamadas
+        # la conexión se reutiliza sin coste extra de ida y vuelta
+        if time.monotonic() - last_used >= self.ping_interval:
+            try:
+                conn.ping(reconnect=True, attempts=1, delay=0)
+            except Error:
+                # El hueco de la conexión caída pasa a la nueva
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                return self._open()
+        return conn
+
+    def release(self, conn, discard=False):
+        """
+        Devuelve una conexión al pool
+
+        Args:
+            conn: Conexión prestada por acquire()
+            discard (bool): Cerrar la conexión en lugar de reutilizarla
+        """
+        if discard:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._free_slot()
+
+    @contextmanager
+    def connection(self):
+        """Context manager que presta una conexión y la devuelve al terminar"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (InterfaceError, OperationalError):
+            # Error a nivel de conexión: no devolverla al pool
+            broken = True
+            raise
+        finally:
+            self.release(conn, discard=broken)
+
+    def close_all(self):
+        """Cierra todas las conexiones ociosas del pool"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+        return len(idle)
+
+    def stats(self):
+        """Devuelve el estado del pool (abiertas, ociosas, tamaño máximo)"""
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'idle': len(self._idle)
+            }
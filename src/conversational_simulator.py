@@ -5,18 +5,33 @@ Simulador conversacional que pide datos paso a paso
 
 import os
 import re
+import uuid
 import requests
 import json
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from webhook_client import (RETRYABLE_STATUS, build_payload, get_webhook_client, idempotency_headers,
+                            parse_fulfillment_text, request_not_delivered)
+from webhook_outbox import queue_reservation, reservation_key
+from availability import simulator_availability, slot_alternatives
 
 # Cargar variables de entorno
 load_dotenv()
 
 class ConversationalSimulator:
-    def __init__(self):
-        """Simulador conversacional paso a paso"""
+    def __init__(self, availability=None):
+        """
+        Simulador conversacional paso a paso
+        
+        Args:
+            availability (AvailabilityService): Si se indica, se comprueba la
+                capacidad al pedir la hora y se ofrecen alternativas en el mismo turno
+        """
         self.webhook_url = os.getenv('WEBHOOK_URL', 'https://cronosai-webhook.vercel.app/api/webhook')
+        self.webhook_client = get_webhook_client(self.webhook_url)
+        self.availability = availability
+        # Identifica la conversación en el webhook y en la clave de idempotencia
+        self.session_id = f"conversational-{uuid.uuid4().hex}"
         
         # Estados de la conversación
         self.conversation_state = {
@@ -114,6 +129,9 @@ class ConversationalSimulator:
         elif step == 'ask_time':
             time = self.extract_time(text)
             if time:
+                unavailable = self.check_time_availability(time)
+                if unavailable:
+                    return unavailable
                 self.conversation_state['reservation_data']['HoraReserva'] = time
                 self.conversation_state['step'] = 'ask_name'
                 return f"Excelente, a las {time}. ¿Cuál es su nombre para la reserva?"
@@ -240,6 +258,24 @@ class ConversationalSimulator:
         
         return None
     
+    def check_time_availability(self, time):
+        """
+        Comprueba si hay sitio a esa hora
+        
+        Returns:
+            str: Mensaje con horas alternativas si está completo, None si hay sitio
+        """
+        data = self.conversation_state['reservation_data']
+        alternativas = slot_alternatives(self.availability, data['FechaReserva'], time, data['NumeroReserva'])
+        if alternativas is None:
+            return None
+        
+        if not alternativas:
+            # La siguiente respuesta es la nueva fecha
+            self.conversation_state['step'] = 'ask_date'
+            return f"Lo siento, a las {time} no nos queda sitio y no hay otras horas libres ese día. ¿Para qué otra fecha le gustaría la reserva?"
+        return f"Lo siento, a las {time} no nos queda sitio para {data['NumeroReserva']} personas. Tengo disponible a las {', '.join(alternativas)}. ¿Cuál prefiere?"
+    
     def extract_name(self, text):
         """Extrae el nombre del texto"""
         # Limpiar y capitalizar
@@ -277,58 +313,55 @@ class ConversationalSimulator:
         """Procesa la reserva final"""
         try:
             data = self.conversation_state['reservation_data']
+            slot = f"{data['FechaReserva']} {data['HoraReserva']}"
             
             # Preparar datos para el webhook
-            webhook_data = {
-                "sessionInfo": {
-                    "session": "conversational-session",
-                    "parameters": {
-                        "nomreserva": data['NomReserva'],
-                        "telefonreserva": data['TelefonReserva'],
-                        "fechareserva": {
-                            "year": int(data['FechaReserva'].split('-')[0]),
-                            "month": int(data['FechaReserva'].split('-')[1]),
-                            "day": int(data['FechaReserva'].split('-')[2])
-                        },
-                        "horareserva": {
-                            "hours": int(data['HoraReserva'].split(':')[0]),
-                            "minutes": int(data['HoraReserva'].split(':')[1]),
-                            "seconds": 0
-                        },
-                        "numeroreserva": data['NumeroReserva'],
-                        "observacions": f"Reserva creada por simulador conversacional"
-                    }
+            webhook_data = build_payload(self.session_id, {
+                "nomreserva": data['NomReserva'],
+                "telefonreserva": data['TelefonReserva'],
+                "fechareserva": {
+                    "year": int(data['FechaReserva'].split('-')[0]),
+                    "month": int(data['FechaReserva'].split('-')[1]),
+                    "day": int(data['FechaReserva'].split('-')[2])
+                },
+                "horareserva": {
+                    "hours": int(data['HoraReserva'].split(':')[0]),
+                    "minutes": int(data['HoraReserva'].split(':')[1]),
+                    "seconds": 0
                 },
-                "languageCode": "es-ES"
-            }
+                "numeroreserva": data['NumeroReserva'],
+                "observacions": f"Reserva creada por simulador conversacional"
+            })
             
             print(f"\n🌐 Enviando reserva al webhook...")
             
-            response = requests.post(
-                self.webhook_url,
-                json=webhook_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
+            # Si el cliente repite la reserva tras un error, el webhook no la duplica
+            response = self.webhook_client.post(webhook_data, headers=idempotency_headers(reservation_key(webhook_data, slot)))
             
             if response.status_code == 200:
                 webhook_response = response.json()
                 print(f"✅ ¡Reserva procesada exitosamente!")
                 
                 # Extraer respuesta del webhook
-                if 'fulfillment_response' in webhook_response:
-                    messages = webhook_response['fulfillment_response'].get('messages', [])
-                    if messages and 'text' in messages[0]:
-                        confirmation_text = messages[0]['text']['text']
-                        self.say(confirmation_text)
-                    else:
-                        self.say("¡Reserva confirmada! Recibirá una confirmación por teléfono.")
+                confirmation_text = parse_fulfillment_text(webhook_response)
+                if confirmation_text is not None:
+                    self.say(confirmation_text)
                 else:
                     self.say("¡Reserva confirmada! Recibirá una confirmación por teléfono.")
             else:
                 print(f"❌ Error procesando reserva: {response.status_code}")
-                self.say("Hubo un problema procesando su reserva. Por favor, intente de nuevo.")
+                if response.status_code in RETRYABLE_STATUS and queue_reservation(webhook_data, slot, self.webhook_client):
+                    self.say("No he podido confirmar la reserva ahora mismo. La registraremos en cuanto el sistema responda y recibirá la confirmación por teléfono.")
+                else:
+                    self.say("Hubo un problema procesando su reserva. Por favor, intente de nuevo.")
                 
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Error de conexión con el webhook: {e}")
+            # Tras un timeout de lectura la reserva puede estar guardada: no reenviarla
+            if request_not_delivered(e) and queue_reservation(webhook_data, slot, self.webhook_client):
+                self.say("No he podido confirmar la reserva ahora mismo. La registraremos en cuanto el sistema responda y recibirá la confirmación por teléfono.")
+            else:
+                self.say("Hubo un error procesando su reserva. Por favor, intente de nuevo.")
         except Exception as e:
             print(f"❌ Error: {e}")
             self.say("Hubo un error procesando su reserva. Por favor, intente de nuevo.")
@@ -338,8 +371,8 @@ def main():
     print("Iniciando Simulador Conversacional de Reservas")
     print("=" * 50)
     
-    # Crear y ejecutar simulador
-    simulator = ConversationalSimulator()
+    # Crear y ejecutar simulador (comprueba la capacidad solo con SIMULATOR_DB_BACKEND)
+    simulator = ConversationalSimulator(simulator_availability())
     simulator.start_conversation()
 
 if __name__ == "__main__":
@@ -1,13 +1,200 @@
 # src/database_handler.py
 import os
+import time
+import zlib
+import random
+import hashlib
+import threading
 import mysql.connector
-from mysql.connector import Error
-from datetime import datetime
+from mysql.connector import Error, errorcode
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError
+from datetime import datetime, timedelta
+from contextlib import contextmanager
 import json
+from connection_pool import ConnectionPool
+from sqlite_backend import SQLiteConnectionPool
+from reservation_cache import ReservationCache, normalize_phone
+from query_metrics import QueryMetrics
+from restaurant_config import get_restaurant_config
+from availability import BIN_MINUTES, affected_slots, parse_slot, slot_of
+from structured_logging import get_logger
+
+logger = get_logger('database')
+
+# Columnas de RESERVA para listados: se omite conversa_completa, que puede
+# ser muy grande y solo hace falta al consultar una reserva concreta. Los
+# métodos get_* devuelven todas las columnas salvo que se pida columns=
+RESERVA_COLUMNS = (
+    'id_reserva',
+    'data_reserva',
+    'num_persones',
+    'telefon',
+    'nom_persona_reserva',
+    'observacions'
+)
+
+CLIENT_UPSERT_SQL = """
+INSERT INTO CLIENT (nom_persona_reserva, TELEFON, DATA_ULTIMA_RESERVA) 
+VALUES (%s, %s, NOW()) 
+ON DUPLICATE KEY UPDATE 
+    nom_persona_reserva = VALUES(nom_persona_reserva), 
+    DATA_ULTIMA_RESERVA = NOW()
+"""
+
+# La conversación completa ya no se guarda en RESERVA sino comprimida en
+# RESERVA_CONVERSA (ver database/create-reserva-conversa-table.sql).
+# Si ya existe una reserva con la misma idempotency_key (índice único) la
+# fila no cambia y LAST_INSERT_ID() (y lastrowid) pasa a ser 0: así se
+# distingue un reintento de una reserva nueva dentro de la propia sentencia,
+# sin depender de rowcount (con FOUND_ROWS, el valor por defecto del
+# conector, vale 1 en los dos casos)
+RESERVA_INSERT_SQL = """
+INSERT INTO RESERVA 
+(data_reserva, num_persones, telefon, nom_persona_reserva, observacions, idempotency_key) 
+VALUES (%s, %s, %s, %s, %s, %s) 
+ON DUPLICATE KEY UPDATE id_reserva = id_reserva + LAST_INSERT_ID(0)
+"""
+
+RESERVA_ID_BY_KEY_SQL = "SELECT id_reserva FROM RESERVA WHERE idempotency_key = %s"
+
+TRANSCRIPT_UPSERT_SQL = """
+INSERT INTO RESERVA_CONVERSA (id_reserva, conversa) 
+VALUES (%s, %s) 
+ON DUPLICATE KEY UPDATE conversa = VALUES(conversa)
+"""
+
+# Sin RESERVA_CONVERSA la conversación se guarda como antes, sin comprimir
+LEGACY_TRANSCRIPT_SQL = "UPDATE RESERVA SET conversa_completa = %s WHERE id_reserva = %s"
+
+# Tablas de migraciones posteriores al esquema original y su script. Si
+# faltan, las escrituras vuelven al formato anterior (ver missing_tables)
+MIGRATED_TABLES = {
+    'OCUPACION_TRAMO': 'database/create-ocupacion-tramo-table.sql',
+    'RESERVA_CONVERSA': 'database/create-reserva-conversa-table.sql'
+}
+
+def make_idempotency_key(session, telefon, data_reserva):
+    """
+    Clave de idempotencia de una reserva: sesión + teléfono + franja
+    
+    Dos intentos de la misma conversación para el mismo teléfono y la misma
+    fecha/hora producen la misma clave, así que un reintento (o un
+    respaldo local tras un timeout del webhook) no duplica la reserva. La
+    franja se normaliza a 'YYYY-MM-DD HH:MM': '2030-01-01 20:00' y
+    '2030-01-01 20:00:00' dan la misma clave.
+    
+    Returns:
+        str: SHA-256 en hexadecimal (64 caracteres)
+    """
+    try:
+        data_reserva = parse_slot(data_reserva).strftime('%Y-%m-%d %H:%M')
+    except ValueError:
+        pass
+    raw = f"{session}|{normalize_phone(telefon)}|{data_reserva}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def compress_transcript(text):
+    """Comprime una conversación (UTF-8 + zlib) para RESERVA_CONVERSA"""
+    return zlib.compress(text.encode('utf-8'), 6)
+
+def decompress_transcript(blob):
+    """Inversa de compress_transcript"""
+    return zlib.decompress(bytes(blob)).decode('utf-8')
+
+# Columnas de RESERVA que se pueden modificar con update_reserva / update_reservas_bulk.
+# Los nombres de columna se interpolan en el SQL, así que nunca se aceptan
+# nombres que no estén en esta lista
+UPDATABLE_COLUMNS = frozenset((
+    'data_reserva',
+    'num_persones',
+    'telefon',
+    'nom_persona_reserva',
+    'observacions'
+))
+
+# Errores de contención entre transacciones que se resuelven reintentando
+RETRYABLE_ERRNOS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+def is_transient_error(e):
+    """
+    Error de conexión, de pool o de contención: la fila no tiene nada mal
+    y la misma escritura puede salir bien más tarde
+    """
+    return (isinstance(e, (InterfaceError, OperationalError, PoolError))
+            or getattr(e, 'errno', None) in RETRYABLE_ERRNOS)
+
+def _projection(columns):
+    """Lista de columnas para un SELECT ('*' si no se pide ninguna)"""
+    if not columns:
+        return '*'
+    # Se interpolan en el SQL: solo identificadores simples
+    invalid = [column for column in columns if not str(column).isidentifier()]
+    if invalid:
+        raise ValueError(f"Columnas no válidas: {invalid}")
+    return ', '.join(columns)
+
+def _slot_ranges(slots):
+    """Agrupa pares (fecha, tramo) consecutivos en rangos [(fecha, primero, último), ...]"""
+    ranges = []
+    for day, tramo in slots:
+        if ranges and ranges[-1][0] == day and ranges[-1][2] == tramo - 1:
+            ranges[-1][2] = tramo
+        else:
+            ranges.append([day, tramo, tramo])
+    return [tuple(r) for r in ranges]
+
+# Suma (o resta) personas a los tramos de OCUPACION_TRAMO, creando las filas
+# que falten (ver database/create-ocupacion-tramo-table.sql)
+OCCUPANCY_UPSERT_SQL = """
+INSERT INTO OCUPACION_TRAMO (fecha, tramo, comensales) 
+VALUES {values} 
+ON DUPLICATE KEY UPDATE comensales = GREATEST(comensales + VALUES(comensales), 0)
+"""
+
+# Columnas de RESERVA que cambian la ocupación de los tramos
+OCCUPANCY_COLUMNS = frozenset(('data_reserva', 'num_persones', 'observacions'))
+
+def counted_covers(num_persones, observacions):
+    """Personas que cuentan para la capacidad (las canceladas no cuentan)"""
+    if 'CANCELADA' in (observacions or ''):
+        return 0
+    return int(num_persones or 0)
+
+def merge_occupancy(*deltas):
+    """
+    Junta varias listas de (fecha, tramo, personas) en una sola
+
+    Se suman las personas de un mismo tramo, se descartan los tramos que
+    quedan a cero y el resultado sale ordenado por (fecha, tramo), para que
+    todas las transacciones bloqueen las filas en el mismo orden.
+    """
+    totals = {}
+    for delta in deltas:
+        for day, tramo, covers in delta:
+            totals[(day, tramo)] = totals.get((day, tramo), 0) + covers
+    return [(day, tramo, covers) for (day, tramo), covers in sorted(totals.items()) if covers]
 
 class DatabaseHandler:
-    def __init__(self):
-        """Inicializa la conexión a tu base de datos MySQL existente"""
+    def __init__(self, pool_size=None, replica_config=None, read_your_writes=None, backend=None, sqlite_path=None):
+        """
+        Inicializa el acceso a tu base de datos MySQL existente
+
+        Args:
+            pool_size (int): Tamaño máximo del pool de conexiones
+                (por defecto DB_POOL_SIZE o 5)
+            replica_config (dict): Parámetros de conexión de una réplica de
+                lectura (los que falten se toman del primario). Por defecto
+                se usa DB_REPLICA_HOST si está definida; sin réplica todo
+                va al primario
+            read_your_writes (float): Segundos que un hilo sigue leyendo del
+                primario después de escribir, para no leer de la réplica
+                datos anteriores a su propia escritura
+                (DB_READ_YOUR_WRITES, por defecto 5; 0 = desactivado)
+            backend (str): 'mysql' o 'sqlite' (por defecto DB_BACKEND o
+                'mysql'); con SQLite se usa el fichero DB_SQLITE_PATH con el
+                mismo esquema
+            sqlite_path (str): Fichero SQLite (por defecto DB_SQLITE_PATH)
+        """
         self.config = {
             'host': os.getenv('DB_HOST', 'db1.bwai.cc'),
             'port': int(os.getenv('DB_PORT', 3306)),
@@ -17,24 +204,234 @@ class DatabaseHandler:
             'charset': 'utf8mb4',
             'autocommit': True
         }
-        self.connection = None
+        # Backend: MySQL (por defecto) o SQLite para pruebas y benchmarks
+        # sin la base de datos de producción (DB_BACKEND=sqlite)
+        self.backend = (backend or os.getenv('DB_BACKEND', 'mysql')).lower()
+        if self.backend == 'sqlite':
+            self.pool = SQLiteConnectionPool(sqlite_path)
+            # Con SQLite no hay réplica
+            replica_config = {}
+        else:
+            # Las conexiones se abren de forma perezosa al primer uso
+            self.pool = ConnectionPool(self.config, size=pool_size)
+        
+        # Réplica de lectura opcional para consultas y listados
+        if replica_config is None and os.getenv('DB_REPLICA_HOST'):
+            replica_config = {
+                'host': os.getenv('DB_REPLICA_HOST'),
+                'port': int(os.getenv('DB_REPLICA_PORT', self.config['port'])),
+                'user': os.getenv('DB_REPLICA_USER', self.config['user']),
+                'password': os.getenv('DB_REPLICA_PASS', self.config['password'])
+            }
+        self.replica_config = dict(self.config, **replica_config) if replica_config else None
+        self.replica_pool = ConnectionPool(self.replica_config, size=pool_size) if self.replica_config else None
+        self.read_your_writes = float(
+            read_your_writes if read_your_writes is not None else os.getenv('DB_READ_YOUR_WRITES', 5)
+        )
+        # Momento de la última escritura de cada hilo (una llamada = un hilo)
+        self._session = threading.local()
+        
+        # Caché de get_reservas_by_telefon, invalidada en cada escritura
+        self.reservas_cache = ReservationCache()
+        # Tiempos por operación y log de consultas lentas
+        self.metrics = QueryMetrics()
+        # Contadores de reserve_if_available (conflictos entre llamadas simultáneas)
+        self.slot_max_retries = int(os.getenv('SLOT_MAX_RETRIES', 5))
+        self._slot_counters = {'attempts': 0, 'reserved': 0, 'rejected': 0, 'conflicts': 0, 'retries': 0, 'errors': 0}
+        self._slot_lock = threading.Lock()
+        # Tablas de MIGRATED_TABLES que faltan (se comprueba al primer uso)
+        self._missing_tables = None
+    
+    def pin_to_primary(self, seconds=None):
+        """
+        Hace que el hilo actual lea del primario durante `seconds` segundos
+        
+        Las escrituras de DatabaseHandler ya lo hacen solas; sirve cuando
+        la escritura la hizo otro proceso (por ejemplo el webhook en JS).
+        
+        Args:
+            seconds (float): Duración (por defecto read_your_writes)
+        """
+        seconds = self.read_your_writes if seconds is None else float(seconds)
+        self._session.pinned_until = time.monotonic() + seconds
+    
+    def _read_pool(self):
+        """Pool para una lectura: la réplica, salvo que el hilo acabe de escribir"""
+        if self.replica_pool is None:
+            return self.pool
+        if time.monotonic() < getattr(self._session, 'pinned_until', 0):
+            return self.pool
+        return self.replica_pool
+    
+    def _acquire_read(self):
+        """
+        Presta una conexión para leer
+        
+        Si la réplica no responde se lee del primario.
+        
+        Returns:
+            tuple: (pool, conexión); la conexión se devuelve a ese pool
+        """
+        pool = self._read_pool()
+        try:
+            return pool, pool.acquire()
+        except Error as e:
+            if pool is self.pool:
+                raise
+            logger.warning("⚠️ Réplica de lectura no disponible (%s), leyendo del primario", e)
+            return self.pool, self.pool.acquire()
+    
+    @contextmanager
+    def _read_connection(self):
+        """Como ConnectionPool.connection, pero en la réplica si la hay"""
+        pool, conn = self._acquire_read()
+        broken = False
+        try:
+            yield conn
+        except (InterfaceError, OperationalError):
+            # Error a nivel de conexión: no devolverla al pool
+            broken = True
+            raise
+        finally:
+            pool.release(conn, discard=broken)
+    
+    @contextmanager
+    def _write_connection(self):
+        """Conexión al primario; fija el hilo al primario al terminar (read-your-writes)"""
+        try:
+            with self.pool.connection() as conn:
+                yield conn
+        finally:
+            if self.read_your_writes > 0:
+                self.pin_to_primary()
+    
+    @property
+    def backend_name(self):
+        """Nombre del backend activo para los mensajes ('MySQL' o 'SQLite')"""
+        return 'SQLite' if self.backend == 'sqlite' else 'MySQL'
     
     def connect(self):
-        """Establece conexión con la base de datos"""
+        """
+        Comprueba que se puede obtener una conexión del pool
+
+        Ya no es necesario llamarlo antes de cada operación: cada método
+        toma prestada una conexión del pool y la devuelve al terminar.
+        """
         try:
-            self.connection = mysql.connector.connect(**self.config)
-            if self.connection.is_connected():
-                print("✅ Conectado a MySQL - CronosAI Database")
-                return True
+            with self.pool.connection() as conn:
+                if conn.is_connected():
+                    if self.backend == 'sqlite':
+                        logger.info("✅ Conectado a SQLite - %s", self.pool.path)
+                    else:
+                        logger.info("✅ Conectado a MySQL - CronosAI Database")
+                    return True
+            return False
         except Error as e:
-            print(f"❌ Error conectando a MySQL: {e}")
+            logger.error("❌ Error conectando a %s: %s", self.backend_name, e)
             return False
     
     def disconnect(self):
-        """Cierra la conexión"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("🔌 Conexión a MySQL cerrada")
+        """Cierra las conexiones ociosas del pool (y de la réplica)"""
+        closed = self.pool.close_all()
+        if self.replica_pool is not None:
+            closed += self.replica_pool.close_all()
+        if closed:
+            logger.info("🔌 Conexiones a %s cerradas", self.backend_name)
+    
+    def missing_tables(self, refresh=False):
+        """
+        Tablas de MIGRATED_TABLES que no existen en la base de datos
+
+        Se comprueba una sola vez con SHOW TABLES y se avisa de cada tabla
+        que falta. Sin OCUPACION_TRAMO las reservas no mantienen los
+        contadores de ocupación (y reserve_if_available no se usa); sin
+        RESERVA_CONVERSA la conversación se guarda sin comprimir en
+        RESERVA.conversa_completa, como antes de las migraciones.
+
+        Args:
+            refresh (bool): Volver a comprobarlo (tras aplicar una migración)
+
+        Returns:
+            frozenset: Nombres de las tablas que faltan; vacío si no se pudo
+                comprobar (entonces cada escritura devuelve su propio error)
+        """
+        if self._missing_tables is not None and not refresh:
+            return self._missing_tables
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with self.metrics.timed('missing_tables', "SHOW TABLES"):
+                        cursor.execute("SHOW TABLES")
+                        tables = {str(row[0]).upper() for row in cursor.fetchall()}
+                finally:
+                    cursor.close()
+        except Error as e:
+            logger.error("❌ Error comprobando las tablas: %s", e)
+            return frozenset()
+        
+        missing = frozenset(table for table in MIGRATED_TABLES if table not in tables)
+        for table in sorted(missing):
+            logger.warning("⚠️ Falta la tabla %s (ejecuta %s); se usa la escritura anterior", table, MIGRATED_TABLES[table])
+        self._missing_tables = missing
+        return missing
+    
+    def _transcript_write(self, reserva_id, conversa_completa):
+        """
+        Sentencia y parámetros para guardar una conversación: comprimida en
+        RESERVA_CONVERSA o, si esa tabla no existe, en RESERVA.conversa_completa
+        """
+        if 'RESERVA_CONVERSA' in self.missing_tables():
+            return LEGACY_TRANSCRIPT_SQL, (conversa_completa, reserva_id)
+        return TRANSCRIPT_UPSERT_SQL, (reserva_id, compress_transcript(conversa_completa))
+    
+    def _occupancy_delta(self, data_reserva, num_persones, observacions=None, sign=1, config=None):
+        """
+        Tramos de OCUPACION_TRAMO que cambian al añadir (sign=1) o quitar
+        (sign=-1) una reserva
+
+        get_restaurant_config guarda la configuración en caché
+        (CACHE_DURATION); las escrituras por lotes la leen una vez y la
+        pasan en `config`.
+
+        Returns:
+            list: [(fecha, tramo, personas), ...]; vacía si la reserva no
+                cuenta, su fecha no se puede interpretar (la reconstrucción
+                con rebuild_occupancy corrige esos casos) o no existe
+                OCUPACION_TRAMO
+        """
+        covers = counted_covers(num_persones, observacions)
+        if not covers or 'OCUPACION_TRAMO' in self.missing_tables():
+            return []
+        config = config or get_restaurant_config(self)
+        try:
+            slots = affected_slots(data_reserva, config['duracion_reserva_minutos'], config['ventana_solapamiento'])
+        except ValueError:
+            return []
+        return [(day, tramo, sign * covers) for day, tramo in slots]
+    
+    def _slot_release_delta(self, slot, party_size, config=None):
+        """
+        Tramos y personas que devuelve release_slot (lo que sumó
+        reserve_if_available), en el formato de _occupancy_delta
+        """
+        if 'OCUPACION_TRAMO' in self.missing_tables():
+            return []
+        config = config or get_restaurant_config(self)
+        try:
+            slots = affected_slots(slot, config['duracion_reserva_minutos'], config['ventana_solapamiento'])
+        except ValueError:
+            return []
+        return [(day, tramo, -int(party_size)) for day, tramo in slots]
+    
+    def _apply_occupancy(self, cursor, delta, operation):
+        """Aplica un delta de merge_occupancy dentro de la transacción en curso"""
+        if not delta:
+            return
+        query = OCCUPANCY_UPSERT_SQL.format(values=', '.join(['(%s, %s, %s)'] * len(delta)))
+        params = [value for row in delta for value in row]
+        with self.metrics.timed(f'{operation}.ocupacion', query, params):
+            cursor.execute(query, params)
     
     def insert_client(self, nom_persona_reserva, telefon):
         """
@@ -48,176 +445,983 @@ class DatabaseHandler:
             bool: True si exitoso, False si error
         """
         try:
-            cursor = self.connection.cursor()
-            
-            # Insertar o actualizar cliente
-            query = """
-            INSERT INTO CLIENT (nom_persona_reserva, TELEFON, DATA_ULTIMA_RESERVA) 
-            VALUES (%s, %s, NOW()) 
-            ON DUPLICATE KEY UPDATE 
-                nom_persona_reserva = VALUES(nom_persona_reserva), 
-                DATA_ULTIMA_RESERVA = NOW()
-            """
-            
-            cursor.execute(query, (nom_persona_reserva, telefon))
-            print(f"✅ Cliente insertado/actualizado: {nom_persona_reserva}")
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    # Insertar o actualizar cliente
+                    params = (nom_persona_reserva, telefon)
+                    with self.metrics.timed('insert_client', CLIENT_UPSERT_SQL, params):
+                        cursor.execute(CLIENT_UPSERT_SQL, params)
+                finally:
+                    cursor.close()
+            
+            logger.debug("✅ Cliente insertado/actualizado: %s", nom_persona_reserva)
             return True
             
         except Error as e:
-            print(f"❌ Error insertando cliente: {e}")
+            logger.error("❌ Error insertando cliente: %s", e)
             return False
-        finally:
-            if cursor:
-                cursor.close()
     
-    def insert_reserva(self, data_reserva, num_persones, telefon, nom_persona_reserva, observacions=None, conversa_completa=None):
+    def insert_reserva(self, data_reserva, num_persones, telefon, nom_persona_reserva, observacions=None, conversa_completa=None, idempotency_key=None, slot_reserved=False):
         """
         Inserta nueva reserva en tabla RESERVA
         
+        Con `idempotency_key`, repetir la inserción devuelve el ID de la
+        reserva ya existente en lugar de crear otra. La ocupación de los
+        tramos (OCUPACION_TRAMO) se actualiza en la misma transacción.
+        
         Args:
             data_reserva (str): Fecha y hora de la reserva
             num_persones (int): Número de personas
             telefon (str): Teléfono del cliente
             nom_persona_reserva (str): Nombre de la persona que hace la reserva
             observacions (str): Observaciones opcionales
-            conversa_completa (str): Conversación completa
+            conversa_completa (str): Conversación completa (se guarda
+                comprimida en RESERVA_CONVERSA)
+            idempotency_key (str): Clave de make_idempotency_key (opcional)
+            slot_reserved (bool): El sitio ya se tomó con reserve_if_available
+                (no volver a sumarlo a la ocupación); si la reserva ya
+                existía, ese sitio se devuelve en la misma transacción
             
         Returns:
-            int: ID de la reserva insertada, None si error
+            int: ID de la reserva insertada (o de la existente), None si error
         """
+        # Antes de tomar la conexión: la comprobación usa otra del pool
+        self.missing_tables()
+        if slot_reserved:
+            delta, release = [], self._slot_release_delta(data_reserva, num_persones)
+        else:
+            delta, release = self._occupancy_delta(data_reserva, num_persones, observacions), []
         try:
-            cursor = self.connection.cursor()
-            
-            # Query corregida con los nombres reales de las columnas
-            query = """
-            INSERT INTO RESERVA 
-            (data_reserva, num_persones, telefon, nom_persona_reserva, observacions, conversa_completa) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            
-            cursor.execute(query, (
-                data_reserva, 
-                num_persones, 
-                telefon, 
-                nom_persona_reserva, 
-                observacions, 
-                conversa_completa
-            ))
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    conn.start_transaction()
+                    
+                    params = (
+                        data_reserva, 
+                        num_persones, 
+                        telefon, 
+                        nom_persona_reserva, 
+                        observacions,
+                        idempotency_key
+                    )
+                    with self.metrics.timed('insert_reserva', RESERVA_INSERT_SQL, params):
+                        cursor.execute(RESERVA_INSERT_SQL, params)
+                    
+                    reserva_id = cursor.lastrowid
+                    duplicate = not reserva_id
+                    
+                    if duplicate:
+                        with self.metrics.timed('insert_reserva.existing', RESERVA_ID_BY_KEY_SQL, (idempotency_key,)):
+                            cursor.execute(RESERVA_ID_BY_KEY_SQL, (idempotency_key,))
+                            row = cursor.fetchone()
+                        reserva_id = row[0] if row else None
+                    
+                    if not duplicate:
+                        if conversa_completa:
+                            query, params = self._transcript_write(reserva_id, conversa_completa)
+                            with self.metrics.timed('save_transcript', query, params):
+                                cursor.execute(query, params)
+                        self._apply_occupancy(cursor, delta, 'insert_reserva')
+                    else:
+                        # Reintento que volvió a tomar sitio para una reserva
+                        # ya registrada: devolverlo
+                        self._apply_occupancy(cursor, release, 'insert_reserva.release')
+                    conn.commit()
+                except Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+            
+            if duplicate:
+                logger.info("♻️ Reserva ya registrada con ID: %s (reintento)", reserva_id)
+                return reserva_id
             
-            reserva_id = cursor.lastrowid
-            print(f"✅ Reserva insertada con ID: {reserva_id}")
+            self.reservas_cache.invalidate(telefon)
+            logger.info("✅ Reserva insertada con ID: %s", reserva_id)
             return reserva_id
             
         except Error as e:
-            print(f"❌ Error insertando reserva: {e}")
+            logger.error("❌ Error insertando reserva: %s", e)
             return None
-        finally:
-            if cursor:
-                cursor.close()
     
-    def get_reserva_by_id(self, reserva_id):
+    def book_reservation(self, data_reserva, num_persones, telefon, nom_persona_reserva, observacions=None, conversa_completa=None, idempotency_key=None, slot_reserved=False, return_created=False):
+        """
+        Registra una reserva completa (cliente + reserva) en una sola transacción
+        
+        El upsert en CLIENT, el INSERT en RESERVA, la conversación comprimida
+        y la ocupación de los tramos se envían juntos como un único lote
+        multi-sentencia, así que la reserva cuesta una sola ida y vuelta a
+        MySQL y nunca queda un cliente actualizado sin su reserva.
+        
+        Args:
+            data_reserva (str): Fecha y hora de la reserva
+            num_persones (int): Número de personas
+            telefon (str): Teléfono del cliente
+            nom_persona_reserva (str): Nombre de la persona que hace la reserva
+            observacions (str): Observaciones opcionales
+            conversa_completa (str): Conversación completa
+            idempotency_key (str): Clave de make_idempotency_key (opcional);
+                si la reserva ya existe se devuelve su ID
+            slot_reserved (bool): El sitio ya se tomó con reserve_if_available
+                (no volver a sumarlo a la ocupación); si la reserva ya
+                existía, ese sitio se devuelve en la misma transacción
+            return_created (bool): Devolver también si la reserva es nueva
+                (False en un reintento con una clave ya registrada)
+            
+        Returns:
+            int: ID de la reserva insertada (o de la existente), None si error.
+                Con return_created, tupla (ID, nueva) o (None, False) si error
+        """
+        if slot_reserved:
+            # Se resta solo si la reserva ya existía: (1 - @nueva) = 1
+            delta, factor = self._slot_release_delta(data_reserva, num_persones), '(1 - @nueva)'
+        else:
+            # En un reintento las personas se multiplican por @nueva = 0
+            delta, factor = self._occupancy_delta(data_reserva, num_persones, observacions), '@nueva'
+        statements = [
+            "START TRANSACTION",
+            CLIENT_UPSERT_SQL,
+            RESERVA_INSERT_SQL,
+            # @nueva = 0 si la reserva ya existía (reintento con la misma
+            # clave): entonces @id_reserva es el de la existente
+            "SET @nueva = LAST_INSERT_ID() > 0",
+            "SET @id_reserva = CASE WHEN @nueva = 1 THEN LAST_INSERT_ID() "
+            f"ELSE ({RESERVA_ID_BY_KEY_SQL}) END"
+        ]
+        params = [
+            nom_persona_reserva,
+            telefon,
+            data_reserva,
+            num_persones,
+            telefon,
+            nom_persona_reserva,
+            observacions,
+            idempotency_key,
+            idempotency_key
+        ]
+        if conversa_completa and 'RESERVA_CONVERSA' in self.missing_tables():
+            statements.append("UPDATE RESERVA SET conversa_completa = %s WHERE id_reserva = @id_reserva")
+            params.append(conversa_completa)
+        elif conversa_completa:
+            statements.append(
+                "INSERT INTO RESERVA_CONVERSA (id_reserva, conversa) VALUES (@id_reserva, %s) "
+                "ON DUPLICATE KEY UPDATE conversa = VALUES(conversa)"
+            )
+            params.append(compress_transcript(conversa_completa))
+        if delta:
+            statements.append(OCCUPANCY_UPSERT_SQL.format(
+                values=', '.join([f'(%s, %s, %s * {factor})'] * len(delta))
+            ))
+            params.extend(value for row in delta for value in row)
+        statements += ["SELECT @id_reserva, @nueva", "COMMIT"]
+        query = ';\n'.join(statement.strip() for statement in statements)
+        
+        try:
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    reserva_id, created = None, False
+                    # Consumir todos los resultados del lote: si una sentencia
+                    # falla, el error se lanza aquí y se deshace la transacción
+                    with self.metrics.timed('book_reservation', query, params):
+                        for result in cursor.execute(query, params, multi=True):
+                            if result.with_rows:
+                                row = result.fetchone()
+                                if row:
+                                    reserva_id, created = row[0], bool(row[1])
+                except Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+            
+            self.reservas_cache.invalidate(telefon)
+            if created:
+                logger.info("✅ Reserva %s registrada para %s (cliente + reserva en una transacción)", reserva_id, nom_persona_reserva)
+            else:
+                logger.info("♻️ Reserva ya registrada con ID: %s (reintento)", reserva_id)
+            return (reserva_id, created) if return_created else reserva_id
+            
+        except Error as e:
+            logger.error("❌ Error registrando reserva: %s", e)
+            return (None, False) if return_created else None
+    
+    def insert_reservas_bulk(self, reservas, chunk_size=None):
+        """
+        Inserta reservas en bloque (migraciones, exportaciones de AppSheet,
+        reintentos de llamadas al webhook fallidas)
+        
+        Las filas se procesan en bloques de `chunk_size`. Cada bloque es una
+        transacción con executemany: un upsert en CLIENT con un solo
+        registro por TELEFON (gana el último nombre del bloque) y el INSERT
+        en RESERVA. Las filas con conversación se insertan una a una dentro
+        del bloque para conocer su id_reserva, y sus conversaciones van en un
+        único executemany a RESERVA_CONVERSA. La ocupación de los tramos de
+        todo el bloque se suma con un único upsert. Si el bloque falla se deshace
+        y se reintenta fila a fila para aislar las filas erróneas sin abortar
+        el resto de la carga.
+        
+        Args:
+            reservas (iterable): Diccionarios con las mismas claves que
+                insert_reserva (data_reserva, num_persones, telefon,
+                nom_persona_reserva, observacions, conversa_completa,
+                idempotency_key, slot_reserved); las filas con una clave ya
+                registrada no se duplican
+            chunk_size (int): Filas por transacción (por defecto DB_BULK_CHUNK_SIZE o 500)
+            
+        Returns:
+            dict: {'inserted': int, 'failed': [(índice, error), ...],
+                'transient': [índice, ...]} donde 'transient' son las filas
+                de 'failed' que fallaron por la conexión o un bloqueo (ver
+                is_transient_error) y no por sus datos
+        """
+        chunk_size = int(chunk_size or os.getenv('DB_BULK_CHUNK_SIZE', 500))
+        report = {'inserted': 0, 'failed': [], 'transient': []}
+        # Una sola lectura de la configuración (y de las tablas) para toda la carga
+        config = get_restaurant_config(self)
+        self.missing_tables()
+        
+        chunk = []
+        for index, reserva in enumerate(reservas):
+            try:
+                row = (
+                    reserva['data_reserva'],
+                    reserva['num_persones'],
+                    reserva['telefon'],
+                    reserva['nom_persona_reserva'],
+                    reserva.get('observacions'),
+                    reserva.get('idempotency_key')
+                )
+            except (KeyError, TypeError) as e:
+                report['failed'].append((index, f"Fila incompleta: {e}"))
+                continue
+            
+            delta = [] if reserva.get('slot_reserved') else self._occupancy_delta(
+                row[0], row[1], row[4], config=config
+            )
+            chunk.append((index, row, reserva.get('conversa_completa'), delta))
+            if len(chunk) >= chunk_size:
+                self._insert_reservas_chunk(chunk, report)
+                chunk = []
+        
+        if chunk:
+            self._insert_reservas_chunk(chunk, report)
+        
+        logger.info("✅ Carga masiva: %s reservas insertadas, %s fallidas", report['inserted'], len(report['failed']))
+        return report
+    
+    def _insert_reservas_chunk(self, chunk, report):
+        """Inserta un bloque de filas en una transacción; si falla, fila a fila"""
+        # Un único upsert por teléfono dentro del bloque
+        clients = {}
+        for _, row, _, _ in chunk:
+            clients[row[2]] = row[3]
+        keys = list({row[5] for _, row, _, _ in chunk if row[5]})
+        
+        try:
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    conn.start_transaction()
+                    
+                    # Las filas con una clave ya registrada no se insertan y
+                    # no deben sumar ocupación
+                    existing = set()
+                    if keys:
+                        query = (f"SELECT idempotency_key FROM RESERVA "
+                                 f"WHERE idempotency_key IN ({', '.join(['%s'] * len(keys))})")
+                        with self.metrics.timed('insert_reservas_bulk.keys', query, keys):
+                            cursor.execute(query, keys)
+                            existing = {key for (key,) in cursor.fetchall()}
+                    
+                    with self.metrics.timed('insert_reservas_bulk.client', CLIENT_UPSERT_SQL):
+                        cursor.executemany(CLIENT_UPSERT_SQL, [(nom, tel) for tel, nom in clients.items()])
+                    
+                    plain_rows = [row for _, row, conversa, _ in chunk if not conversa]
+                    if plain_rows:
+                        with self.metrics.timed('insert_reservas_bulk.reserva', RESERVA_INSERT_SQL):
+                            cursor.executemany(RESERVA_INSERT_SQL, plain_rows)
+                    
+                    transcripts = []
+                    for _, row, conversa, _ in chunk:
+                        if conversa:
+                            with self.metrics.timed('insert_reserva', RESERVA_INSERT_SQL, row):
+                                cursor.execute(RESERVA_INSERT_SQL, row)
+                            # lastrowid = 0: la reserva ya existía con su conversación
+                            if cursor.lastrowid:
+                                transcripts.append(self._transcript_write(cursor.lastrowid, conversa))
+                    if transcripts:
+                        query = transcripts[0][0]
+                        with self.metrics.timed('insert_reservas_bulk.transcript', query):
+                            cursor.executemany(query, [params for _, params in transcripts])
+                    
+                    deltas = []
+                    for _, row, _, delta in chunk:
+                        if row[5] and row[5] in existing:
+                            continue
+                        if row[5]:
+                            # Una clave repetida dentro del bloque solo cuenta una vez
+                            existing.add(row[5])
+                        deltas.append(delta)
+                    self._apply_occupancy(cursor, merge_occupancy(*deltas), 'insert_reservas_bulk')
+                    
+                    with self.metrics.timed('insert_reservas_bulk.commit'):
+                        conn.commit()
+                    report['inserted'] += len(chunk)
+                    for telefon in clients:
+                        self.reservas_cache.invalidate(telefon)
+                    return
+                except Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+        except Error as e:
+            logger.warning("⚠️ Bloque de %s reservas fallido (%s), reintentando fila a fila", len(chunk), e)
+        
+        for index, row, conversa, delta in chunk:
+            try:
+                with self._write_connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        conn.start_transaction()
+                        with self.metrics.timed('insert_client', CLIENT_UPSERT_SQL, (row[3], row[2])):
+                            cursor.execute(CLIENT_UPSERT_SQL, (row[3], row[2]))
+                        with self.metrics.timed('insert_reserva', RESERVA_INSERT_SQL, row):
+                            cursor.execute(RESERVA_INSERT_SQL, row)
+                        if cursor.lastrowid:
+                            if conversa:
+                                query, params = self._transcript_write(cursor.lastrowid, conversa)
+                                with self.metrics.timed('save_transcript', query, params):
+                                    cursor.execute(query, params)
+                            self._apply_occupancy(cursor, delta, 'insert_reserva')
+                        conn.commit()
+                    except Error:
+                        conn.rollback()
+                        raise
+                    finally:
+                        cursor.close()
+                report['inserted'] += 1
+                self.reservas_cache.invalidate(row[2])
+            except Error as e:
+                report['failed'].append((index, str(e)))
+                if is_transient_error(e):
+                    report['transient'].append(index)
+    
+    def find_reserva_id(self, idempotency_key):
+        """
+        Busca la reserva registrada con una clave de idempotencia
+        
+        Se lee del primario: sirve para reconocer el reintento de una
+        reserva ya guardada cuando su propio sitio hace que el tramo se
+        rechace por capacidad.
+        
+        Args:
+            idempotency_key (str): Clave de make_idempotency_key
+            
+        Returns:
+            int: ID de la reserva, None si no existe o error
+        """
+        query = RESERVA_ID_BY_KEY_SQL
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with self.metrics.timed('find_reserva_id', query, (idempotency_key,)):
+                        cursor.execute(query, (idempotency_key,))
+                        row = cursor.fetchone()
+                finally:
+                    cursor.close()
+            return row[0] if row else None
+            
+        except Error as e:
+            logger.error("❌ Error buscando reserva por clave: %s", e)
+            return None
+    
+    def get_reserva_by_id(self, reserva_id, include_conversa=False, columns=None):
         """
         Obtiene una reserva por ID
         
         Args:
             reserva_id (int): ID de la reserva
+            include_conversa (bool): Cargar también la conversación completa
+                (consulta aparte a RESERVA_CONVERSA)
+            columns (tuple): Columnas a leer (p. ej. RESERVA_COLUMNS); por
+                defecto todas
             
         Returns:
             dict: Datos de la reserva o None si no existe
         """
         try:
-            cursor = self.connection.cursor(dictionary=True)
+            with self._read_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    query = f"SELECT {_projection(columns)} FROM RESERVA WHERE id_reserva = %s"
+                    with self.metrics.timed('get_reserva_by_id', query, (reserva_id,)):
+                        cursor.execute(query, (reserva_id,))
+                        reserva = cursor.fetchone()
+                finally:
+                    cursor.close()
             
-            query = "SELECT * FROM RESERVA WHERE id_reserva = %s"
-            cursor.execute(query, (reserva_id,))
+        except Error as e:
+            logger.error("❌ Error obteniendo reserva: %s", e)
+            return None
+        
+        if reserva and include_conversa:
+            reserva['conversa_completa'] = self.get_transcript(reserva_id)
+        return reserva
+    
+    def get_transcript(self, reserva_id):
+        """
+        Obtiene la conversación completa de una reserva
+        
+        Se lee de RESERVA_CONVERSA y, si la reserva aún no se ha migrado
+        (o la escribió otra ruta), de la columna antigua conversa_completa.
+        
+        Args:
+            reserva_id (int): ID de la reserva
             
-            result = cursor.fetchone()
-            return result
+        Returns:
+            str: Conversación o None si no hay
+        """
+        query = """
+        SELECT c.conversa, r.conversa_completa 
+        FROM RESERVA r 
+        LEFT JOIN RESERVA_CONVERSA c ON c.id_reserva = r.id_reserva 
+        WHERE r.id_reserva = %s
+        """
+        if 'RESERVA_CONVERSA' in self.missing_tables():
+            query = "SELECT NULL, conversa_completa FROM RESERVA WHERE id_reserva = %s"
+        try:
+            with self._read_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with self.metrics.timed('get_transcript', query, (reserva_id,)):
+                        cursor.execute(query, (reserva_id,))
+                        row = cursor.fetchone()
+                finally:
+                    cursor.close()
             
         except Error as e:
-            print(f"❌ Error obteniendo reserva: {e}")
+            logger.error("❌ Error obteniendo conversación: %s", e)
             return None
-        finally:
-            if cursor:
-                cursor.close()
+        
+        if not row:
+            return None
+        compressed, inline = row
+        if compressed is not None:
+            return decompress_transcript(compressed)
+        return inline
     
-    def get_reservas_by_telefon(self, telefon):
+    def save_transcript(self, reserva_id, conversa_completa):
         """
-        Obtiene reservas por teléfono
+        Guarda (o reemplaza) la conversación comprimida de una reserva
         
         Args:
-            telefon (str): Teléfono del cliente
+            reserva_id (int): ID de la reserva
+            conversa_completa (str): Conversación completa
             
         Returns:
-            list: Lista de reservas
+            bool: True si exitoso, False si error
         """
+        query, params = self._transcript_write(reserva_id, conversa_completa)
         try:
-            cursor = self.connection.cursor(dictionary=True)
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with self.metrics.timed('save_transcript', query, params):
+                        cursor.execute(query, params)
+                finally:
+                    cursor.close()
+            return True
             
-            query = """
-            SELECT * FROM RESERVA 
-            WHERE telefon = %s 
-            ORDER BY data_reserva DESC
-            """
-            cursor.execute(query, (telefon,))
+        except Error as e:
+            logger.error("❌ Error guardando conversación: %s", e)
+            return False
+    
+    def get_reservas_by_telefon(self, telefon, include_archive=False, columns=None):
+        """
+        Obtiene reservas por teléfono
+        
+        Las consultas repetidas del mismo teléfono se sirven desde una caché
+        LRU con TTL que se invalida al insertar, modificar o borrar reservas
+        de ese teléfono. La caché guarda las filas completas; con `columns`
+        se recortan al servirlas o, si no están cacheadas, se leen solo esas
+        columnas sin cachear. Para historiales largos usar
+        iter_reservas_by_telefon.
+        
+        Args:
+            telefon (str): Teléfono del cliente
+            include_archive (bool): Añadir también las reservas antiguas
+                movidas a RESERVA_ARCHIVO (ver reservation_archive.py); solo
+                se consulta el archivo cuando se pide y sus filas llevan las
+                columnas de RESERVA_COLUMNS
+            columns (tuple): Columnas a leer (p. ej. RESERVA_COLUMNS); por
+                defecto todas
+            
+        Returns:
+            list: Lista de reservas, de la más reciente a la más antigua
+        """
+        cached = self.reservas_cache.get(telefon)
+        if cached is not None:
+            results = cached
+            if columns:
+                results = [{column: reserva.get(column) for column in columns} for reserva in results]
+        else:
+            generation = self.reservas_cache.generation()
+            try:
+                with self._read_connection() as conn:
+                    cursor = conn.cursor(dictionary=True)
+                    try:
+                        query = f"""
+                        SELECT {_projection(columns)} FROM RESERVA 
+                        WHERE telefon = %s 
+                        ORDER BY data_reserva DESC, id_reserva DESC
+                        """
+                        with self.metrics.timed('get_reservas_by_telefon', query, (telefon,)):
+                            cursor.execute(query, (telefon,))
+                            results = cursor.fetchall()
+                    finally:
+                        cursor.close()
+                
+                if not columns:
+                    self.reservas_cache.put(telefon, results, generation)
+                
+            except Error as e:
+                logger.error("❌ Error obteniendo reservas: %s", e)
+                return []
+        
+        if include_archive:
+            # Las archivadas son siempre más antiguas que las de RESERVA
+            results = results + self.get_archived_reservas_by_telefon(telefon)
+        return results
+    
+    def get_archived_reservas_by_telefon(self, telefon):
+        """
+        Obtiene las reservas archivadas de un teléfono (RESERVA_ARCHIVO)
+        
+        No pasa por la caché: el archivo se consulta poco y no cambia
+        salvo al archivar.
+        
+        Args:
+            telefon (str): Teléfono del cliente
             
-            results = cursor.fetchall()
-            return results
+        Returns:
+            list: Reservas con las columnas de RESERVA_COLUMNS, de la más
+                reciente a la más antigua ([] si no hay archivo)
+        """
+        query = f"""
+        SELECT {', '.join(RESERVA_COLUMNS)} FROM RESERVA_ARCHIVO 
+        WHERE telefon = %s 
+        ORDER BY data_reserva DESC, id_reserva DESC
+        """
+        try:
+            with self._read_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    with self.metrics.timed('get_archived_reservas_by_telefon', query, (telefon,)):
+                        cursor.execute(query, (telefon,))
+                        return cursor.fetchall()
+                finally:
+                    cursor.close()
             
         except Error as e:
-            print(f"❌ Error obteniendo reservas: {e}")
+            logger.error("❌ Error obteniendo reservas archivadas: %s", e)
             return []
+    
+    def iter_reservas_by_telefon(self, telefon, page_size=100):
+        """
+        Recorre las reservas de un teléfono página a página
+        
+        Usa paginación por clave (data_reserva, id_reserva) en lugar de
+        OFFSET, así que cada página cuesta lo mismo aunque el historial sea
+        largo. La conexión se devuelve al pool entre página y página.
+        
+        Args:
+            telefon (str): Teléfono del cliente
+            page_size (int): Reservas por consulta
+            
+        Yields:
+            dict: Reserva con las columnas de RESERVA_COLUMNS, de la más
+                reciente a la más antigua
+        """
+        columns = ', '.join(RESERVA_COLUMNS)
+        first_page = f"""
+        SELECT {columns} FROM RESERVA 
+        WHERE telefon = %s 
+        ORDER BY data_reserva DESC, id_reserva DESC 
+        LIMIT %s
+        """
+        next_page = f"""
+        SELECT {columns} FROM RESERVA 
+        WHERE telefon = %s 
+          AND (data_reserva < %s OR (data_reserva = %s AND id_reserva < %s)) 
+        ORDER BY data_reserva DESC, id_reserva DESC 
+        LIMIT %s
+        """
+        
+        last = None
+        while True:
+            with self._read_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    if last is None:
+                        query, params = first_page, (telefon, page_size)
+                    else:
+                        query, params = next_page, (
+                            telefon,
+                            last['data_reserva'],
+                            last['data_reserva'],
+                            last['id_reserva'],
+                            page_size
+                        )
+                    with self.metrics.timed('iter_reservas_by_telefon', query, params):
+                        cursor.execute(query, params)
+                        rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+            
+            yield from rows
+            
+            if len(rows) < page_size:
+                return
+            last = rows[-1]
+    
+    def iter_reservas(self, start, end, fetch_size=500):
+        """
+        Recorre todas las reservas entre dos fechas en memoria constante
+        
+        Usa un cursor sin buffer: las filas se leen del servidor en bloques
+        de `fetch_size` a medida que se consumen, en lugar de cargar todo el
+        resultado. La conexión queda ocupada hasta agotar el iterador; si se
+        abandona antes, se cierra en lugar de devolverla al pool.
+        
+        Args:
+            start: Fecha/hora inicial (incluida)
+            end: Fecha/hora final (excluida)
+            fetch_size (int): Filas leídas del servidor en cada bloque
+            
+        Yields:
+            dict: Reserva con las columnas de RESERVA_COLUMNS, en orden
+                cronológico
+            
+        Raises:
+            Error: Si falla la consulta (para no truncar en silencio un informe)
+        """
+        query = f"""
+        SELECT {', '.join(RESERVA_COLUMNS)} FROM RESERVA 
+        WHERE data_reserva >= %s AND data_reserva < %s 
+        ORDER BY data_reserva, id_reserva
+        """
+        
+        pool, conn = self._acquire_read()
+        # Si el consumidor no agota el iterador quedan filas sin leer en la
+        # conexión: es más barato cerrarla que drenarlas
+        discard = True
+        try:
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            # Se mide hasta la llegada de las primeras filas, no el recorrido completo
+            with self.metrics.timed('iter_reservas', query, (start, end)):
+                cursor.execute(query, (start, end))
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from rows
+            cursor.close()
+            discard = False
         finally:
-            if cursor:
-                cursor.close()
+            pool.release(conn, discard=discard)
+    
+    def iter_changes(self, since_watermark=None, chunk_size=500, settle_seconds=None):
+        """
+        Feed incremental de reservas nuevas o modificadas
+        
+        Recorre RESERVA por (updated_at, id_reserva) a partir de la marca
+        recibida, en bloques de `chunk_size`, con paginación por clave sobre
+        el índice idx_reserva_updated_at (ver
+        database/add-updated-at-reserva.sql). El coste es proporcional a
+        los cambios, no al tamaño de la tabla. Las filas modificadas en los
+        últimos `settle_seconds` se dejan para la siguiente lectura, para no
+        saltarse transacciones que aún no han confirmado con una hora
+        anterior a la marca. Los borrados no aparecen en el feed.
+        
+        Args:
+            since_watermark (tuple): (updated_at, id_reserva) devuelta por una
+                lectura anterior; None para empezar desde el principio
+            chunk_size (int): Reservas por bloque
+            settle_seconds (float): Margen para transacciones en curso
+                (DB_CHANGES_SETTLE_SECONDS, por defecto 2)
+            
+        Yields:
+            tuple: (reservas, marca) donde reservas es una lista de dict con
+                las columnas de RESERVA_COLUMNS más updated_at y marca es la
+                (updated_at, id_reserva) de la última; guardar la marca solo
+                después de procesar el bloque
+            
+        Raises:
+            Error: Si falla la consulta (el consumidor no debe avanzar la marca)
+        """
+        settle_seconds = float(
+            settle_seconds if settle_seconds is not None else os.getenv('DB_CHANGES_SETTLE_SECONDS', 2)
+        )
+        # El margen se calcula con el reloj del servidor, el mismo que
+        # escribe updated_at, no con el de esta máquina
+        settle = int(settle_seconds * 1000000)
+        columns = ', '.join(RESERVA_COLUMNS + ('updated_at',))
+        first_page = f"""
+        SELECT {columns} FROM RESERVA 
+        WHERE updated_at < NOW(6) - INTERVAL %s MICROSECOND 
+        ORDER BY updated_at, id_reserva 
+        LIMIT %s
+        """
+        next_page = f"""
+        SELECT {columns} FROM RESERVA 
+        WHERE updated_at >= %s AND (updated_at > %s OR id_reserva > %s) 
+          AND updated_at < NOW(6) - INTERVAL %s MICROSECOND 
+        ORDER BY updated_at, id_reserva 
+        LIMIT %s
+        """
+        
+        watermark = tuple(since_watermark) if since_watermark else None
+        while True:
+            if watermark is None:
+                query, params = first_page, (settle, chunk_size)
+            else:
+                query, params = next_page, (watermark[0], watermark[0], watermark[1], settle, chunk_size)
+            
+            with self._read_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    with self.metrics.timed('iter_changes', query, params):
+                        cursor.execute(query, params)
+                        rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+            
+            if not rows:
+                return
+            watermark = (rows[-1]['updated_at'], rows[-1]['id_reserva'])
+            yield rows, watermark
+            
+            if len(rows) < chunk_size:
+                return
     
     def update_reserva(self, reserva_id, **kwargs):
         """
         Actualiza una reserva existente
         
+        Si cambian la fecha/hora, las personas o las observaciones, la
+        ocupación de los tramos se mueve en la misma transacción.
+        
         Args:
             reserva_id (int): ID de la reserva
-            **kwargs: Campos a actualizar
+            **kwargs: Campos a actualizar (conversa_completa se guarda en
+                RESERVA_CONVERSA)
             
         Returns:
             bool: True si exitoso, False si error
         """
-        try:
-            cursor = self.connection.cursor()
-            
-            # Construir query dinámicamente
-            set_clauses = []
-            values = []
-            
-            for field, value in kwargs.items():
-                set_clauses.append(f"{field} = %s")
-                values.append(value)
-            
-            if not set_clauses:
+        conversa_completa = kwargs.pop('conversa_completa', None)
+        if conversa_completa is not None:
+            if not self.save_transcript(reserva_id, conversa_completa):
                 return False
+            if not kwargs:
+                logger.debug("✅ Conversación de la reserva %s actualizada", reserva_id)
+                return True
+        
+        invalid = set(kwargs) - UPDATABLE_COLUMNS
+        if invalid:
+            logger.error("❌ Columnas no permitidas en RESERVA: %s", sorted(invalid))
+            return False
+        
+        # Construir query dinámicamente
+        set_clauses = []
+        values = []
+        
+        for field, value in kwargs.items():
+            set_clauses.append(f"{field} = %s")
+            values.append(value)
+        
+        if not set_clauses:
+            return False
+        
+        query = f"UPDATE RESERVA SET {', '.join(set_clauses)} WHERE id_reserva = %s"
+        values.append(reserva_id)
+        # Si cambian fecha/hora, personas u observaciones (cancelación) hay
+        # que mover la ocupación de los tramos en la misma transacción
+        moves_occupancy = bool(OCCUPANCY_COLUMNS & set(kwargs))
+        config = get_restaurant_config(self) if moves_occupancy else None
+        
+        try:
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    conn.start_transaction()
+                    old = None
+                    if moves_occupancy:
+                        lock_query = ("SELECT data_reserva, num_persones, observacions FROM RESERVA "
+                                      "WHERE id_reserva = %s FOR UPDATE")
+                        with self.metrics.timed('update_reserva.lock', lock_query, (reserva_id,)):
+                            cursor.execute(lock_query, (reserva_id,))
+                            old = cursor.fetchone()
+                    
+                    with self.metrics.timed('update_reserva', query, values):
+                        cursor.execute(query, values)
+                    updated = cursor.rowcount > 0
+                    
+                    if updated and old:
+                        data_reserva, num_persones, observacions = old
+                        self._apply_occupancy(cursor, merge_occupancy(
+                            self._occupancy_delta(data_reserva, num_persones, observacions, sign=-1, config=config),
+                            self._occupancy_delta(
+                                kwargs.get('data_reserva', data_reserva),
+                                kwargs.get('num_persones', num_persones),
+                                kwargs.get('observacions', observacions),
+                                config=config
+                            )
+                        ), 'update_reserva')
+                    conn.commit()
+                except Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
             
-            query = f"UPDATE RESERVA SET {', '.join(set_clauses)} WHERE id_reserva = %s"
-            values.append(reserva_id)
-            
-            cursor.execute(query, values)
-            
-            if cursor.rowcount > 0:
-                print(f"✅ Reserva {reserva_id} actualizada")
+            if updated:
+                self.reservas_cache.invalidate_reserva(reserva_id)
+                if 'telefon' in kwargs:
+                    self.reservas_cache.invalidate(kwargs['telefon'])
+                logger.debug("✅ Reserva %s actualizada", reserva_id)
                 return True
             else:
-                print(f"⚠️ No se encontró reserva con ID {reserva_id}")
+                logger.warning("⚠️ No se encontró reserva con ID %s", reserva_id)
                 return False
                 
         except Error as e:
-            print(f"❌ Error actualizando reserva: {e}")
+            logger.error("❌ Error actualizando reserva: %s", e)
             return False
-        finally:
-            if cursor:
-                cursor.close()
+    
+    def update_reservas_bulk(self, changes, chunk_size=None):
+        """
+        Actualiza muchas reservas en una sola transacción
+        
+        Las reservas se agrupan por el conjunto de columnas que cambian y
+        cada grupo se aplica con un único UPDATE ... CASE id_reserva WHEN ...
+        por bloque de `chunk_size` IDs, en lugar de una ida y vuelta por
+        reserva (marcar no-shows, cambios de estado nocturnos...).
+        
+        Args:
+            changes: dict {id_reserva: {columna: valor}} o iterable de
+                pares (id_reserva, {columna: valor}); si un ID se repite,
+                sus cambios se combinan (en la misma columna gana el último)
+            chunk_size (int): IDs por sentencia (por defecto DB_BULK_CHUNK_SIZE o 500)
+            
+        Returns:
+            dict: {'updated': [ids modificados], 'not_found': [ids inexistentes]},
+                None si hay columnas no permitidas o error (nada se modifica)
+        """
+        chunk_size = int(chunk_size or os.getenv('DB_BULK_CHUNK_SIZE', 500))
+        if hasattr(changes, 'items'):
+            changes = changes.items()
+        
+        merged = {}
+        for reserva_id, fields in changes:
+            if not fields:
+                continue
+            invalid = set(fields) - UPDATABLE_COLUMNS
+            if invalid:
+                logger.error("❌ Columnas no permitidas en RESERVA: %s", sorted(invalid))
+                return None
+            merged.setdefault(reserva_id, {}).update(fields)
+        
+        groups = {}
+        for reserva_id, fields in merged.items():
+            groups.setdefault(tuple(sorted(fields)), {})[reserva_id] = fields
+        
+        result = {'updated': [], 'not_found': []}
+        config = get_restaurant_config(self)
+        deltas = []
+        try:
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    conn.start_transaction()
+                    for columns, rows in groups.items():
+                        ids = list(rows)
+                        for i in range(0, len(ids), chunk_size):
+                            chunk = ids[i:i + chunk_size]
+                            placeholders = ', '.join(['%s'] * len(chunk))
+                            
+                            # Bloquear las filas, saber cuáles existen y leer lo
+                            # necesario para mover la ocupación de los tramos
+                            query = (f"SELECT id_reserva, data_reserva, num_persones, observacions FROM RESERVA "
+                                     f"WHERE id_reserva IN ({placeholders}) FOR UPDATE")
+                            with self.metrics.timed('update_reservas_bulk.lock', query, chunk):
+                                cursor.execute(query, chunk)
+                                existing = {row[0]: row[1:] for row in cursor.fetchall()}
+                            
+                            found = [reserva_id for reserva_id in chunk if reserva_id in existing]
+                            result['not_found'].extend(reserva_id for reserva_id in chunk if reserva_id not in existing)
+                            if not found:
+                                continue
+                            
+                            set_clauses = []
+                            params = []
+                            for column in columns:
+                                whens = ' '.join(['WHEN %s THEN %s'] * len(found))
+                                set_clauses.append(f"{column} = CASE id_reserva {whens} END")
+                                for reserva_id in found:
+                                    params.extend((reserva_id, rows[reserva_id][column]))
+                            params.extend(found)
+                            
+                            query = (f"UPDATE RESERVA SET {', '.join(set_clauses)} "
+                                     f"WHERE id_reserva IN ({', '.join(['%s'] * len(found))})")
+                            with self.metrics.timed('update_reservas_bulk', query, params):
+                                cursor.execute(query, params)
+                            result['updated'].extend(found)
+                            
+                            if OCCUPANCY_COLUMNS & set(columns):
+                                for reserva_id in found:
+                                    data_reserva, num_persones, observacions = existing[reserva_id]
+                                    fields = rows[reserva_id]
+                                    deltas.append(self._occupancy_delta(
+                                        data_reserva, num_persones, observacions, sign=-1, config=config
+                                    ))
+                                    deltas.append(self._occupancy_delta(
+                                        fields.get('data_reserva', data_reserva),
+                                        fields.get('num_persones', num_persones),
+                                        fields.get('observacions', observacions),
+                                        config=config
+                                    ))
+                    
+                    # Toda la ocupación movida en un único upsert
+                    self._apply_occupancy(cursor, merge_occupancy(*deltas), 'update_reservas_bulk')
+                    conn.commit()
+                except Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+        except Error as e:
+            logger.error("❌ Error en la actualización masiva de reservas: %s", e)
+            return None
+        
+        for columns, rows in groups.items():
+            for reserva_id in rows:
+                self.reservas_cache.invalidate_reserva(reserva_id)
+                if 'telefon' in columns:
+                    self.reservas_cache.invalidate(rows[reserva_id]['telefon'])
+        
+        logger.info("✅ Actualización masiva: %s reservas, %s no encontradas", len(result['updated']), len(result['not_found']))
+        return result
     
     def delete_reserva(self, reserva_id):
         """
-        Elimina una reserva
+        Elimina una reserva y descuenta su ocupación de los tramos
         
         Args:
             reserva_id (int): ID de la reserva
@@ -225,45 +1429,418 @@ class DatabaseHandler:
         Returns:
             bool: True si exitoso, False si error
         """
+        config = get_restaurant_config(self)
         try:
-            cursor = self.connection.cursor()
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    conn.start_transaction()
+                    lock_query = ("SELECT data_reserva, num_persones, observacions FROM RESERVA "
+                                  "WHERE id_reserva = %s FOR UPDATE")
+                    with self.metrics.timed('delete_reserva.lock', lock_query, (reserva_id,)):
+                        cursor.execute(lock_query, (reserva_id,))
+                        old = cursor.fetchone()
+                    
+                    query = "DELETE FROM RESERVA WHERE id_reserva = %s"
+                    with self.metrics.timed('delete_reserva', query, (reserva_id,)):
+                        cursor.execute(query, (reserva_id,))
+                    deleted = cursor.rowcount > 0
+                    
+                    if deleted and old:
+                        self._apply_occupancy(cursor, self._occupancy_delta(*old, sign=-1, config=config), 'delete_reserva')
+                    conn.commit()
+                except Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
             
-            query = "DELETE FROM RESERVA WHERE id_reserva = %s"
-            cursor.execute(query, (reserva_id,))
-            
-            if cursor.rowcount > 0:
-                print(f"✅ Reserva {reserva_id} eliminada")
+            if deleted:
+                self.reservas_cache.invalidate_reserva(reserva_id)
+                logger.debug("✅ Reserva %s eliminada", reserva_id)
                 return True
             else:
-                print(f"⚠️ No se encontró reserva con ID {reserva_id}")
+                logger.warning("⚠️ No se encontró reserva con ID %s", reserva_id)
                 return False
                 
         except Error as e:
-            print(f"❌ Error eliminando reserva: {e}")
+            logger.error("❌ Error eliminando reserva: %s", e)
             return False
-        finally:
-            if cursor:
-                cursor.close()
     
-    def test_connection(self):
-        """Prueba la conexión a la base de datos"""
-        try:
-            if self.connect():
-                cursor = self.connection.cursor()
-                cursor.execute("SELECT VERSION()")
-                version = cursor.fetchone()
-                print(f"✅ MySQL versión: {version[0]}")
-                
-                # Probar acceso a las tablas
-                cursor.execute("SHOW TABLES")
-                tables = cursor.fetchall()
-                print(f"✅ Tablas disponibles: {[table[0] for table in tables]}")
+    def _count_slot(self, name):
+        with self._slot_lock:
+            self._slot_counters[name] += 1
+    
+    def reserve_if_available(self, slot, party_size):
+        """
+        Reserva sitio en un tramo de forma atómica, sin sobreventa
+        
+        Cada tramo de 15 minutos tiene una fila contador en OCUPACION_TRAMO.
+        El sitio se toma con un UPDATE condicional sobre la fila del tramo de
+        inicio (... WHERE comensales + N <= capacidad): MySQL bloquea solo esa
+        fila, así que dos llamadas simultáneas solo se esperan si piden el
+        mismo tramo y nunca pueden superar ambas la capacidad. En la misma
+        transacción se suman las personas al resto de tramos a los que cuenta
+        la reserva (duración + solapamiento). Los interbloqueos y las esperas
+        de bloqueo agotadas se reintentan con espera exponencial.
+        
+        Si después no se llega a guardar la reserva hay que devolver el
+        sitio con release_slot; si se guarda, hay que pasar
+        slot_reserved=True a insert_reserva / book_reservation para no
+        sumar dos veces la ocupación.
+        
+        Args:
+            slot: Fecha y hora de inicio (datetime o 'YYYY-MM-DD HH:MM:SS')
+            party_size (int): Número de personas
+            
+        Returns:
+            bool: True si se reservó el sitio, False si el tramo está lleno,
+                None si error o si no existe OCUPACION_TRAMO
+        """
+        if 'OCUPACION_TRAMO' in self.missing_tables():
+            return None
+        config = get_restaurant_config(self)
+        capacity = config['capacidad_maxima']
+        party_size = int(party_size)
+        start_day, start_tramo = slot_of(slot)
+        slots = affected_slots(slot, config['duracion_reserva_minutos'], config['ventana_solapamiento'])
+        
+        # Crear las filas que falten fuera de la transacción, para que el
+        # UPDATE condicional sea el único bloqueo que se toma sobre el tramo
+        seed_query = ("INSERT IGNORE INTO OCUPACION_TRAMO (fecha, tramo, comensales) VALUES "
+                      + ', '.join(['(%s, %s, 0)'] * len(slots)))
+        seed_params = [value for pair in slots for value in pair]
+        
+        take_query = """
+        UPDATE OCUPACION_TRAMO SET comensales = comensales + %s 
+        WHERE fecha = %s AND tramo = %s AND comensales + %s <= %s
+        """
+        take_params = (party_size, start_day, start_tramo, party_size, capacity)
+        
+        others_query = None
+        ranges = _slot_ranges(slots)
+        if len(slots) > 1:
+            others_query = (
+                "UPDATE OCUPACION_TRAMO SET comensales = comensales + %s WHERE ("
+                + ' OR '.join(['(fecha = %s AND tramo BETWEEN %s AND %s)'] * len(ranges))
+                + ") AND NOT (fecha = %s AND tramo = %s)"
+            )
+            others_params = [party_size]
+            for day, first, last in ranges:
+                others_params.extend((day, first, last))
+            others_params.extend((start_day, start_tramo))
+        
+        self._count_slot('attempts')
+        for attempt in range(self.slot_max_retries + 1):
+            try:
+                with self._write_connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        with self.metrics.timed('reserve_if_available.seed', seed_query, seed_params):
+                            cursor.execute(seed_query, seed_params)
+                        
+                        conn.start_transaction()
+                        with self.metrics.timed('reserve_if_available', take_query, take_params):
+                            cursor.execute(take_query, take_params)
+                        if cursor.rowcount == 0:
+                            conn.rollback()
+                            self._count_slot('rejected')
+                            logger.warning("⚠️ Tramo lleno: %s personas el %s superan la capacidad de %s", party_size, slot, capacity)
+                            return False
+                        
+                        if others_query:
+                            with self.metrics.timed('reserve_if_available.spread', others_query, others_params):
+                                cursor.execute(others_query, others_params)
+                        conn.commit()
+                    except Error:
+                        conn.rollback()
+                        raise
+                    finally:
+                        cursor.close()
                 
-                cursor.close()
+                self._count_slot('reserved')
                 return True
+                
+            except Error as e:
+                if getattr(e, 'errno', None) in RETRYABLE_ERRNOS and attempt < self.slot_max_retries:
+                    if attempt == 0:
+                        self._count_slot('conflicts')
+                    self._count_slot('retries')
+                    # Espera exponencial con jitter para no volver a chocar a la vez
+                    time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+                    continue
+                self._count_slot('errors')
+                logger.error("❌ Error reservando tramo: %s", e)
+                return None
+    
+    def release_slot(self, slot, party_size):
+        """
+        Devuelve el sitio tomado con reserve_if_available
+        
+        Args:
+            slot: Fecha y hora de inicio (datetime o 'YYYY-MM-DD HH:MM:SS')
+            party_size (int): Número de personas
+            
+        Returns:
+            bool: True si exitoso, False si error
+        """
+        config = get_restaurant_config(self)
+        party_size = int(party_size)
+        ranges = _slot_ranges(affected_slots(slot, config['duracion_reserva_minutos'], config['ventana_solapamiento']))
+        query = (
+            "UPDATE OCUPACION_TRAMO SET comensales = GREATEST(comensales - %s, 0) WHERE "
+            + ' OR '.join(['(fecha = %s AND tramo BETWEEN %s AND %s)'] * len(ranges))
+        )
+        params = [party_size]
+        for day, first, last in ranges:
+            params.extend((day, first, last))
+        
+        try:
+            with self._write_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with self.metrics.timed('release_slot', query, params):
+                        cursor.execute(query, params)
+                finally:
+                    cursor.close()
+            return True
+            
+        except Error as e:
+            logger.error("❌ Error liberando tramo: %s", e)
             return False
+    
+    def slot_stats(self):
+        """
+        Contadores de reserve_if_available
+        
+        Returns:
+            dict: attempts, reserved, rejected (tramo lleno), conflicts
+                (intentos que chocaron con otra transacción: interbloqueo o
+                espera agotada), retries, errors, conflict_rate y
+                rejection_rate (por intento)
+        """
+        with self._slot_lock:
+            counters = dict(self._slot_counters)
+        attempts = counters['attempts']
+        counters['conflict_rate'] = counters['conflicts'] / attempts if attempts else 0.0
+        counters['rejection_rate'] = counters['rejected'] / attempts if attempts else 0.0
+        return counters
+    
+    def get_day_occupancy(self, day):
+        """
+        Ocupación de un día completo, tramo a tramo
+        
+        Una sola lectura por rango de clave primaria en OCUPACION_TRAMO, en
+        lugar de recorrer RESERVA.
+        
+        Args:
+            day (date): Día de servicio
+            
+        Returns:
+            list: Personas por tramo de 15 minutos (96 posiciones, la 0 es
+                00:00), None si error
+        """
+        query = "SELECT tramo, comensales FROM OCUPACION_TRAMO WHERE fecha = %s"
+        try:
+            with self._read_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with self.metrics.timed('get_day_occupancy', query, (day,)):
+                        cursor.execute(query, (day,))
+                        rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+            
+        except Error as e:
+            logger.error("❌ Error obteniendo ocupación del día: %s", e)
+            return None
+        
+        load = [0] * (24 * 60 // BIN_MINUTES)
+        for tramo, comensales in rows:
+            if 0 <= tramo < len(load):
+                load[tramo] = comensales
+        return load
+    
+    def get_slot_occupancy(self, slot):
+        """
+        Personas que cuentan contra una reserva que empiece a esa hora
+        
+        Args:
+            slot: Fecha y hora (datetime o 'YYYY-MM-DD HH:MM:SS')
+            
+        Returns:
+            int: Personas (0 si el tramo no tiene fila), None si error
+        """
+        params = slot_of(slot)
+        query = "SELECT comensales FROM OCUPACION_TRAMO WHERE fecha = %s AND tramo = %s"
+        try:
+            with self._read_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with self.metrics.timed('get_slot_occupancy', query, params):
+                        cursor.execute(query, params)
+                        row = cursor.fetchone()
+                finally:
+                    cursor.close()
+            return row[0] if row else 0
+            
+        except Error as e:
+            logger.error("❌ Error obteniendo ocupación del tramo: %s", e)
+            return None
+    
+    def can_seat(self, slot, party_size):
+        """
+        Comprueba la capacidad con una lectura por clave primaria
+        
+        Es solo una consulta: para tomar el sitio sin sobreventa usar
+        reserve_if_available.
+        
+        Returns:
+            bool: True si caben, None si error
+        """
+        occupied = self.get_slot_occupancy(slot)
+        if occupied is None:
+            return None
+        return occupied + int(party_size) <= get_restaurant_config(self)['capacidad_maxima']
+    
+    def rebuild_occupancy(self, start_day, end_day=None):
+        """
+        Recalcula OCUPACION_TRAMO a partir de RESERVA (reparar desvíos)
+        
+        Corrige lo que no pasa por DatabaseHandler (el webhook en JS inserta
+        en RESERVA directamente) o quedó a medias. Cada día se recalcula en
+        su propia transacción: primero se bloquean sus filas de
+        OCUPACION_TRAMO, así que las reservas que se registren mientras
+        tanto esperan y se suman sobre el valor recalculado.
+        
+        Args:
+            start_day (date): Primer día
+            end_day (date): Último día, incluido (por defecto start_day)
+            
+        Returns:
+            int: Días recalculados, None si error
+        """
+        end_day = end_day or start_day
+        config = get_restaurant_config(self, force_reload=True)
+        duration = config['duracion_reserva_minutos']
+        overlap = config['ventana_solapamiento']
+        
+        lock_query = "SELECT tramo FROM OCUPACION_TRAMO WHERE fecha = %s FOR UPDATE"
+        select_query = """
+        SELECT data_reserva, num_persones, observacions FROM RESERVA 
+        WHERE data_reserva >= %s AND data_reserva < %s
+        """
+        reset_query = "UPDATE OCUPACION_TRAMO SET comensales = 0 WHERE fecha = %s"
+        
+        days = 0
+        day = start_day
+        try:
+            while day <= end_day:
+                # Reservas que pueden contar en algún tramo del día
+                midnight = datetime.combine(day, datetime.min.time())
+                window = (
+                    midnight - timedelta(minutes=overlap),
+                    midnight + timedelta(days=1, minutes=duration + overlap)
+                )
+                
+                with self._write_connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        conn.start_transaction()
+                        with self.metrics.timed('rebuild_occupancy.lock', lock_query, (day,)):
+                            cursor.execute(lock_query, (day,))
+                            cursor.fetchall()
+                        with self.metrics.timed('rebuild_occupancy.scan', select_query, window):
+                            cursor.execute(select_query, window)
+                            reservas = cursor.fetchall()
+                        
+                        load = {}
+                        for data_reserva, num_persones, observacions in reservas:
+                            covers = counted_covers(num_persones, observacions)
+                            if not covers:
+                                continue
+                            for slot_day, tramo in affected_slots(data_reserva, duration, overlap):
+                                if slot_day == day:
+                                    load[tramo] = load.get(tramo, 0) + covers
+                        
+                        with self.metrics.timed('rebuild_occupancy.reset', reset_query, (day,)):
+                            cursor.execute(reset_query, (day,))
+                        if load:
+                            rows = sorted(load.items())
+                            query = OCCUPANCY_UPSERT_SQL.format(values=', '.join(['(%s, %s, %s)'] * len(rows)))
+                            params = [value for tramo, covers in rows for value in (day, tramo, covers)]
+                            with self.metrics.timed('rebuild_occupancy', query, params):
+                                cursor.execute(query, params)
+                        conn.commit()
+                    except Error:
+                        conn.rollback()
+                        raise
+                    finally:
+                        cursor.close()
+                
+                days += 1
+                day += timedelta(days=1)
+            
+        except Error as e:
+            logger.error("❌ Error recalculando la ocupación del %s: %s", day, e)
+            return None
+        
+        logger.info("✅ Ocupación recalculada para %s días (%s - %s)", days, start_day, end_day)
+        return days
+    
+    def stats(self):
+        """
+        Foto del rendimiento de la capa de datos
+        
+        Permite ver si en una llamada el cuello de botella es la base de
+        datos o Google.
+        
+        Returns:
+            dict: {'queries': tiempos por operación (count, p50/p95/p99...),
+                   'pool': estado del pool, 'cache': contadores de la caché,
+                   'slots': contadores de reserve_if_available,
+                   'replica': estado del pool de la réplica (None si no hay)}
+        """
+        return {
+            'queries': self.metrics.stats(),
+            'pool': self.pool.stats(),
+            'replica': self.replica_pool.stats() if self.replica_pool is not None else None,
+            'cache': self.reservas_cache.stats(),
+            'slots': self.slot_stats()
+        }
+    
+    def cache_stats(self):
+        """
+        Contadores de la caché de reservas por teléfono
+        
+        Returns:
+            dict: hits, misses, hit_rate, evictions, expirations, invalidations...
+        """
+        return self.reservas_cache.stats()
+    
+    def test_connection(self):
+        """Prueba la conexión a la base de datos"""
+        try:
+            with self._read_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with self.metrics.timed('test_connection', "SELECT VERSION()"):
+                        cursor.execute("SELECT VERSION()")
+                    version = cursor.fetchone()
+                    logger.info("✅ %s versión: %s", self.backend_name, version[0])
+                    
+                    # Probar acceso a las tablas
+                    with self.metrics.timed('test_connection', "SHOW TABLES"):
+                        cursor.execute("SHOW TABLES")
+                    tables = cursor.fetchall()
+                    logger.info("✅ Tablas disponibles: %s", [table[0] for table in tables])
+                finally:
+                    cursor.close()
+            # Avisar ya de las migraciones pendientes
+            self.missing_tables(refresh=True)
+            return True
         except Error as e:
-            print(f"❌ Error probando conexión: {e}")
+            logger.error("❌ Error probando conexión: %s", e)
             return False
 
 # Función de prueba
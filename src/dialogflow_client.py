@@ -1,46 +1,46 @@
 # src/dialogflow_client.py
 import os
 from google.cloud import dialogflowcx as df
-import json
 from dotenv import load_dotenv
+from structured_logging import get_logger
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = get_logger('dialogflow')
+
 class DialogflowCXClient:
     def __init__(self, project_id=None, location=None, agent_id=None):
         """Inicializa el cliente de Dialogflow CX"""
         try:
-            print("🔧 Inicializando DialogflowCX Client...")
+            logger.info("🔧 Inicializando DialogflowCX Client...")
             
             # Verificar que las credenciales estén configuradas
             credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
             if not credentials_path or not os.path.exists(credentials_path):
                 raise Exception("Credenciales de Google Cloud no encontradas. Verifica el archivo .env y credentials/service-account.json")
             
-            print(f"✅ Credenciales encontradas: {credentials_path}")
+            logger.info("✅ Credenciales encontradas: %s", credentials_path)
             
             # Usar valores por defecto desde variables de entorno si no se proporcionan
             self.project_id = project_id or os.getenv('PROJECT_ID')
             self.location = location or os.getenv('LOCATION', 'global')
             self.agent_id = agent_id or os.getenv('AGENT_ID')
             
-            print(f"🔧 Project ID: {self.project_id}")
-            print(f"🔧 Location: {self.location}")
-            print(f"🔧 Agent ID: {self.agent_id}")
+            logger.debug("🔧 Project ID: %s, Location: %s, Agent ID: %s", self.project_id, self.location, self.agent_id)
             
             if not all([self.project_id, self.location, self.agent_id]):
                 raise Exception("Faltan variables de entorno: PROJECT_ID, LOCATION, AGENT_ID")
             
             # CORREGIDO: Especificar la región correcta
             if self.location == 'eu':
-                print("🔧 Configurando cliente para región EU...")
+                logger.debug("🔧 Configurando cliente para región EU...")
                 # Para región EU, usar el endpoint específico
                 self.client = df.SessionsClient(
                     client_options={"api_endpoint": "eu-dialogflow.googleapis.com"}
                 )
             else:
-                print("🔧 Configurando cliente para región global...")
+                logger.debug("🔧 Configurando cliente para región global...")
                 self.client = df.SessionsClient()
             
             # CORREGIDO: Construir session path con environment draft
@@ -52,25 +52,27 @@ class DialogflowCXClient:
                 "api_endpoint": "eu-dialogflow.googleapis.com" if self.location == 'eu' else None
             }
             
-            print(f"✅ DialogflowCX Client inicializado correctamente")
-            print(f"   Project ID: {self.project_id}")
-            print(f"   Location: {self.location}")
-            print(f"   Agent ID: {self.agent_id}")
-            print(f"   Session Path: {self.session_path}")
+            logger.info("✅ DialogflowCX Client inicializado correctamente", extra={'data': {
+                'project_id': self.project_id,
+                'location': self.location,
+                'agent_id': self.agent_id,
+                'session_path': self.session_path
+            }})
             
         except Exception as e:
-            print(f"❌ Error inicializando DialogflowCX Client: {e}")
-            print("💡 Verifica que tengas:")
-            print("   1. Archivo credentials/service-account.json")
-            print("   2. Variables PROJECT_ID, LOCATION, AGENT_ID en .env")
-            print("   3. APIs habilitadas en Google Cloud Console")
+            logger.error(
+                "❌ Error inicializando DialogflowCX Client: %s\n"
+                "💡 Verifica que tengas:\n"
+                "   1. Archivo credentials/service-account.json\n"
+                "   2. Variables PROJECT_ID, LOCATION, AGENT_ID en .env\n"
+                "   3. APIs habilitadas en Google Cloud Console", e
+            )
             raise e
     
     def detect_intent_from_text(self, text, language_code="es-ES"):
         """Detecta la intención a partir de texto"""
         try:
-            print(f"Enviando texto: '{text}'")
-            print(f"Idioma: {language_code}")
+            logger.debug("Enviando texto: '%s' (%s)", text, language_code)
             
             # Crear query input con configuración optimizada
             query_input = df.QueryInput(
@@ -86,11 +88,11 @@ class DialogflowCXClient:
             response = self.client.detect_intent(request=request)
             result = response.query_result
             intent = result.intent
-            parameters = result.parameters
+            parameters = dict(result.parameters) if result.parameters else {}
             
-            print(f"Intent detectado: {intent.display_name if intent else 'None'}")
-            print(f"Confianza: {result.intent_detection_confidence:.2f}")
-            print(f"Parametros: {dict(parameters) if parameters else 'None'}")
+            logger.info("Intent detectado: %s (confianza %.2f)",
+                        intent.display_name if intent else 'None', result.intent_detection_confidence,
+                        extra={'data': {'parameters': parameters}})
             
             # Obtener fulfillment text
             fulfillment_text = ""
@@ -110,12 +112,12 @@ class DialogflowCXClient:
                 "intent_name": intent.display_name if intent else "No entendido",
                 "confidence": result.intent_detection_confidence,
                 "fulfillment_text": fulfillment_text.strip(),
-                "parameters": dict(parameters) if parameters else {},
+                "parameters": parameters,
                 "language_code": result.language_code
             }
             
         except Exception as e:
-            print(f"❌ Error en la detección de intención: {e}")
+            logger.error("❌ Error en la detección de intención: %s", e)
             return {
                 "intent_name": "Error",
                 "confidence": 0.0,
@@ -0,0 +1,374 @@
+# src/index_advisor.py
+"""
+Revisión de índices de las consultas de DatabaseHandler
+
+Ejecuta contra la base de datos configurada una carga de trabajo que pasa
+por todos los métodos de DatabaseHandler (con un teléfono y un día ficticios
+que se borran al terminar), recoge cada plantilla de consulta a través de
+QueryMetrics y la pasa por EXPLAIN (EXPLAIN QUERY PLAN en SQLite). Las
+consultas que recorren una tabla entera o necesitan ordenar en memoria
+(filesort) se marcan y se propone un índice compuesto para cada una.
+
+Uso:
+    python src/index_advisor.py                     # informe; código 1 si falta algún índice
+    python src/index_advisor.py fichero_migración   # escribe los índices propuestos
+    python src/index_advisor.py --apply             # crea los índices propuestos
+
+tests/test_query_indexes.py hace la misma comprobación en los tests.
+"""
+
+import re
+import sys
+from datetime import date, datetime, time, timedelta
+from mysql.connector import Error
+from query_metrics import QueryMetrics
+from sqlite_backend import split_statements
+
+# Datos de la carga de trabajo: un teléfono que no es válido y un día lejano
+ADVISOR_TELEFON = '+000000000'
+ADVISOR_NAME = 'Index Advisor'
+ADVISOR_DAY = date(2099, 12, 30)
+
+_EXPLAINABLE = re.compile(r'^\s*(SELECT\b.*\bFROM\b|UPDATE\b|DELETE\b)', re.IGNORECASE | re.DOTALL)
+_TABLE = re.compile(r'\b(?:FROM|UPDATE|INTO)\s+(\w+)', re.IGNORECASE)
+_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(?!WHERE\b|ORDER\b|LEFT\b|JOIN\b|ON\b)(\w+)', re.IGNORECASE)
+_WHERE = re.compile(r'\bWHERE\b(.*?)(?:\bORDER\s+BY\b|\bLIMIT\b|\bFOR\s+UPDATE\b|$)', re.IGNORECASE | re.DOTALL)
+_ORDER_BY = re.compile(r'\bORDER\s+BY\b(.*?)(?:\bLIMIT\b|\bFOR\s+UPDATE\b|$)', re.IGNORECASE | re.DOTALL)
+_COLUMN = r'(?<![%\w.])(?:\w+\.)?([A-Za-z_]\w*)'
+_EQUALITY = re.compile(_COLUMN + r'\s*=\s*(?:%s|@\w+)')
+_RANGE = re.compile(_COLUMN + r'\s*(?:<=?|>=?|\bBETWEEN\b|\bIN\b)', re.IGNORECASE)
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+
+
+def _normalize(query):
+    return ' '.join(query.split())
+
+
+class QueryRecorder(QueryMetrics):
+    """QueryMetrics que además guarda la primera ejecución de cada consulta"""
+
+    def __init__(self):
+        super().__init__(slow_threshold_ms=0)
+        self.queries = {}
+
+    def record(self, operation, seconds, query=None, params=None, failed=False):
+        super().record(operation, seconds, query, params, failed)
+        if query and _normalize(query) not in self.queries:
+            if isinstance(params, (list, tuple)):
+                params = list(params)
+            self.queries[_normalize(query)] = (operation, query, params)
+
+
+def propose_index(statement, table):
+    """
+    Índice compuesto para una consulta: columnas de igualdad, después las
+    del ORDER BY (o la primera de rango si no se ordena)
+
+    Returns:
+        tuple: Columnas del índice, vacía si no hay nada que indexar
+    """
+    where = _WHERE.search(statement)
+    where = where.group(1) if where else ''
+    order = _ORDER_BY.search(statement)
+
+    columns = _EQUALITY.findall(where)
+    if order:
+        columns += [re.sub(r'\s+(ASC|DESC)$', '', column.strip(), flags=re.IGNORECASE).split('.')[-1]
+                    for column in order.group(1).split(',')]
+    else:
+        columns += _RANGE.findall(where)[:1]
+
+    result = []
+    for column in columns:
+        if column not in result:
+            result.append(column)
+    return tuple(result)
+
+
+def index_name(table, columns):
+    return f"idx_{table.lower()}_{'_'.join(columns)}"[:64]
+
+
+class IndexAdvisor:
+    def __init__(self, database_handler):
+        """
+        Revisión de los planes de ejecución de DatabaseHandler
+
+        Args:
+            database_handler (DatabaseHandler): Acceso a la base de datos
+        """
+        self.db = database_handler
+
+    def _execute(self, query, params=()):
+        with self.db.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, params)
+                return cursor.fetchall() if cursor.with_rows else None
+            finally:
+                cursor.close()
+
+    def _run_workload(self):
+        """Pasa por todos los métodos de DatabaseHandler que consultan la base de datos"""
+        db = self.db
+        slot = datetime.combine(ADVISOR_DAY, time(21, 0))
+
+        db.insert_reserva(slot, 2, ADVISOR_TELEFON, ADVISOR_NAME, conversa_completa=ADVISOR_NAME)
+        db.book_reservation(slot + timedelta(minutes=30), 2, ADVISOR_TELEFON, ADVISOR_NAME,
+                            conversa_completa=ADVISOR_NAME)
+        db.insert_reservas_bulk([
+            {'data_reserva': slot + timedelta(hours=1), 'num_persones': 2, 'telefon': ADVISOR_TELEFON,
+             'nom_persona_reserva': ADVISOR_NAME},
+            {'data_reserva': slot + timedelta(hours=1), 'num_persones': 2, 'telefon': ADVISOR_TELEFON,
+             'nom_persona_reserva': ADVISOR_NAME, 'conversa_completa': ADVISOR_NAME}
+        ])
+
+        db.reservas_cache.invalidate(ADVISOR_TELEFON)
+        ids = [reserva['id_reserva'] for reserva in db.get_reservas_by_telefon(ADVISOR_TELEFON, include_archive=True)]
+        list(db.iter_reservas_by_telefon(ADVISOR_TELEFON, page_size=1))
+        list(db.iter_reservas(slot - timedelta(days=1), slot + timedelta(days=1)))
+
+        # Dos páginas del feed de cambios bastan para ver las dos consultas
+        changes = db.iter_changes(chunk_size=1, settle_seconds=0)
+        try:
+            next(changes, None)
+            next(changes, None)
+        finally:
+            changes.close()
+
+        if ids:
+            db.get_reserva_by_id(ids[0], include_conversa=True)
+            db.get_transcript(ids[0])
+            db.save_transcript(ids[0], ADVISOR_NAME)
+            db.update_reserva(ids[0], num_persones=3, observacions=ADVISOR_NAME)
+            db.update_reservas_bulk({reserva_id: {'num_persones': 4} for reserva_id in ids[1:]})
+
+        if db.reserve_if_available(slot, 1):
+            db.release_slot(slot, 1)
+        db.get_day_occupancy(ADVISOR_DAY)
+        db.get_slot_occupancy(slot)
+        db.rebuild_occupancy(ADVISOR_DAY)
+
+        for reserva_id in ids:
+            db.delete_reserva(reserva_id)
+
+    def _cleanup(self):
+        """Borra lo que haya quedado de la carga de trabajo"""
+        try:
+            self._execute("DELETE FROM RESERVA WHERE telefon = %s", (ADVISOR_TELEFON,))
+            self._execute("DELETE FROM CLIENT WHERE TELEFON = %s", (ADVISOR_TELEFON,))
+            self._execute(
+                "DELETE FROM OCUPACION_TRAMO WHERE fecha BETWEEN %s AND %s",
+                (ADVISOR_DAY - timedelta(days=1), ADVISOR_DAY + timedelta(days=1))
+            )
+        except Error as e:
+            print(f"⚠️ Error limpiando los datos del análisis de índices: {e}")
+        self.db.reservas_cache.invalidate(ADVISOR_TELEFON)
+
+    def capture(self):
+        """
+        Ejecuta la carga de trabajo y recoge las consultas emitidas
+
+        Returns:
+            list: (operación, consulta, parámetros) de cada plantilla distinta
+        """
+        recorder = QueryRecorder()
+        metrics = self.db.metrics
+        self.db.metrics = recorder
+        try:
+            self._run_workload()
+        finally:
+            self.db.metrics = metrics
+            self._cleanup()
+        return list(recorder.queries.values())
+
+    def explain(self, statement, params):
+        """
+        Plan de ejecución de una sentencia
+
+        Returns:
+            list: Problemas encontrados [(tabla, problema, detalle), ...]
+        """
+        problems = []
+        if self.db.backend == 'sqlite':
+            aliases = {alias: table for table, alias in _ALIAS.findall(statement)}
+            table = _TABLE.search(statement).group(1)
+            for row in self._execute("EXPLAIN QUERY PLAN " + statement, params) or ():
+                detail = row[-1]
+                scan = _SQLITE_SCAN.match(detail)
+                if scan and 'INDEX' not in scan.group(2):
+                    problems.append((aliases.get(scan.group(1), scan.group(1)), 'full scan', detail))
+                elif 'TEMP B-TREE' in detail:
+                    problems.append((table, 'filesort', detail))
+            return problems
+
+        with self.db.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("EXPLAIN " + statement, params)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        for row in rows:
+            extra = row.get('Extra') or ''
+            detail = f"type={row.get('type')} key={row.get('key')} rows={row.get('rows')} {extra}".strip()
+            if row.get('type') == 'ALL' and row.get('possible_keys'):
+                # Hay un índice utilizable pero el optimizador ha preferido
+                # recorrer la tabla (habitual con pocas filas): se marca
+                # igualmente, sin proponer otro índice
+                problems.append((row.get('table'), 'index not used',
+                                 f"{detail} possible_keys={row.get('possible_keys')}"))
+            elif row.get('type') == 'ALL':
+                problems.append((row.get('table'), 'full scan', detail))
+            elif 'filesort' in extra:
+                problems.append((row.get('table'), 'filesort', detail))
+        return problems
+
+    def check(self):
+        """
+        Revisa el plan de todas las consultas de DatabaseHandler
+
+        Returns:
+            dict: {'explained': int, 'findings': [dict], 'proposals': [dict],
+                'skipped': [(operación, motivo)]}
+        """
+        report = {'explained': 0, 'findings': [], 'proposals': [], 'skipped': []}
+        proposals = {}
+
+        for operation, query, params in self.capture():
+            offset = 0
+            for statement in split_statements(query):
+                count = statement.count('%s')
+                statement_params = params[offset:offset + count] if params else []
+                offset += count
+                if not _EXPLAINABLE.match(statement):
+                    continue
+                if len(statement_params) != count:
+                    report['skipped'].append((operation, 'sin parámetros'))
+                    continue
+
+                statement = statement.strip()
+                try:
+                    problems = self.explain(statement, statement_params)
+                except Error as e:
+                    report['skipped'].append((operation, str(e)))
+                    continue
+                report['explained'] += 1
+
+                for table, problem, detail in problems:
+                    report['findings'].append({
+                        'operation': operation,
+                        'table': table,
+                        'problem': problem,
+                        'detail': detail,
+                        'statement': _normalize(statement)
+                    })
+                    if problem == 'index not used' or table != _TABLE.search(statement).group(1):
+                        continue
+                    columns = propose_index(statement, table)
+                    if columns:
+                        proposal = proposals.setdefault((table, columns), {
+                            'table': table,
+                            'columns': columns,
+                            'name': index_name(table, columns),
+                            'operations': []
+                        })
+                        if operation not in proposal['operations']:
+                            proposal['operations'].append(operation)
+
+        # Un índice también sirve para las consultas que usan solo sus
+        # primeras columnas: no proponer los que son prefijo de otro
+        for table, columns in list(proposals):
+            for other_table, other in proposals:
+                if other_table == table and len(other) > len(columns) and other[:len(columns)] == columns:
+                    wider = proposals[(other_table, other)]
+                    for operation in proposals.pop((table, columns))['operations']:
+                        if operation not in wider['operations']:
+                            wider['operations'].append(operation)
+                    break
+
+        report['proposals'] = list(proposals.values())
+        return report
+
+    def migration_sql(self, proposals):
+        """Script de migración con los índices propuestos, en el formato de database/*.sql"""
+        lines = [
+            "-- Índices propuestos por src/index_advisor.py",
+            f"-- Generado el {datetime.now():%Y-%m-%d %H:%M} a partir de EXPLAIN sobre las consultas de DatabaseHandler",
+            ""
+        ]
+        for proposal in proposals:
+            lines.append(f"-- Para: {', '.join(proposal['operations'])}")
+            lines.append(f"ALTER TABLE {proposal['table']}")
+            lines.append(f"    ADD KEY {proposal['name']} ({', '.join(proposal['columns'])});")
+            lines.append("")
+        return '\n'.join(lines)
+
+    def apply(self, proposals):
+        """
+        Crea los índices propuestos
+
+        Returns:
+            list: Nombres de los índices creados
+        """
+        created = []
+        for proposal in proposals:
+            query = f"CREATE INDEX {proposal['name']} ON {proposal['table']} ({', '.join(proposal['columns'])})"
+            try:
+                self._execute(query)
+            except Error as e:
+                print(f"❌ Error creando {proposal['name']}: {e}")
+                continue
+            created.append(proposal['name'])
+            print(f"✅ Índice {proposal['name']} creado en {proposal['table']}")
+        return created
+
+
+def print_report(report):
+    print(f"📊 {report['explained']} sentencias analizadas con EXPLAIN")
+    for operation, reason in report['skipped']:
+        print(f"   ⏭️ {operation}: {reason}")
+    for finding in report['findings']:
+        print(f"❌ [{finding['operation']}] {finding['problem']} en {finding['table']}: {finding['detail']}")
+        print(f"   {finding['statement']}")
+    for proposal in report['proposals']:
+        print(f"💡 {proposal['table']} ({', '.join(proposal['columns'])}) -> {proposal['name']}")
+    if not report['findings']:
+        print("✅ Todas las consultas usan índices")
+
+
+def main():
+    from dotenv import load_dotenv
+    from database_handler import DatabaseHandler
+
+    # Cargar variables de entorno
+    load_dotenv()
+
+    print("REVISIÓN DE ÍNDICES DE DATABASEHANDLER")
+    print("=" * 50)
+
+    db = DatabaseHandler()
+    if not db.connect():
+        return 1
+
+    try:
+        advisor = IndexAdvisor(db)
+        report = advisor.check()
+        print_report(report)
+
+        if len(sys.argv) > 1 and report['proposals']:
+            if sys.argv[1] == '--apply':
+                advisor.apply(report['proposals'])
+            else:
+                with open(sys.argv[1], 'w', encoding='utf-8') as f:
+                    f.write(advisor.migration_sql(report['proposals']))
+                print(f"✅ Migración escrita en {sys.argv[1]}")
+    finally:
+        db.disconnect()
+
+    return 1 if report['findings'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,25 @@
 # src/main.py
 import os
+import time
+import uuid
 from speech_handler import SpeechToTextHandler
 from dialogflow_client import DialogflowCXClient
-from database_handler import DatabaseHandler
-import json
+from database_handler import DatabaseHandler, make_idempotency_key
+from reservation_writer import ReservationWriter
+from availability import AvailabilityService
+from webhook_client import (RETRYABLE_STATUS, build_payload, format_parameters, get_webhook_client,
+                            idempotency_headers, parse_fulfillment_text, request_not_delivered)
+from circuit_breaker import CircuitBreaker, backoff_delay
+from webhook_outbox import get_webhook_outbox, queue_reservation
+from structured_logging import get_logger
 import requests
 from datetime import datetime
 
+logger = get_logger('voice')
+webhook_logger = get_logger('webhook')
+
 class VoiceReservationSystem:
-    def __init__(self, project_id, location, agent_id, webhook_url=None):
+    def __init__(self, project_id, location, agent_id, webhook_url=None, write_behind=None):
         """
         Sistema completo de reservas por voz
         
@@ -17,11 +28,36 @@ class VoiceReservationSystem:
             location (str): Ubicación del agente
             agent_id (str): ID del agente de Dialogflow CX
             webhook_url (str): URL del webhook para procesar reservas
+            write_behind (bool): Guardar las reservas locales en segundo plano
+                (journal local + escritura por lotes) en lugar de esperar a
+                MySQL. Por defecto RESERVATION_WRITE_BEHIND
         """
         self.speech_handler = SpeechToTextHandler()
         self.dialogflow_client = DialogflowCXClient(project_id, location, agent_id)
         self.database_handler = DatabaseHandler()
         self.webhook_url = webhook_url or os.getenv('WEBHOOK_URL', 'https://cronosai-webhook.vercel.app/api/webhook')
+        # Conexión keep-alive compartida: el handshake TLS se hace ahora, no en el primer turno
+        self.webhook_client = get_webhook_client(self.webhook_url)
+        self.webhook_client.warm_up()
+        # Si el webhook falla o va lento, ir directamente a la ruta local
+        self.webhook_breaker = CircuitBreaker('webhook')
+        self.webhook_deadline = float(os.getenv('WEBHOOK_DEADLINE', 10))
+        self.webhook_max_retries = int(os.getenv('WEBHOOK_MAX_RETRIES', 2))
+        self.webhook_retries = 0
+        # Outbox opcional (WEBHOOK_OUTBOX): si el webhook no responde, la
+        # petición se reenvía más tarde en lugar de guardarse localmente
+        self.webhook_outbox = get_webhook_outbox()
+        self.last_webhook_queued = False
+        # Identifica la conversación en el webhook y en la clave de idempotencia
+        self.session_id = f"voice-{uuid.uuid4().hex}"
+        
+        if write_behind is None:
+            write_behind = os.getenv('RESERVATION_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+        self.reservation_writer = ReservationWriter(self.database_handler) if write_behind else None
+        self.availability = AvailabilityService(self.database_handler)
+        # Horas alternativas de la última reserva rechazada por capacidad
+        # (None si la última reserva no se rechazó por falta de sitio)
+        self.last_suggested_slots = None
         
     def process_voice_input(self, audio_file_path, language="es-ES"):
         """
@@ -34,7 +70,7 @@ class VoiceReservationSystem:
         Returns:
             dict: Respuesta completa del sistema
         """
-        print("🎙️ Procesando entrada de voz...")
+        logger.info("🎙️ Procesando entrada de voz...")
         
         # Paso 1: Transcribir audio a texto
         transcript = self.speech_handler.transcribe_audio(audio_file_path)
@@ -48,16 +84,16 @@ class VoiceReservationSystem:
                 "response": "Disculpe, no pude entender. ¿Puede repetir?"
             }
         
-        print(f"📝 Transcripción: {transcript}")
+        logger.info("📝 Transcripción: %s", transcript)
         
         # Paso 2: Enviar a Dialogflow CX
-        print("🤖 Consultando con el agente...")
+        logger.info("🤖 Consultando con el agente...")
         dialogflow_response = self.dialogflow_client.detect_intent_from_text(
             transcript, language
         )
         
-        print(f"🎯 Intención detectada: {dialogflow_response['intent_name']}")
-        print(f"📊 Confianza: {dialogflow_response['confidence']:.2f}")
+        logger.info("🎯 Intención detectada: %s", dialogflow_response['intent_name'])
+        logger.info("📊 Confianza: %.2f", dialogflow_response['confidence'])
         
         # Paso 3: Procesar reserva si es necesario y obtener respuesta
         response_text = dialogflow_response['fulfillment_text']
@@ -67,15 +103,18 @@ class VoiceReservationSystem:
             if webhook_success and hasattr(self, 'last_webhook_response'):
                 # Usar la respuesta del webhook si está disponible
                 response_text = self.last_webhook_response
-                print(f"💬 Usando respuesta del webhook: {response_text}")
+                logger.info("💬 Usando respuesta del webhook: %s", response_text)
+            elif self.last_webhook_queued:
+                logger.warning("📮 Webhook no disponible: la reserva se enviará desde el outbox")
             elif not webhook_success:
-                print("⚠️ Webhook falló, procesando reserva localmente...")
-                self._process_reservation(dialogflow_response['parameters'])
+                logger.warning("⚠️ Webhook falló, procesando reserva localmente...")
+                if not self._process_reservation(dialogflow_response['parameters']):
+                    response_text = self._reservation_failed_text(dialogflow_response['parameters'])
         
-        print(f"💬 Respuesta final: {response_text}")
+        logger.info("💬 Respuesta final: %s", response_text)
         
         # Paso 4: Sintetizar respuesta
-        print("🔊 Generando respuesta de voz...")
+        logger.info("🔊 Generando respuesta de voz...")
         response_audio = self.speech_handler.synthesize_speech(response_text, language)
         
         # Paso 6: Guardar respuesta de audio
@@ -95,62 +134,135 @@ class VoiceReservationSystem:
         """
         Llama al webhook para procesar la reserva
         
+        Todo el intento (reintentos incluidos) tiene un plazo máximo
+        (WEBHOOK_DEADLINE). Solo se reintenta cuando la petición no llegó
+        a procesarse (error de conexión, 429, 502, 503), con backoff
+        exponencial y jitter; un timeout de lectura o un 500 no se
+        reintentan porque la reserva puede haberse guardado. Si el circuito
+        está abierto no se llama al webhook y se devuelve False enseguida.
+        
+        La petición lleva la clave de idempotencia de la reserva en la
+        cabecera Idempotency-Key y api/webhook.js la guarda con el mismo
+        índice único que la ruta local (_process_reservation usa la misma
+        clave): si el webhook guardó la reserva pero la respuesta no llegó
+        (timeout de lectura o 500), el respaldo local devuelve esa reserva
+        en lugar de crear otra.
+        
+        Con outbox, si la petición seguro que no se procesó (no se pudo
+        conectar, 429, 502, 503 o circuito abierto) se guarda para
+        reenviarla en segundo plano y last_webhook_queued queda a True: la
+        reserva no debe procesarse también por la ruta local.
+        
         Args:
             parameters (dict): Parámetros de la reserva extraídos de Dialogflow
             
         Returns:
             bool: True si el webhook procesó la reserva exitosamente, False si hubo error
         """
+        self.last_webhook_queued = False
         try:
-            print("🌐 Llamando al webhook para procesar reserva...")
-            print(f"🔗 Webhook URL: {self.webhook_url}")
+            webhook_logger.info("🌐 Llamando al webhook para procesar reserva...")
+            webhook_logger.debug("🔗 Webhook URL: %s", self.webhook_url)
             
             # Preparar datos para el webhook en el formato esperado
-            webhook_data = {
-                "sessionInfo": {
-                    "session": "default-session",
-                    "parameters": self._format_parameters_for_webhook(parameters)
-                },
-                "languageCode": "es-ES"
-            }
+            webhook_data = build_payload(self.session_id, self._format_parameters_for_webhook(parameters))
+            headers = idempotency_headers(self._idempotency_key(parameters))
             
-            print(f"📤 Enviando datos al webhook: {json.dumps(webhook_data, indent=2)}")
+            webhook_logger.debug("📤 Enviando datos al webhook", extra={'data': webhook_data})
             
-            # Llamar al webhook
-            response = requests.post(
-                self.webhook_url,
-                json=webhook_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            
-            print(f"📥 Respuesta del webhook - Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                webhook_response = response.json()
-                print(f"✅ Webhook procesó la reserva exitosamente")
-                print(f"📋 Respuesta del webhook: {json.dumps(webhook_response, indent=2)}")
+            deadline = time.monotonic() + self.webhook_deadline
+            attempt = 0
+            while True:
+                if not self.webhook_breaker.allow():
+                    webhook_logger.warning("⚡ Circuito del webhook abierto: se omite la llamada")
+                    self._queue_webhook(webhook_data, parameters)
+                    return False
                 
-                # Actualizar el texto de respuesta con la confirmación del webhook
-                if 'fulfillment_response' in webhook_response:
-                    messages = webhook_response['fulfillment_response'].get('messages', [])
-                    if messages and 'text' in messages[0]:
-                        self.last_webhook_response = messages[0]['text']['text']
-                        print(f"💬 Nueva respuesta del webhook: {self.last_webhook_response}")
+                remaining = max(deadline - time.monotonic(), 0.1)
+                connect_timeout, read_timeout = self.webhook_client.timeout
+                start = time.perf_counter()
+                try:
+                    # Llamar al webhook
+                    response = self.webhook_client.post(
+                        webhook_data, timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)),
+                        headers=headers
+                    )
+                except requests.exceptions.RequestException as e:
+                    self.webhook_breaker.record(False, (time.perf_counter() - start) * 1000)
+                    webhook_logger.error("❌ Error de conexión con el webhook: %s", e)
+                    retryable = request_not_delivered(e)
+                except Exception:
+                    self.webhook_breaker.cancel()
+                    raise
+                else:
+                    # Un 4xx es un error de la petición, no del servicio
+                    self.webhook_breaker.record(response.status_code < 500, (time.perf_counter() - start) * 1000)
+                    webhook_logger.info("📥 Respuesta del webhook - Status: %s", response.status_code)
+                    if response.status_code == 200:
+                        break
+                    webhook_logger.error("❌ Error en webhook - Status: %s", response.status_code,
+                                         extra={'data': {'status': response.status_code, 'body': response.text}})
+                    retryable = response.status_code in RETRYABLE_STATUS
                 
-                return True
-            else:
-                print(f"❌ Error en webhook - Status: {response.status_code}")
-                print(f"📋 Respuesta: {response.text}")
-                return False
+                attempt += 1
+                delay = backoff_delay(attempt)
+                if not retryable or attempt > self.webhook_max_retries or time.monotonic() + delay >= deadline:
+                    # Solo lo que seguro no se procesó: el reenvío no puede duplicarlo
+                    if retryable:
+                        self._queue_webhook(webhook_data, parameters)
+                    return False
+                self.webhook_retries += 1
+                webhook_logger.warning("🔄 Reintentando el webhook en %.2f s (intento %d)", delay, attempt + 1)
+                time.sleep(delay)
+            
+            webhook_response = response.json()
+            webhook_logger.info("✅ Webhook procesó la reserva exitosamente", extra={'data': webhook_response})
+            
+            # Actualizar el texto de respuesta con la confirmación del webhook
+            webhook_text = parse_fulfillment_text(webhook_response)
+            if webhook_text is not None:
+                self.last_webhook_response = webhook_text
+                webhook_logger.info("💬 Nueva respuesta del webhook: %s", self.last_webhook_response)
+            
+            return True
                 
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Error de conexión con el webhook: {e}")
-            return False
         except Exception as e:
-            print(f"❌ Error inesperado llamando al webhook: {e}")
+            webhook_logger.exception("❌ Error inesperado llamando al webhook: %s", e)
             return False
     
+    def _reservation_slot(self, parameters):
+        """Franja de la reserva ('FechaReserva HoraReserva') de la que sale su clave"""
+        return f"{parameters.get('FechaReserva', '')} {parameters.get('HoraReserva', '')}"
+    
+    def _idempotency_key(self, parameters):
+        """Clave de idempotencia de la reserva (la misma en el webhook, el outbox y la ruta local)"""
+        return make_idempotency_key(
+            self.session_id,
+            parameters.get('TelefonReserva', ''),
+            self._reservation_slot(parameters)
+        )
+    
+    def _queue_webhook(self, webhook_data, parameters):
+        """Guarda la petición en el outbox (si está activado) para reenviarla más tarde a este webhook"""
+        if not self.webhook_outbox:
+            return
+        queue_reservation(webhook_data, self._reservation_slot(parameters), self.webhook_client, self.webhook_outbox)
+        self.last_webhook_queued = True
+    
+    def webhook_stats(self):
+        """
+        Métricas del webhook de reservas
+        
+        Returns:
+            dict: Estado y contadores del circuit breaker más 'retries' y,
+                con outbox, 'outbox' (pendientes, enviadas, descartadas...)
+        """
+        stats = self.webhook_breaker.stats()
+        stats['retries'] = self.webhook_retries
+        if self.webhook_outbox:
+            stats['outbox'] = self.webhook_outbox.stats()
+        return stats
+    
     def _format_parameters_for_webhook(self, parameters):
         """
         Formatea los parámetros para que coincidan con lo que espera el webhook
@@ -161,38 +273,39 @@ class VoiceReservationSystem:
         Returns:
             dict: Parámetros formateados para el webhook
         """
-        # Mapear los nombres de parámetros para que coincidan con el webhook
-        formatted_params = {}
-        
-        # Mapeo de parámetros (Dialogflow -> Webhook)
-        param_mapping = {
-            'NomReserva': 'nomreserva',
-            'TelefonReserva': 'telefonreserva', 
-            'FechaReserva': 'fechareserva',
-            'HoraReserva': 'horareserva',
-            'NumeroReserva': 'numeroreserva',
-            'Observacions': 'observacions'
-        }
-        
-        for dialogflow_param, webhook_param in param_mapping.items():
-            if dialogflow_param in parameters:
-                formatted_params[webhook_param] = parameters[dialogflow_param]
+        formatted_params = format_parameters(parameters)
         
-        print(f"🔄 Parámetros formateados: {json.dumps(formatted_params, indent=2)}")
+        webhook_logger.debug("🔄 Parámetros formateados", extra={'data': formatted_params})
         return formatted_params
 
+    def _reservation_failed_text(self, parameters):
+        """Respuesta al cliente cuando la reserva local no se ha podido guardar"""
+        hora_reserva = parameters.get('HoraReserva', '')
+        if self.last_suggested_slots is None:
+            return "Lo siento, no he podido guardar la reserva. Por favor, inténtelo de nuevo."
+        if not self.last_suggested_slots:
+            return f"Lo siento, a las {hora_reserva} no nos queda sitio y no hay otras horas libres ese día. ¿Quiere probar otra fecha?"
+        return (f"Lo siento, a las {hora_reserva} no nos queda sitio para {parameters.get('NumeroReserva', 1)} personas. "
+                f"Tengo disponible a las {', '.join(self.last_suggested_slots)}. ¿Cuál prefiere?")
+
     def _process_reservation(self, parameters):
         """
         Procesa una reserva y la guarda en la base de datos
         
+        Si no hay sitio, deja en last_suggested_slots las horas alternativas
+        para la respuesta al cliente.
+        
         Args:
             parameters (dict): Parámetros de la reserva
+            
+        Returns:
+            bool: True si la reserva se ha guardado (o aceptado para
+                escritura diferida)
         """
+        self.last_suggested_slots = None
         try:
-            # Conectar a la base de datos
-            if not self.database_handler.connect():
-                print("❌ Error conectando a la base de datos")
-                return False
+            # Las conexiones salen del pool de DatabaseHandler: no hay
+            # que conectar/desconectar en cada reserva
             
             # Extraer parámetros según tu estructura
             nom_reserva = parameters.get('NomReserva', '')
@@ -215,32 +328,107 @@ class VoiceReservationSystem:
             - Timestamp: {datetime.now().isoformat()}
             """
             
-            # Insertar cliente
-            if self.database_handler.insert_client(nom_reserva, telefon_reserva):
-                print("✅ Cliente insertado/actualizado")
+            # Comprobar capacidad antes de guardar (índice en memoria por día)
+            try:
+                fecha_hora = datetime.strptime(data_combinada, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                fecha_hora = None
+            
+            idempotency_key = self._idempotency_key(parameters)
+            # Reintento de una reserva aceptada que aún no se ha escrito
+            if self.reservation_writer and self.reservation_writer.is_pending(idempotency_key):
+                logger.info("♻️ Reserva ya aceptada para %s (reintento)", data_combinada)
+                return True
             
-            # Insertar reserva
-            reserva_id = self.database_handler.insert_reserva(
-                data=data_combinada,
-                numero_personas=numero_reserva,
-                telefon=telefon_reserva,
-                nom_persona_reserva=nom_reserva,
-                observacions="Reserva por voz - Speech to Text",
-                tota_la_conversa=conversacion
-            )
+            reservado = None
+            if fecha_hora:
+                try:
+                    disponible = self.availability.can_seat(fecha_hora, numero_reserva)
+                except Exception as e:
+                    # Igual que lib/capacity.js: si falla la comprobación, permitir la reserva
+                    logger.warning("⚠️ No se pudo comprobar la disponibilidad: %s", e)
+                    disponible = True
+                
+                if not disponible and self._already_booked(idempotency_key, data_combinada):
+                    return True
+                if not disponible:
+                    logger.warning("❌ Sin disponibilidad para %s personas el %s", numero_reserva, data_combinada)
+                    self.last_suggested_slots = self.availability.suggest_slots(
+                        fecha_hora.date(), fecha_hora, numero_reserva
+                    )
+                    if self.last_suggested_slots:
+                        logger.info("💡 Horarios alternativos: %s", ', '.join(self.last_suggested_slots))
+                    return False
+                
+                # El índice en memoria puede ir por detrás de otras llamadas
+                # simultáneas: tomar el sitio de forma atómica en MySQL
+                reservado = self.database_handler.reserve_if_available(fecha_hora, numero_reserva)
+                if reservado is False and self._already_booked(idempotency_key, data_combinada):
+                    return True
+                if reservado is False:
+                    logger.warning("❌ Otra reserva ha ocupado el tramo de las %s", hora_reserva)
+                    self.last_suggested_slots = self.availability.suggest_slots(
+                        fecha_hora.date(), fecha_hora, numero_reserva
+                    )
+                    return False
+            
+            reserva = {
+                'data_reserva': data_combinada,
+                'num_persones': numero_reserva,
+                'telefon': telefon_reserva,
+                'nom_persona_reserva': nom_reserva,
+                'observacions': "Reserva por voz - Speech to Text",
+                'conversa_completa': conversacion,
+                # Si el webhook respondió tarde o se reintenta, no duplicar
+                'idempotency_key': idempotency_key,
+                # La ocupación ya se sumó en reserve_if_available (si la
+                # reserva ya existía, book_reservation la devuelve)
+                'slot_reserved': bool(reservado)
+            }
+            
+            if self.reservation_writer:
+                # Confirmar en cuanto está en el journal local; MySQL se
+                # actualiza en segundo plano
+                entry_id = self.reservation_writer.submit(reserva)
+                if fecha_hora:
+                    self.availability.record(fecha_hora, numero_reserva)
+                logger.info("✅ Reserva aceptada para escritura diferida (%s)", entry_id)
+                return True
+            
+            # Cliente + reserva en una sola transacción (una ida y vuelta); con
+            # una clave ya registrada devuelve la reserva existente sin sumar ocupación
+            reserva_id, nueva = self.database_handler.book_reservation(**reserva, return_created=True)
             
             if reserva_id:
-                print(f"✅ Reserva guardada con ID: {reserva_id}")
+                if not nueva:
+                    logger.info("♻️ Reserva ya registrada con ID: %s (reintento)", reserva_id)
+                    return True
+                if fecha_hora:
+                    self.availability.record(fecha_hora, numero_reserva)
+                logger.info("✅ Reserva guardada con ID: %s", reserva_id)
                 return True
             else:
-                print("❌ Error guardando reserva")
+                logger.error("❌ Error guardando reserva")
+                if fecha_hora and reservado:
+                    self.database_handler.release_slot(fecha_hora, numero_reserva)
                 return False
                 
         except Exception as e:
-            print(f"❌ Error procesando reserva: {e}")
+            logger.error("❌ Error procesando reserva: %s", e)
+            return False
+    
+    def _already_booked(self, idempotency_key, data_combinada):
+        """
+        Indica si una reserva rechazada por capacidad es un reintento de una ya guardada
+        
+        Solo se consulta al rechazar (la propia reserva puede ser la que
+        llena el tramo); en el caso normal book_reservation ya distingue
+        un reintento de una reserva nueva.
+        """
+        if not self.database_handler.find_reserva_id(idempotency_key):
             return False
-        finally:
-            self.database_handler.disconnect()
+        logger.info("♻️ Reserva ya registrada para %s (reintento)", data_combinada)
+        return True
     
     def process_text_input(self, text, language="es-ES"):
         """
@@ -253,15 +441,15 @@ class VoiceReservationSystem:
         Returns:
             dict: Respuesta completa del sistema
         """
-        print(f"📝 Procesando texto: {text}")
+        logger.info("📝 Procesando texto: %s", text)
         
         # Enviar a Dialogflow CX
         dialogflow_response = self.dialogflow_client.detect_intent_from_text(
             text, language
         )
         
-        print(f"🎯 Intención: {dialogflow_response['intent_name']}")
-        print(f"📊 Confianza: {dialogflow_response['confidence']:.2f}")
+        logger.info("🎯 Intención: %s", dialogflow_response['intent_name'])
+        logger.info("📊 Confianza: %.2f", dialogflow_response['confidence'])
         
         # Procesar reserva si es necesario
         response_text = dialogflow_response['fulfillment_text']
@@ -270,10 +458,13 @@ class VoiceReservationSystem:
             webhook_success = self._call_webhook_for_reservation(dialogflow_response['parameters'])
             if webhook_success and hasattr(self, 'last_webhook_response'):
                 response_text = self.last_webhook_response
-                print(f"💬 Usando respuesta del webhook: {response_text}")
+                logger.info("💬 Usando respuesta del webhook: %s", response_text)
+            elif self.last_webhook_queued:
+                logger.warning("📮 Webhook no disponible: la reserva se enviará desde el outbox")
             elif not webhook_success:
-                print("⚠️ Webhook falló, procesando reserva localmente...")
-                self._process_reservation(dialogflow_response['parameters'])
+                logger.warning("⚠️ Webhook falló, procesando reserva localmente...")
+                if not self._process_reservation(dialogflow_response['parameters']):
+                    response_text = self._reservation_failed_text(dialogflow_response['parameters'])
         
         # Generar respuesta de voz
         response_audio = self.speech_handler.synthesize_speech(response_text, language)
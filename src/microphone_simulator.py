@@ -4,17 +4,23 @@ import wave
 import threading
 import time
 import os
-import json
+import uuid
 import requests
 from speech_handler import SpeechToTextHandler
 from dialogflow_client import DialogflowCXClient
-from database_handler import DatabaseHandler
+from database_handler import DatabaseHandler, make_idempotency_key
 from smart_reservation_detector import SmartReservationDetector
+from webhook_client import (build_payload, format_parameters, get_webhook_client, idempotency_headers,
+                            parse_fulfillment_text)
+from structured_logging import get_logger
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
+webhook_logger = get_logger('webhook')
+
+
 class MicrophoneSimulator:
     def __init__(self, webhook_url=None):
         """Simulador de llamada telefónica con micrófono"""
@@ -26,7 +32,10 @@ class MicrophoneSimulator:
         )
         self.database_handler = DatabaseHandler()
         self.webhook_url = webhook_url or os.getenv('WEBHOOK_URL', 'https://cronosai-webhook.vercel.app/api/webhook')
+        self.webhook_client = get_webhook_client(self.webhook_url)
         self.smart_detector = SmartReservationDetector(self.webhook_url)
+        # Identifica la llamada simulada en el webhook y en la clave de idempotencia
+        self.session_id = f"simulator-{uuid.uuid4().hex}"
         
         # Configuración de audio
         self.CHUNK = 1024
@@ -194,55 +203,52 @@ class MicrophoneSimulator:
             bool: True si el webhook procesó la reserva exitosamente, False si hubo error
         """
         try:
-            print("🌐 Llamando al webhook para procesar reserva...")
-            print(f"🔗 Webhook URL: {self.webhook_url}")
+            webhook_logger.info("🌐 Llamando al webhook para procesar reserva...")
+            webhook_logger.debug("🔗 Webhook URL: %s", self.webhook_url)
             
             # Preparar datos para el webhook en el formato esperado
-            webhook_data = {
-                "sessionInfo": {
-                    "session": "simulator-session",
-                    "parameters": self._format_parameters_for_webhook(parameters)
-                },
-                "languageCode": "es-ES"
-            }
+            webhook_data = build_payload(self.session_id, self._format_parameters_for_webhook(parameters))
             
-            print(f"📤 Enviando datos al webhook: {json.dumps(webhook_data, indent=2)}")
+            webhook_logger.debug("📤 Enviando datos al webhook", extra={'data': webhook_data})
             
-            # Llamar al webhook
-            response = requests.post(
-                self.webhook_url,
-                json=webhook_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
+            # Llamar al webhook (con la misma clave que process_reservation)
+            response = self.webhook_client.post(
+                webhook_data, headers=idempotency_headers(self._idempotency_key(parameters))
             )
             
-            print(f"📥 Respuesta del webhook - Status: {response.status_code}")
+            webhook_logger.info("📥 Respuesta del webhook - Status: %s", response.status_code)
             
             if response.status_code == 200:
                 webhook_response = response.json()
-                print(f"✅ Webhook procesó la reserva exitosamente")
-                print(f"📋 Respuesta del webhook: {json.dumps(webhook_response, indent=2)}")
+                webhook_logger.info("✅ Webhook procesó la reserva exitosamente", extra={'data': webhook_response})
                 
                 # Actualizar el texto de respuesta con la confirmación del webhook
-                if 'fulfillment_response' in webhook_response:
-                    messages = webhook_response['fulfillment_response'].get('messages', [])
-                    if messages and 'text' in messages[0]:
-                        self.last_webhook_response = messages[0]['text']['text']
-                        print(f"💬 Nueva respuesta del webhook: {self.last_webhook_response}")
+                webhook_text = parse_fulfillment_text(webhook_response)
+                if webhook_text is not None:
+                    self.last_webhook_response = webhook_text
+                    webhook_logger.info("💬 Nueva respuesta del webhook: %s", self.last_webhook_response)
                 
                 return True
             else:
-                print(f"❌ Error en webhook - Status: {response.status_code}")
-                print(f"📋 Respuesta: {response.text}")
+                webhook_logger.error("❌ Error en webhook - Status: %s", response.status_code,
+                                     extra={'data': {'status': response.status_code, 'body': response.text}})
                 return False
                 
         except requests.exceptions.RequestException as e:
-            print(f"❌ Error de conexión con el webhook: {e}")
+            webhook_logger.error("❌ Error de conexión con el webhook: %s", e)
             return False
         except Exception as e:
-            print(f"❌ Error inesperado llamando al webhook: {e}")
+            webhook_logger.exception("❌ Error inesperado llamando al webhook: %s", e)
             return False
     
+    def _idempotency_key(self, parameters):
+        """Clave de idempotencia de la reserva (la misma en el webhook y en la base de datos)"""
+        return make_idempotency_key(
+            self.session_id,
+            parameters.get('TelefonReserva', ''),
+            f"{parameters.get('FechaReserva', '')} {parameters.get('HoraReserva', '')}"
+        )
+    
     def _format_parameters_for_webhook(self, parameters):
         """
         Formatea los parámetros para que coincidan con lo que espera el webhook
@@ -253,49 +259,32 @@ class MicrophoneSimulator:
         Returns:
             dict: Parámetros formateados para el webhook
         """
-        # Mapear los nombres de parámetros para que coincidan con el webhook
-        formatted_params = {}
-        
-        # Mapeo de parámetros (Dialogflow -> Webhook)
-        param_mapping = {
-            'NomReserva': 'nomreserva',
-            'TelefonReserva': 'telefonreserva', 
-            'FechaReserva': 'fechareserva',
-            'HoraReserva': 'horareserva',
-            'NumeroReserva': 'numeroreserva',
-            'Observacions': 'observacions'
-        }
+        formatted_params = format_parameters(parameters)
         
-        for dialogflow_param, webhook_param in param_mapping.items():
-            if dialogflow_param in parameters:
-                formatted_params[webhook_param] = parameters[dialogflow_param]
-        
-        print(f"🔄 Parámetros formateados: {json.dumps(formatted_params, indent=2)}")
+        webhook_logger.debug("🔄 Parámetros formateados", extra={'data': formatted_params})
         return formatted_params
 
     def process_reservation(self, parameters):
         """Procesa una reserva"""
         try:
-            if self.database_handler.connect():
-                # Insertar cliente
-                self.database_handler.insert_client(
-                    parameters.get('NomReserva', ''),
-                    parameters.get('TelefonReserva', '')
-                )
-                
-                # Insertar reserva
-                self.database_handler.insert_reserva(
-                    data_reserva=f"{parameters.get('FechaReserva', '')} {parameters.get('HoraReserva', '')}",
-                    num_persones=parameters.get('NumeroReserva', 1),
-                    telefon=parameters.get('TelefonReserva', ''),
-                    nom_persona_reserva=parameters.get('NomReserva', ''),
-                    observacions="Reserva por simulación de llamada",
-                    conversa_completa=f"Simulación: {parameters}"
-                )
-                
-                self.database_handler.disconnect()
-                print("✅ Reserva guardada en la base de datos")
-                return True
+            data_reserva = f"{parameters.get('FechaReserva', '')} {parameters.get('HoraReserva', '')}"
+            
+            # Cliente + reserva en una sola transacción
+            reserva_id = self.database_handler.book_reservation(
+                data_reserva=data_reserva,
+                num_persones=parameters.get('NumeroReserva', 1),
+                telefon=parameters.get('TelefonReserva', ''),
+                nom_persona_reserva=parameters.get('NomReserva', ''),
+                observacions="Reserva por simulación de llamada",
+                conversa_completa=f"Simulación: {parameters}",
+                idempotency_key=self._idempotency_key(parameters)
+            )
+            
+            if not reserva_id:
+                return False
+            
+            print("✅ Reserva guardada en la base de datos")
+            return True
         except Exception as e:
             print(f"❌ Error procesando reserva: {e}")
             return False
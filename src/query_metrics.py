@@ -0,0 +1,121 @@
+# src/query_metrics.py
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from structured_logging import get_logger
+
+logger = get_logger('database')
+
+
+def redact(params):
+    """
+    Oculta los valores de los parámetros de una consulta para el log
+
+    Solo se conserva el tipo y la longitud (teléfonos, nombres y
+    conversaciones no deben acabar en los logs).
+    """
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [redact(value) for value in params]
+    if isinstance(params, str):
+        return f"<str:{len(params)}>"
+    return f"<{type(params).__name__}>"
+
+
+def _percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+class QueryMetrics:
+    def __init__(self, slow_threshold_ms=None, window=None):
+        """
+        Tiempos por operación de DatabaseHandler y log de consultas lentas
+
+        Args:
+            slow_threshold_ms (float): Umbral del log de consultas lentas
+                (DB_SLOW_QUERY_MS, 0 = desactivado)
+            window (int): Muestras recientes guardadas por operación para
+                calcular percentiles (DB_METRICS_WINDOW)
+        """
+        self.slow_threshold_ms = float(
+            slow_threshold_ms if slow_threshold_ms is not None else os.getenv('DB_SLOW_QUERY_MS', 200)
+        )
+        self.window = int(window or os.getenv('DB_METRICS_WINDOW', 1024))
+        self._ops = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, operation, query=None, params=None):
+        """
+        Mide lo que tarda el bloque y lo registra bajo `operation`
+
+        Las ejecuciones que fallan también se registran (como errores).
+        """
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record(operation, time.perf_counter() - start, query, params, failed)
+
+    def record(self, operation, seconds, query=None, params=None, failed=False):
+        elapsed_ms = seconds * 1000
+        with self._lock:
+            op = self._ops.get(operation)
+            if op is None:
+                op = {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow': 0,
+                      'samples': deque(maxlen=self.window)}
+                self._ops[operation] = op
+            op['count'] += 1
+            op['total_ms'] += elapsed_ms
+            op['max_ms'] = max(op['max_ms'], elapsed_ms)
+            op['samples'].append(elapsed_ms)
+            if failed:
+                op['errors'] += 1
+            slow = 0 < self.slow_threshold_ms <= elapsed_ms
+            if slow:
+                op['slow'] += 1
+
+        if slow:
+            statement = ' '.join(query.split()) if query else ''
+            logger.warning("🐢 Consulta lenta [%s] %.1f ms: %s params=%s", operation, elapsed_ms, statement, redact(params),
+                           extra={'data': {'operation': operation, 'elapsed_ms': elapsed_ms}})
+
+    def stats(self):
+        """
+        Foto de las métricas por operación
+
+        Returns:
+            dict: {operación: {count, errors, slow, avg_ms, p50_ms, p95_ms, p99_ms, max_ms}}
+        """
+        with self._lock:
+            snapshot = {name: (dict(op), sorted(op['samples'])) for name, op in self._ops.items()}
+
+        result = {}
+        for name, (op, samples) in snapshot.items():
+            result[name] = {
+                'count': op['count'],
+                'errors': op['errors'],
+                'slow': op['slow'],
+                'avg_ms': op['total_ms'] / op['count'] if op['count'] else 0.0,
+                'p50_ms': _percentile(samples, 0.50),
+                'p95_ms': _percentile(samples, 0.95),
+                'p99_ms': _percentile(samples, 0.99),
+                'max_ms': op['max_ms']
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._ops.clear()
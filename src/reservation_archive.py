@@ -0,0 +1,282 @@
+# src/reservation_archive.py
+"""
+Mantenimiento de RESERVA: archivado mensual de reservas antiguas
+
+Las reservas con data_reserva anterior a la ventana de retención se mueven
+a RESERVA_ARCHIVO (particionada por mes, ver
+database/create-reserva-archivo-table.sql) en bloques pequeños con pausas,
+para no bloquear la tabla que atiende las reservas en vivo.
+DatabaseHandler.get_reservas_by_telefon(include_archive=True) las sigue
+encontrando cuando se piden.
+
+Uso:
+    python src/reservation_archive.py [meses_retención] [tamaño_bloque] [pausa_segundos]
+"""
+
+import os
+import sys
+import time
+from datetime import date, datetime
+from mysql.connector import Error
+from structured_logging import get_logger
+
+logger = get_logger('archive')
+
+CREATE_TABLE_SQL = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'create-reserva-archivo-table.sql'
+)
+
+ARCHIVE_COLUMNS = (
+    'id_reserva',
+    'data_reserva',
+    'num_persones',
+    'telefon',
+    'nom_persona_reserva',
+    'observacions',
+    'conversa_completa',
+    'idempotency_key'
+)
+
+
+def month_start(day, months_back=0):
+    """Primer día del mes de `day` menos `months_back` meses"""
+    index = day.year * 12 + (day.month - 1) - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def next_month(day):
+    return month_start(day, -1)
+
+
+class ReservationArchiver:
+    def __init__(self, database_handler, retention_months=None, chunk_size=None, pause=None):
+        """
+        Archivador de reservas antiguas
+
+        Args:
+            database_handler (DatabaseHandler): Acceso a la base de datos
+            retention_months (int): Meses completos que se quedan en RESERVA
+                además del actual (RESERVA_RETENTION_MONTHS)
+            chunk_size (int): Reservas movidas por transacción (ARCHIVE_CHUNK_SIZE)
+            pause (float): Segundos de pausa entre bloques (ARCHIVE_PAUSE)
+        """
+        self.db = database_handler
+        self.retention_months = int(
+            retention_months if retention_months is not None else os.getenv('RESERVA_RETENTION_MONTHS', 12)
+        )
+        self.chunk_size = int(chunk_size or os.getenv('ARCHIVE_CHUNK_SIZE', 500))
+        self.pause = float(pause if pause is not None else os.getenv('ARCHIVE_PAUSE', 0.2))
+
+    def cutoff(self, today=None):
+        """Fecha a partir de la cual las reservas se quedan en RESERVA"""
+        return month_start(today or date.today(), self.retention_months)
+
+    def _execute(self, query, params=()):
+        with self.db.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                with self.db.metrics.timed('archive', query, params):
+                    cursor.execute(query, params)
+                    return cursor.fetchall() if cursor.with_rows else None
+            finally:
+                cursor.close()
+
+    def create_table(self):
+        """Crea RESERVA_ARCHIVO si no existe (en SQLite ya viene en el esquema)"""
+        if self.db.backend == 'sqlite':
+            return
+        with open(CREATE_TABLE_SQL, encoding='utf-8') as f:
+            sql = f.read()
+        start = sql.index('CREATE TABLE')
+        self._execute(sql[start:sql.index(';', start)])
+
+    def partitions(self):
+        """
+        Particiones mensuales existentes de RESERVA_ARCHIVO
+
+        Returns:
+            list: Nombres pYYYYMM ordenados (sin pmax)
+        """
+        rows = self._execute(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'RESERVA_ARCHIVO' "
+            "AND PARTITION_NAME IS NOT NULL"
+        )
+        return sorted(name for (name,) in rows or () if name != 'pmax')
+
+    def ensure_partitions(self, first_month, last_month):
+        """
+        Añade las particiones mensuales que falten hasta `last_month`
+
+        Las particiones nuevas se separan de pmax con REORGANIZE PARTITION,
+        así que solo se pueden añadir meses posteriores al último existente.
+
+        Returns:
+            list: Particiones creadas
+        """
+        if self.db.backend == 'sqlite':
+            return []
+
+        existing = self.partitions()
+        month = first_month
+        if existing:
+            last = existing[-1]
+            month = max(month, next_month(date(int(last[1:5]), int(last[5:7]), 1)))
+
+        created = []
+        while month <= last_month:
+            name = f"p{month.year:04d}{month.month:02d}"
+            self._execute(
+                f"ALTER TABLE RESERVA_ARCHIVO REORGANIZE PARTITION pmax INTO ("
+                f"PARTITION {name} VALUES LESS THAN ('{next_month(month).isoformat()}'), "
+                f"PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+            )
+            created.append(name)
+            month = next_month(month)
+
+        if created:
+            logger.info("✅ Particiones creadas en RESERVA_ARCHIVO: %s", ', '.join(created))
+        return created
+
+    def drop_partitions(self, before):
+        """
+        Borra del archivo los meses completos anteriores a `before`
+
+        DROP PARTITION libera el espacio al instante, sin DELETE fila a fila.
+
+        Returns:
+            list: Particiones borradas
+        """
+        if self.db.backend == 'sqlite':
+            self._execute("DELETE FROM RESERVA_ARCHIVO WHERE data_reserva < %s", (before,))
+            return []
+
+        limit = f"p{before.year:04d}{before.month:02d}"
+        dropped = [name for name in self.partitions() if name < limit]
+        if dropped:
+            self._execute(f"ALTER TABLE RESERVA_ARCHIVO DROP PARTITION {', '.join(dropped)}")
+            logger.info("🗑️ Particiones borradas de RESERVA_ARCHIVO: %s", ', '.join(dropped))
+        return dropped
+
+    def archive(self, today=None, max_rows=None):
+        """
+        Mueve a RESERVA_ARCHIVO las reservas anteriores a la retención
+
+        Cada bloque es una transacción: se bloquean hasta `chunk_size`
+        reservas, se copian al archivo junto con su conversación
+        comprimida y se borran de RESERVA (RESERVA_CONVERSA se borra en
+        cascada). Entre bloques se hace una pausa. Se puede interrumpir y
+        volver a lanzar en cualquier momento.
+
+        Args:
+            today (date): Fecha de referencia (por defecto hoy)
+            max_rows (int): Máximo de reservas a mover en esta ejecución
+
+        Returns:
+            int: Reservas archivadas, None si error
+        """
+        cutoff = self.cutoff(today)
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        source_columns = ', '.join(f"r.{column}" for column in ARCHIVE_COLUMNS)
+
+        select_query = """
+        SELECT id_reserva FROM RESERVA
+        WHERE data_reserva < %s
+        ORDER BY id_reserva
+        LIMIT %s
+        FOR UPDATE
+        """
+
+        try:
+            self.create_table()
+            oldest = self._execute("SELECT MIN(data_reserva) FROM RESERVA WHERE data_reserva < %s", (cutoff,))
+            if not oldest or oldest[0][0] is None:
+                logger.info("✅ No hay reservas anteriores a %s que archivar", cutoff)
+                return 0
+            first = oldest[0][0]
+            if isinstance(first, str):
+                first = datetime.strptime(first[:10], "%Y-%m-%d")
+            self.ensure_partitions(month_start(first), month_start(cutoff, 1))
+
+            archived = 0
+            while max_rows is None or archived < max_rows:
+                limit = self.chunk_size if max_rows is None else min(self.chunk_size, max_rows - archived)
+                with self.db.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        conn.start_transaction()
+                        with self.db.metrics.timed('archive.lock', select_query, (cutoff, limit)):
+                            cursor.execute(select_query, (cutoff, limit))
+                            ids = [row[0] for row in cursor.fetchall()]
+                        if not ids:
+                            conn.commit()
+                            break
+
+                        placeholders = ', '.join(['%s'] * len(ids))
+                        query = f"""
+                        INSERT INTO RESERVA_ARCHIVO ({columns}, conversa)
+                        SELECT {source_columns}, c.conversa
+                        FROM RESERVA r
+                        LEFT JOIN RESERVA_CONVERSA c ON c.id_reserva = r.id_reserva
+                        WHERE r.id_reserva IN ({placeholders})
+                        """
+                        with self.db.metrics.timed('archive.copy', query, ids):
+                            cursor.execute(query, ids)
+
+                        query = f"DELETE FROM RESERVA WHERE id_reserva IN ({placeholders})"
+                        with self.db.metrics.timed('archive.delete', query, ids):
+                            cursor.execute(query, ids)
+                        conn.commit()
+                    except Error:
+                        conn.rollback()
+                        raise
+                    finally:
+                        cursor.close()
+
+                archived += len(ids)
+                logger.info("   %s reservas archivadas (hasta id_reserva %s)", archived, ids[-1])
+
+                # No saturar la base de datos que atiende las reservas en vivo
+                time.sleep(self.pause)
+
+            # La ocupación de días ya archivados no se vuelve a consultar
+            self._execute("DELETE FROM OCUPACION_TRAMO WHERE fecha < %s", (month_start(cutoff, 1),))
+
+        except Error as e:
+            logger.error("❌ Error archivando reservas: %s", e)
+            return None
+
+        # Las listas cacheadas por teléfono pueden contener reservas archivadas
+        self.db.reservas_cache.clear()
+        logger.info("✅ Archivado completado: %s reservas anteriores a %s", archived, cutoff)
+        return archived
+
+
+def main():
+    from dotenv import load_dotenv
+    from database_handler import DatabaseHandler
+
+    # Cargar variables de entorno
+    load_dotenv()
+
+    retention_months = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    pause = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    print("ARCHIVADO DE RESERVAS ANTIGUAS (RESERVA_ARCHIVO)")
+    print("=" * 50)
+
+    db = DatabaseHandler()
+    if not db.connect():
+        return
+
+    try:
+        archiver = ReservationArchiver(db, retention_months, chunk_size, pause)
+        print(f"📅 Se archivan las reservas anteriores a {archiver.cutoff()}")
+        archiver.archive()
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# src/reservation_cache.py
+import os
+import re
+import time
+import threading
+from itertools import count
+from collections import OrderedDict
+
+
+def normalize_phone(telefon):
+    """
+    Normaliza un teléfono para compararlo (claves de idempotencia)
+
+    Se quedan solo los dígitos y el '+' inicial, así que
+    "+49 123-456" y "+49123456" se consideran el mismo teléfono.
+    """
+    telefon = str(telefon or '').strip()
+    digits = re.sub(r'\D', '', telefon)
+    return f"+{digits}" if telefon.startswith('+') else digits
+
+
+class ReservationCache:
+    def __init__(self, max_entries=None, ttl=None):
+        """
+        Caché LRU con caducidad (TTL) de reservas por teléfono
+
+        La clave es el teléfono tal cual se usa en la consulta (WHERE
+        telefon = %s), sin normalizar: "+49 123" y "+49123" son filas
+        distintas en RESERVA y también entradas distintas aquí.
+
+        Para que una lectura lenta no vuelva a guardar datos anteriores a
+        una invalidación, quien consulta la base de datos pide antes
+        generation() y la pasa a put(): si el teléfono se invalidó entre
+        medias, put() no guarda nada.
+
+        Args:
+            max_entries (int): Teléfonos guardados como máximo (RESERVAS_CACHE_SIZE)
+            ttl (float): Segundos de validez de cada entrada (RESERVAS_CACHE_TTL)
+        """
+        self.max_entries = int(max_entries or os.getenv('RESERVAS_CACHE_SIZE', 1024))
+        self.ttl = float(ttl if ttl is not None else os.getenv('RESERVAS_CACHE_TTL', 30))
+
+        self._entries = OrderedDict()
+        # id_reserva -> teléfono, para invalidar por ID
+        self._phone_by_id = {}
+        # teléfono -> generación de su última invalidación (acotado; lo
+        # que se descarta se recuerda en _pruned_generation)
+        self._invalidated = OrderedDict()
+        self._pruned_generation = 0
+        self._generations = count(1)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, telefon):
+        """
+        Devuelve las reservas cacheadas de un teléfono
+
+        Returns:
+            list: Copia de las reservas (también de cada dict), None si no
+                hay entrada válida
+        """
+        key = str(telefon)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, reservas = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(reserva) for reserva in reservas]
+
+    def generation(self):
+        """Generación actual; pedirla antes de consultar la base de datos para pasarla a put()"""
+        with self._lock:
+            return self._generation
+
+    def put(self, telefon, reservas, generation=None):
+        """
+        Guarda las reservas de un teléfono, expulsando la entrada menos usada si hace falta
+
+        Args:
+            telefon (str): Teléfono usado en la consulta
+            reservas (list): Filas leídas
+            generation (int): Valor de generation() antes de la consulta; si
+                el teléfono se invalidó después, las filas pueden ser
+                anteriores a la escritura y no se guardan
+        """
+        if self.ttl <= 0:
+            return
+        key = str(telefon)
+        with self._lock:
+            if generation is not None and self._invalidated_since(key, generation):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, [dict(reserva) for reserva in reservas])
+            for reserva in reservas:
+                if 'id_reserva' in reserva:
+                    self._phone_by_id[reserva['id_reserva']] = key
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, telefon):
+        """Elimina la entrada de un teléfono tras escribir una reserva suya"""
+        key = str(telefon)
+        with self._lock:
+            self._mark_invalidated(key)
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_reserva(self, reserva_id):
+        """
+        Elimina la entrada del teléfono al que pertenece una reserva
+
+        Si la reserva no está en ninguna entrada cacheada no hay nada
+        que invalidar.
+        """
+        with self._lock:
+            key = self._phone_by_id.get(reserva_id)
+            if key is not None:
+                self._mark_invalidated(key)
+            if key is not None and key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._phone_by_id.clear()
+            # Todo lo que se esté leyendo ahora puede ser anterior al borrado
+            self._generation = next(self._generations)
+            self._invalidated.clear()
+            self._pruned_generation = self._generation
+
+    def _mark_invalidated(self, key):
+        self._generation = next(self._generations)
+        self._invalidated[key] = self._generation
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_entries:
+            _, generation = self._invalidated.popitem(last=False)
+            self._pruned_generation = max(self._pruned_generation, generation)
+
+    def _invalidated_since(self, key, generation):
+        # Si el registro del teléfono ya se descartó, se asume invalidado
+        return (self._invalidated.get(key, 0) > generation
+                or self._pruned_generation > generation)
+
+    def _remove(self, key):
+        _, reservas = self._entries.pop(key)
+        for reserva in reservas:
+            self._phone_by_id.pop(reserva.get('id_reserva'), None)
+
+    def stats(self):
+        """Contadores para dimensionar la caché"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
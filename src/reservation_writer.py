@@ -0,0 +1,242 @@
+# src/reservation_writer.py
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from structured_logging import get_logger
+
+logger = get_logger('database')
+
+
+class ReservationWriter:
+    def __init__(self, database_handler, journal_path=None, batch_size=None, flush_interval=None, max_attempts=None):
+        """
+        Escritor diferido (write-behind) de reservas
+
+        Las reservas se aceptan en una cola en memoria respaldada por un
+        journal local de solo-anexado (con fsync), y un hilo en segundo
+        plano las vuelca a MySQL en lotes con insert_reservas_bulk. Si el
+        proceso se reinicia, las reservas del journal que no se confirmaron
+        se vuelven a encolar.
+
+        Args:
+            database_handler (DatabaseHandler): Acceso a la base de datos
+            journal_path (str): Ruta del journal (RESERVATION_JOURNAL_PATH)
+            batch_size (int): Máximo de reservas por lote (RESERVATION_BATCH_SIZE)
+            flush_interval (float): Segundos máximos de espera para completar
+                un lote (RESERVATION_FLUSH_INTERVAL)
+            max_attempts (int): Intentos antes de descartar una reserva
+                cuyos datos rechaza MySQL (RESERVATION_MAX_ATTEMPTS); las
+                caídas de conexión se reintentan sin límite
+        """
+        self.database_handler = database_handler
+        self.journal_path = journal_path or os.getenv('RESERVATION_JOURNAL_PATH', 'logs/reservation_journal.jsonl')
+        self.batch_size = int(batch_size or os.getenv('RESERVATION_BATCH_SIZE', 50))
+        self.flush_interval = float(flush_interval or os.getenv('RESERVATION_FLUSH_INTERVAL', 1.0))
+        self.max_attempts = int(max_attempts or os.getenv('RESERVATION_MAX_ATTEMPTS', 10))
+
+        self._queue = queue.Queue()
+        # Claves de idempotencia aceptadas que aún no se han escrito
+        self._pending_keys = set()
+        self._journal_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._retry_delay = self.flush_interval
+
+        journal_dir = os.path.dirname(self.journal_path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+
+        pending = self._replay_journal()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        for entry in pending:
+            self._pending_keys.add(entry['reserva'].get('idempotency_key'))
+            self._queue.put(entry)
+        if pending:
+            logger.info("🔁 %s reservas pendientes recuperadas del journal", len(pending))
+
+        self._thread = threading.Thread(target=self._run, name='reservation-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, reserva):
+        """
+        Acepta una reserva para escritura diferida
+
+        La reserva queda persistida en el journal local antes de volver,
+        así que se puede confirmar al cliente sin esperar a MySQL.
+
+        Args:
+            reserva (dict): Mismas claves que DatabaseHandler.insert_reserva
+
+        Returns:
+            str: Identificador de la entrada en el journal
+
+        Raises:
+            RuntimeError: Si el escritor ya está cerrado (la reserva no se acepta)
+        """
+        if self._stop.is_set():
+            raise RuntimeError("El escritor de reservas está cerrado")
+        entry_id = uuid.uuid4().hex
+        # Sin clave propia se usa la de la entrada: si el proceso cae entre la
+        # escritura en MySQL y el 'ack', la reproducción no duplica la reserva
+        reserva = dict(reserva, idempotency_key=reserva.get('idempotency_key') or entry_id)
+        entry = {'id': entry_id, 'reserva': reserva, 'attempts': 0}
+        self._append({'op': 'put', 'id': entry['id'], 'reserva': reserva, 'ts': time.time()})
+        self._pending_keys.add(reserva['idempotency_key'])
+        self._queue.put(entry)
+        return entry['id']
+
+    def pending(self):
+        """Número de reservas aceptadas que aún no se han escrito en MySQL"""
+        return self._queue.qsize()
+
+    def is_pending(self, idempotency_key):
+        """Indica si una reserva con esa clave está aceptada pero aún no escrita"""
+        return idempotency_key in self._pending_keys
+
+    def close(self, timeout=10):
+        """
+        Detiene el hilo escritor tras intentar vaciar la cola
+
+        Lo que no se llegue a escribir sigue en el journal y se recupera
+        en el siguiente arranque. El journal lo cierra el propio hilo al
+        terminar: si el último volcado tarda más de `timeout`, sigue
+        escribiendo en segundo plano.
+        """
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("⚠️ El escritor de reservas sigue volcando tras %s s; el journal se cerrará al terminar", timeout)
+
+    def _append(self, record):
+        """Añade un registro al journal y fuerza su escritura a disco"""
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._journal_lock:
+            # submit() justo mientras se cierra: el hilo escritor ya cerró el journal
+            if self._journal.closed:
+                raise RuntimeError("El escritor de reservas está cerrado")
+            self._journal.write(line + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def _replay_journal(self):
+        """
+        Lee el journal, devuelve las entradas sin confirmar y lo compacta
+        para que solo contenga esas entradas
+        """
+        if not os.path.exists(self.journal_path):
+            return []
+
+        entries = {}
+        with open(self.journal_path, 'r', encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última línea a medio escribir tras una caída
+                    continue
+                if record.get('op') == 'put':
+                    entries[record['id']] = {'id': record['id'], 'reserva': record['reserva'], 'attempts': 0}
+                elif record.get('op') in ('ack', 'dead'):
+                    entries.pop(record.get('id'), None)
+
+        pending = list(entries.values())
+
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as journal:
+            for entry in pending:
+                journal.write(json.dumps({'op': 'put', 'id': entry['id'], 'reserva': entry['reserva']}, ensure_ascii=False, default=str) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+        return pending
+
+    def _next_batch(self):
+        """Espera a la primera reserva y recoge las siguientes hasta completar el lote"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        try:
+            self._write_loop()
+        finally:
+            with self._journal_lock:
+                self._journal.close()
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    # No perder el hilo escritor: las entradas siguen en el journal
+                    logger.error("❌ Error inesperado en el escritor de reservas: %s", e)
+                    for entry in batch:
+                        self._queue.put(entry)
+                    self._stop.wait(self._retry_delay)
+
+        # Último intento al cerrar: lo que falle se queda en el journal
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._flush(batch, requeue=False)
+
+    def _flush(self, batch, requeue=True):
+        """Escribe un lote en MySQL y registra el resultado en el journal"""
+        report = self.database_handler.insert_reservas_bulk(
+            [entry['reserva'] for entry in batch],
+            chunk_size=self.batch_size
+        )
+        failed = dict(report['failed'])
+        transient = set(report.get('transient', ()))
+
+        for index, entry in enumerate(batch):
+            if index not in failed:
+                self._append({'op': 'ack', 'id': entry['id']})
+                self._pending_keys.discard(entry['reserva'].get('idempotency_key'))
+                continue
+
+            if not requeue:
+                continue
+
+            # MySQL caído o bloqueado: la reserva ya está confirmada al
+            # cliente, así que se reintenta sin límite; solo los errores de
+            # la propia fila cuentan para max_attempts
+            if index in transient:
+                self._queue.put(entry)
+                continue
+
+            entry['attempts'] += 1
+            if entry['attempts'] >= self.max_attempts:
+                logger.error("❌ Reserva %s descartada tras %s intentos: %s", entry['id'], entry['attempts'], failed[index])
+                self._append({'op': 'dead', 'id': entry['id'], 'error': failed[index]})
+                self._pending_keys.discard(entry['reserva'].get('idempotency_key'))
+            else:
+                self._queue.put(entry)
+
+        if failed and requeue:
+            # MySQL lento o caído: esperar antes de reintentar (con tope)
+            self._stop.wait(self._retry_delay)
+            self._retry_delay = min(self._retry_delay * 2, 60)
+        else:
+            self._retry_delay = self.flush_interval
@@ -0,0 +1,102 @@
+# src/restaurant_config.py
+import os
+import time
+from mysql.connector import Error
+
+# Cache de configuración (se actualiza cada 5 minutos), igual que config/restaurant-config.js
+CACHE_DURATION = 5 * 60
+_config_cache = None
+_cache_timestamp = None
+
+DEFAULTS = {
+    'capacidad_maxima': 100,
+    'duracion_reserva_minutos': 120,
+    'ventana_solapamiento': 30,
+    'buffer_capacidad': 10,
+    'horario_apertura': '12:00',
+    'horario_cierre': '23:00',
+    'lunch_start': '13:00',
+    'lunch_end': '15:00',
+    'dinner_start': '19:00',
+    'dinner_end': '23:00',
+    'max_personas_mesa': 20,
+    'min_personas': 1,
+    'min_antelacion_horas': 2
+}
+
+# Variables de entorno con prioridad sobre la base de datos (mismas que en JS)
+ENV_OVERRIDES = {
+    'capacidad_maxima': 'RESTAURANT_CAPACITY',
+    'duracion_reserva_minutos': 'RESERVATION_DURATION',
+    'ventana_solapamiento': 'OVERLAP_WINDOW',
+    'buffer_capacidad': 'RESTAURANT_BUFFER',
+    'horario_apertura': 'RESTAURANT_OPEN',
+    'horario_cierre': 'RESTAURANT_CLOSE',
+    'lunch_start': 'RESTAURANT_LUNCH_START',
+    'lunch_end': 'RESTAURANT_LUNCH_END',
+    'dinner_start': 'RESTAURANT_DINNER_START',
+    'dinner_end': 'RESTAURANT_DINNER_END',
+    'max_personas_mesa': 'MAX_PEOPLE_PER_RESERVATION',
+    'min_personas': 'MIN_PEOPLE',
+    'min_antelacion_horas': 'MIN_ADVANCE_HOURS'
+}
+
+
+def _time_to_hhmm(value):
+    """Convierte un TIME de MySQL (timedelta o str) a 'HH:MM'"""
+    if value is None:
+        return None
+    if hasattr(value, 'total_seconds'):
+        minutes = int(value.total_seconds()) // 60
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+    return str(value)[:5]
+
+
+def get_restaurant_config(database_handler=None, force_reload=False):
+    """
+    Obtiene la configuración del restaurante
+
+    Prioridad: Variables de entorno > tabla configuracion > Valores por defecto
+
+    Args:
+        database_handler (DatabaseHandler): Acceso a la base de datos (opcional)
+        force_reload (bool): Ignorar la caché
+
+    Returns:
+        dict: Configuración con las claves de DEFAULTS
+    """
+    global _config_cache, _cache_timestamp
+
+    if (not force_reload and _config_cache is not None
+            and time.monotonic() - _cache_timestamp < CACHE_DURATION):
+        return _config_cache
+
+    db_config = {}
+    if database_handler is not None:
+        try:
+            with database_handler.pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    cursor.execute(
+                        "SELECT * FROM configuracion WHERE restaurant_id = %s OR restaurant_id IS NULL LIMIT 1",
+                        (int(os.getenv('RESTAURANT_ID', 1)),)
+                    )
+                    db_config = cursor.fetchone() or {}
+                finally:
+                    cursor.close()
+        except Error:
+            # Si la tabla no existe o hay error, usar valores por defecto
+            db_config = {}
+
+    config = {}
+    for key, default in DEFAULTS.items():
+        value = os.getenv(ENV_OVERRIDES[key]) or db_config.get(key) or default
+        if isinstance(default, int):
+            value = int(value)
+        else:
+            value = _time_to_hhmm(value)
+        config[key] = value
+
+    _config_cache = config
+    _cache_timestamp = time.monotonic()
+    return config
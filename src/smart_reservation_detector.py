@@ -4,13 +4,23 @@ Detector inteligente de reservas que bypasea Dialogflow CX
 """
 
 import re
-import requests
 import json
+import uuid
+import requests
 from datetime import datetime, timedelta
+from webhook_client import (RETRYABLE_STATUS, build_payload, get_webhook_client, idempotency_headers,
+                            parse_fulfillment_text, request_not_delivered)
+from webhook_outbox import queue_reservation, reservation_key
+from structured_logging import get_logger
+
+logger = get_logger('webhook')
 
 class SmartReservationDetector:
     def __init__(self, webhook_url):
         self.webhook_url = webhook_url
+        self.webhook_client = get_webhook_client(webhook_url)
+        # Identifica al detector en el webhook y en la clave de idempotencia
+        self.session_id = f"smart-detector-{uuid.uuid4().hex}"
         
         # Patrones para detectar reservas (más completos)
         self.reservation_patterns = [
@@ -105,53 +115,53 @@ class SmartReservationDetector:
     def process_reservation(self, text):
         """Procesa una solicitud de reserva"""
         try:
-            print("Detectando solicitud de reserva...")
+            logger.info("🔍 Detectando solicitud de reserva...")
             
             # Extraer información
             params = self.extract_reservation_info(text)
-            print(f"Información extraída: {params}")
+            logger.info("📋 Información extraída", extra={'data': params})
             
             # Llamar al webhook
-            webhook_data = {
-                "sessionInfo": {
-                    "session": "smart-detector-session",
-                    "parameters": {
-                        "nomreserva": params['NomReserva'],
-                        "telefonreserva": params['TelefonReserva'],
-                        "fechareserva": params['FechaReserva'],
-                        "horareserva": params['HoraReserva'],
-                        "numeroreserva": params['NumeroReserva'],
-                        "observacions": params['Observacions']
-                    }
-                },
-                "languageCode": "es-ES"
-            }
+            webhook_data = build_payload(self.session_id, {
+                "nomreserva": params['NomReserva'],
+                "telefonreserva": params['TelefonReserva'],
+                "fechareserva": params['FechaReserva'],
+                "horareserva": params['HoraReserva'],
+                "numeroreserva": params['NumeroReserva'],
+                "observacions": params['Observacions']
+            })
             
-            print("Llamando al webhook...")
-            response = requests.post(
-                self.webhook_url,
-                json=webhook_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
+            fecha, hora = params['FechaReserva'], params['HoraReserva']
+            slot = f"{fecha['year']:04d}-{fecha['month']:02d}-{fecha['day']:02d} {hora['hours']:02d}:{hora['minutes']:02d}"
+            
+            logger.info("🌐 Llamando al webhook...")
+            response = self.webhook_client.post(webhook_data, headers=idempotency_headers(reservation_key(webhook_data, slot)))
             
             if response.status_code == 200:
                 webhook_response = response.json()
-                print("Webhook procesado exitosamente")
+                logger.info("✅ Webhook procesado exitosamente", extra={'data': webhook_response})
                 
                 # Extraer respuesta del webhook
-                if 'fulfillment_response' in webhook_response:
-                    messages = webhook_response['fulfillment_response'].get('messages', [])
-                    if messages and 'text' in messages[0]:
-                        return messages[0]['text']['text']
+                webhook_text = parse_fulfillment_text(webhook_response)
+                if webhook_text is not None:
+                    return webhook_text
                 
                 return "¡Reserva procesada exitosamente!"
             else:
-                print(f"Error en webhook: {response.status_code}")
+                logger.error("❌ Error en webhook - Status: %s", response.status_code,
+                             extra={'data': {'status': response.status_code, 'body': response.text}})
+                if response.status_code in RETRYABLE_STATUS and queue_reservation(webhook_data, slot, self.webhook_client):
+                    return "Ahora mismo no puedo confirmar la reserva. La registraremos en cuanto el sistema responda."
                 return "Hubo un error procesando la reserva. Intenta de nuevo."
                 
+        except requests.exceptions.RequestException as e:
+            logger.error("❌ Error de conexión con el webhook: %s", e)
+            # Tras un timeout de lectura la reserva puede estar guardada: no reenviarla
+            if request_not_delivered(e) and queue_reservation(webhook_data, slot, self.webhook_client):
+                return "Ahora mismo no puedo confirmar la reserva. La registraremos en cuanto el sistema responda."
+            return "Hubo un error procesando la reserva. Intenta de nuevo."
         except Exception as e:
-            print(f"Error procesando reserva: {e}")
+            logger.exception("❌ Error procesando reserva: %s", e)
             return "Hubo un error procesando la reserva. Intenta de nuevo."
 
 def test_smart_detector():
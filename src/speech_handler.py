@@ -4,10 +4,13 @@ from google.cloud import speech
 from google.cloud import texttospeech
 import json
 from dotenv import load_dotenv
+from structured_logging import get_logger
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = get_logger('speech')
+
 class SpeechToTextHandler:
     def __init__(self):
         """Inicializa el cliente de Speech to Text"""
@@ -21,14 +24,16 @@ class SpeechToTextHandler:
             self.tts_client = texttospeech.TextToSpeechClient()
             # Voz por defecto
             self.voice_name = "es-ES-Neural2-A"
-            print("Clientes de Google Cloud inicializados correctamente")
+            logger.info("Clientes de Google Cloud inicializados correctamente")
             
         except Exception as e:
-            print(f"Error inicializando clientes de Google Cloud: {e}")
-            print("Verifica que tengas:")
-            print("   1. Archivo credentials/service-account.json")
-            print("   2. Variable GOOGLE_APPLICATION_CREDENTIALS en .env")
-            print("   3. APIs habilitadas en Google Cloud Console")
+            logger.error(
+                "Error inicializando clientes de Google Cloud: %s\n"
+                "Verifica que tengas:\n"
+                "   1. Archivo credentials/service-account.json\n"
+                "   2. Variable GOOGLE_APPLICATION_CREDENTIALS en .env\n"
+                "   3. APIs habilitadas en Google Cloud Console", e
+            )
             raise e
     
     def transcribe_audio(self, audio_file_path):
@@ -63,15 +68,15 @@ class SpeechToTextHandler:
             if response.results:
                 transcript = response.results[0].alternatives[0].transcript
                 confidence = response.results[0].alternatives[0].confidence
-                print(f"Transcripción: {transcript}")
-                print(f"Confianza: {confidence:.2f}")
+                logger.info("Transcripción: %s", transcript)
+                logger.debug("Confianza: %.2f", confidence)
                 return transcript
             else:
-                print("No se pudo transcribir el audio")
+                logger.warning("No se pudo transcribir el audio")
                 return ""
                 
         except Exception as e:
-            print(f"Error en la transcripción: {e}")
+            logger.error("Error en la transcripción: %s", e)
             return ""
     
     def synthesize_speech(self, text, language="es-ES", voice_name=None):
@@ -114,7 +119,7 @@ class SpeechToTextHandler:
             return response.audio_content
             
         except Exception as e:
-            print(f"Error en la síntesis de voz: {e}")
+            logger.error("Error en la síntesis de voz: %s", e)
             return b""
     
     def save_audio(self, audio_content, output_path):
@@ -122,9 +127,9 @@ class SpeechToTextHandler:
         try:
             with open(output_path, 'wb') as audio_file:
                 audio_file.write(audio_content)
-            print(f"Audio guardado en: {output_path}")
+            logger.info("Audio guardado en: %s", output_path)
         except Exception as e:
-            print(f"Error al guardar audio: {e}")
+            logger.error("Error al guardar audio: %s", e)
 
 if __name__ == "__main__":
     try:
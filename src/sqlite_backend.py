@@ -0,0 +1,513 @@
+# src/sqlite_backend.py
+"""
+Backend SQLite para DatabaseHandler (pruebas y benchmarks sin MySQL)
+
+DatabaseHandler solo depende de un pool con esta interfaz, que cumplen
+tanto ConnectionPool (MySQL) como SQLiteConnectionPool:
+
+    pool.acquire() / pool.release(conn, discard=False) / pool.connection()
+    pool.close_all() / pool.stats()
+    conn.cursor(dictionary=False, buffered=True), conn.start_transaction(),
+    conn.commit(), conn.rollback(), conn.is_connected()
+    cursor.execute(sql, params, multi=False), cursor.executemany(sql, rows),
+    cursor.fetchone/fetchall/fetchmany, cursor.rowcount, cursor.lastrowid
+
+Las sentencias de DatabaseHandler (dialecto MySQL, con %s) se traducen a
+SQLite, y los errores se lanzan como mysql.connector.Error para que el
+manejo de errores sea el mismo con los dos backends. Se respeta la
+semántica de MySQL que usa DatabaseHandler: upserts con ON DUPLICATE KEY
+UPDATE, lastrowid y LAST_INSERT_ID() (0 en un INSERT idempotente repetido),
+rowcount de filas encontradas (FOUND_ROWS), variables de sesión
+(@id_reserva) y lotes multi-sentencia.
+
+SQLite solo admite un escritor, así que el pool comparte una única conexión
+en modo WAL. Las sentencias y transacciones se agrupan en una transacción
+de SQLite que se confirma cada `commit_every` operaciones o cada
+`commit_interval` segundos (cada transacción de DatabaseHandler es un
+SAVEPOINT dentro del lote): es lo que permite miles de reservas por
+segundo, a cambio de poder perder el último lote si el proceso muere.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from datetime import datetime, date
+from functools import lru_cache
+from contextlib import contextmanager
+from mysql.connector import errorcode
+from mysql.connector.errors import DatabaseError, IntegrityError, PoolError
+
+# Mismo esquema que en MySQL (docs/README_TWILIO.md y database/*.sql)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS CLIENT (
+    TELEFON VARCHAR(20) PRIMARY KEY,
+    nom_persona_reserva VARCHAR(100),
+    DATA_ULTIMA_RESERVA DATETIME
+);
+
+CREATE TABLE IF NOT EXISTS RESERVA (
+    id_reserva INTEGER PRIMARY KEY AUTOINCREMENT,
+    data_reserva DATETIME NOT NULL,
+    num_persones INT NOT NULL,
+    telefon VARCHAR(20) NOT NULL,
+    nom_persona_reserva VARCHAR(100),
+    observacions TEXT,
+    conversa_completa TEXT,
+    idempotency_key CHAR(64) UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_reserva_telefon ON RESERVA (telefon, data_reserva);
+CREATE INDEX IF NOT EXISTS idx_reserva_data ON RESERVA (data_reserva);
+CREATE INDEX IF NOT EXISTS idx_reserva_updated_at ON RESERVA (updated_at, id_reserva);
+
+-- Equivalente a ON UPDATE CURRENT_TIMESTAMP de MySQL
+CREATE TRIGGER IF NOT EXISTS trg_reserva_updated_at AFTER UPDATE ON RESERVA
+FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE RESERVA SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')
+    WHERE id_reserva = NEW.id_reserva;
+END;
+
+CREATE TABLE IF NOT EXISTS RESERVA_CONVERSA (
+    id_reserva INTEGER PRIMARY KEY REFERENCES RESERVA (id_reserva) ON DELETE CASCADE,
+    conversa BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS RESERVA_ARCHIVO (
+    id_reserva INT NOT NULL,
+    data_reserva DATETIME NOT NULL,
+    num_persones INT NOT NULL,
+    telefon VARCHAR(20) NOT NULL,
+    nom_persona_reserva VARCHAR(100),
+    observacions TEXT,
+    conversa_completa TEXT,
+    conversa BLOB,
+    idempotency_key CHAR(64),
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_reserva, data_reserva)
+);
+CREATE INDEX IF NOT EXISTS idx_archivo_telefon ON RESERVA_ARCHIVO (telefon, data_reserva, id_reserva);
+
+CREATE TABLE IF NOT EXISTS OCUPACION_TRAMO (
+    fecha DATE NOT NULL,
+    tramo INT NOT NULL,
+    comensales INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (fecha, tramo)
+);
+"""
+
+# Tablas con AUTO_INCREMENT: solo sus INSERT cambian LAST_INSERT_ID()
+AUTO_INCREMENT_TABLES = {'RESERVA'}
+
+_TOKEN = re.compile(r'%s|@(\w+)')
+_INSERT = re.compile(r'^\s*INSERT\s+(?:OR\s+\w+\s+)?INTO\s+(\w+)\s*\(([^)]*)\)', re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r'ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*)$', re.IGNORECASE | re.DOTALL)
+# ON DUPLICATE KEY UPDATE id = id + LAST_INSERT_ID(0): no cambia la fila y
+# deja LAST_INSERT_ID() a 0
+_KEEP_EXISTING = re.compile(r'^\s*(\w+)\s*=\s*\1\s*\+\s*LAST_INSERT_ID\(\s*0\s*\)\s*$', re.IGNORECASE)
+_SET_VAR = re.compile(r'^\s*SET\s+@(\w+)\s*=(.*)$', re.IGNORECASE | re.DOTALL)
+_SESSION_FUNCTION = re.compile(r'\b(ROW_COUNT|LAST_INSERT_ID)\(\)', re.IGNORECASE)
+
+
+def _adapt_datetime(value):
+    # Milisegundos solo si los hay, con el mismo formato que strftime('%f') de SQLite
+    if value.microsecond:
+        return value.strftime('%Y-%m-%d %H:%M:%S') + f".{value.microsecond // 1000:03d}"
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _convert_datetime(raw):
+    text = raw.decode('utf-8')
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+def _convert_date(raw):
+    text = raw.decode('utf-8')
+    try:
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        return text
+
+
+# Fechas con el mismo formato que MySQL ('YYYY-MM-DD HH:MM:SS'), así las
+# comparaciones de texto entre fechas guardadas y parámetros son correctas
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+sqlite3.register_converter('TIMESTAMP', _convert_datetime)
+sqlite3.register_converter('DATE', _convert_date)
+
+
+@lru_cache(maxsize=256)
+def translate(statement):
+    """
+    Traduce una sentencia de DatabaseHandler de MySQL a SQLite
+
+    Los %s y las variables @nombre se dejan marcados para enlazarlos en
+    orden al ejecutar.
+
+    Returns:
+        tuple: (sql, keep_existing) donde keep_existing indica un INSERT
+            idempotente que, si la fila ya existe, deja lastrowid a 0
+    """
+    sql = statement.strip()
+    keep_existing = False
+
+    upper = ' '.join(sql.split()).upper()
+    if upper == 'SELECT VERSION()':
+        return "SELECT sqlite_version()", False
+    if upper == 'SHOW TABLES':
+        return "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name", False
+
+    match = _ON_DUPLICATE.search(sql)
+    if match:
+        assignments = match.group(1).strip()
+        if _KEEP_EXISTING.match(assignments):
+            keep_existing = True
+            clause = 'ON CONFLICT DO NOTHING'
+        else:
+            clause = 'ON CONFLICT DO UPDATE SET ' + re.sub(
+                r'VALUES\(\s*(\w+)\s*\)', r'excluded.\1', assignments, flags=re.IGNORECASE
+            )
+        sql = sql[:match.start()] + clause
+
+    sql = re.sub(r'\bNOW\(\)', "datetime('now', 'localtime')", sql, flags=re.IGNORECASE)
+    # NOW(6) - INTERVAL %s MICROSECOND, con el formato de updated_at
+    sql = re.sub(
+        r'\bNOW\(6\)\s*-\s*INTERVAL\s+%s\s+MICROSECOND\b',
+        "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', '-' || (%s / 1000000.0) || ' seconds')",
+        sql, flags=re.IGNORECASE
+    )
+    sql = re.sub(r'\bINSERT\s+IGNORE\b', 'INSERT OR IGNORE', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bGREATEST\(', 'MAX(', sql, flags=re.IGNORECASE)
+    # SQLite bloquea la base de datos entera al escribir
+    sql = re.sub(r'\s+FOR\s+UPDATE\b', '', sql, flags=re.IGNORECASE)
+    return sql, keep_existing
+
+
+def split_statements(query):
+    """Separa un lote multi-sentencia por ';' (fuera de comillas)"""
+    statements = []
+    current = []
+    quote = None
+    for char in query:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == ';':
+            statements.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    statements.append(''.join(current))
+    return [statement for statement in statements if statement.strip()]
+
+
+def _wrap_error(e):
+    """Convierte un error de sqlite3 en el equivalente de mysql.connector"""
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        errno = errorcode.ER_DUP_ENTRY if 'UNIQUE' in message else None
+        return IntegrityError(msg=message, errno=errno)
+    if 'locked' in message or 'busy' in message:
+        return DatabaseError(msg=message, errno=errorcode.ER_LOCK_WAIT_TIMEOUT)
+    return DatabaseError(msg=message)
+
+
+class SQLiteCursor:
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+        self._dictionary = dictionary
+        self._synthetic = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self.with_rows = False
+        self.description = None
+
+    def _bind(self, sql, params, offset):
+        """Sustituye %s y @variables por ? y devuelve los valores en orden"""
+        values = []
+        position = offset
+
+        def replace(match):
+            nonlocal position
+            if match.group(1) is None:
+                values.append(params[position])
+                position += 1
+            else:
+                values.append(self._connection.variables.get(match.group(1)))
+            return '?'
+
+        return _TOKEN.sub(replace, sql), values, position
+
+    def _run(self, statement, params, offset=0):
+        """Ejecuta una sentencia; devuelve cuántos parámetros ha consumido"""
+        self._synthetic = None
+        upper = ' '.join(statement.split()).upper()
+
+        if upper in ('START TRANSACTION', 'BEGIN'):
+            self._connection.start_transaction()
+            return offset
+        if upper == 'COMMIT':
+            self._connection.commit()
+            return offset
+        if upper == 'ROLLBACK':
+            self._connection.rollback()
+            return offset
+
+        # SET @variable = expresión (una por sentencia): se evalúa con un SELECT
+        match = _SET_VAR.match(statement)
+        if match:
+            session = {'ROW_COUNT': self._connection.last_rowcount,
+                       'LAST_INSERT_ID': self._connection.last_insert_id}
+            expression = _SESSION_FUNCTION.sub(lambda m: str(int(session[m.group(1).upper()])), match.group(2))
+            sql, values, offset = self._bind(translate(f"SELECT {expression.strip()}")[0], params, offset)
+            try:
+                value = self._connection.raw.execute(sql, values).fetchone()[0]
+            except sqlite3.Error as e:
+                raise _wrap_error(e)
+            self._connection.variables[match.group(1)] = value
+            self.with_rows = False
+            return offset
+
+        sql, keep_existing = translate(statement)
+        sql, values, offset = self._bind(sql, params, offset)
+        self._connection.begin_batch()
+        try:
+            self._cursor.execute(sql, values)
+        except sqlite3.Error as e:
+            raise _wrap_error(e)
+
+        self.description = self._cursor.description
+        self.with_rows = self.description is not None
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+
+        insert = _INSERT.match(statement)
+        if insert:
+            if keep_existing and self.rowcount == 0:
+                # Fila existente encontrada (FOUND_ROWS) y LAST_INSERT_ID(0)
+                self.rowcount = 1
+                self.lastrowid = 0
+                self._connection.last_insert_id = 0
+            elif insert.group(1) in AUTO_INCREMENT_TABLES and self.lastrowid:
+                self._connection.last_insert_id = self.lastrowid
+        self._connection.last_rowcount = self.rowcount
+        if not self.with_rows:
+            self._connection.statement_done()
+        return offset
+
+    def execute(self, operation, params=None, multi=False):
+        params = list(params or ())
+        if multi:
+            return self._execute_multi(operation, params)
+        self._run(operation, params)
+        return None
+
+    def _execute_multi(self, operation, params):
+        offset = 0
+        for statement in split_statements(operation):
+            offset = self._run(statement, params, offset)
+            yield self
+
+    def executemany(self, operation, seq_params):
+        sql, keep_existing = translate(operation)
+        sql = _TOKEN.sub('?', sql)
+        self._connection.begin_batch()
+        try:
+            self._cursor.executemany(sql, [tuple(params) for params in seq_params])
+        except sqlite3.Error as e:
+            raise _wrap_error(e)
+        self.with_rows = False
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        self._connection.last_rowcount = self.rowcount
+        self._connection.statement_done()
+
+    def _convert(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self.description, row)}
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, path, commit_every, commit_interval):
+        """Conexión SQLite con la interfaz de MySQLConnection que usa DatabaseHandler"""
+        self.raw = sqlite3.connect(
+            path,
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            timeout=30
+        )
+        self.raw.execute("PRAGMA journal_mode=WAL")
+        self.raw.execute("PRAGMA synchronous=NORMAL")
+        self.raw.execute("PRAGMA foreign_keys=ON")
+        self.raw.executescript(SCHEMA)
+
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.variables = {}
+        self.last_rowcount = -1
+        self.last_insert_id = 0
+        self.pending = 0
+        self.commits = 0
+        self._batch_started = None
+        self._savepoints = 0
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        return None
+
+    def cursor(self, dictionary=False, buffered=True):
+        return SQLiteCursor(self, dictionary)
+
+    def begin_batch(self):
+        """Abre la transacción de SQLite que agrupa las siguientes operaciones"""
+        if not self.raw.in_transaction:
+            self.raw.execute("BEGIN")
+            self._batch_started = time.monotonic()
+
+    def start_transaction(self):
+        """Una transacción de DatabaseHandler es un SAVEPOINT dentro del lote"""
+        self.begin_batch()
+        self._savepoints += 1
+        self.raw.execute(f"SAVEPOINT tx{self._savepoints}")
+
+    def commit(self):
+        if self._savepoints:
+            self.raw.execute(f"RELEASE tx{self._savepoints}")
+            self._savepoints -= 1
+            self.statement_done()
+        else:
+            self.flush()
+
+    def rollback(self):
+        if self._savepoints:
+            self.raw.execute(f"ROLLBACK TO tx{self._savepoints}")
+            self.raw.execute(f"RELEASE tx{self._savepoints}")
+            self._savepoints -= 1
+
+    def statement_done(self):
+        """Cuenta una operación confirmada y cierra el lote si toca"""
+        if self._savepoints:
+            return
+        self.pending += 1
+        if (self.pending >= self.commit_every
+                or time.monotonic() - self._batch_started >= self.commit_interval):
+            self.flush()
+
+    def flush(self):
+        """Confirma el lote en curso (si no hay una transacción abierta)"""
+        if self.raw.in_transaction and not self._savepoints:
+            try:
+                self.raw.execute("COMMIT")
+            except sqlite3.Error as e:
+                raise _wrap_error(e)
+            self.commits += 1
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.raw.close()
+
+
+class SQLiteConnectionPool:
+    def __init__(self, path=None, timeout=None, commit_every=None, commit_interval=None):
+        """
+        Pool de una sola conexión SQLite compartida
+
+        Args:
+            path (str): Fichero de la base de datos (DB_SQLITE_PATH; ':memory:' vale)
+            timeout (float): Segundos de espera si otro hilo usa la conexión (DB_POOL_TIMEOUT)
+            commit_every (int): Operaciones por lote de commit (DB_SQLITE_COMMIT_EVERY)
+            commit_interval (float): Segundos máximos que un lote queda sin
+                confirmar (DB_SQLITE_COMMIT_INTERVAL)
+        """
+        self.path = path or os.getenv('DB_SQLITE_PATH', 'data/cronosai.sqlite3')
+        self.timeout = float(timeout if timeout is not None else os.getenv('DB_POOL_TIMEOUT', 10))
+        self.commit_every = int(commit_every or os.getenv('DB_SQLITE_COMMIT_EVERY', 200))
+        self.commit_interval = float(
+            commit_interval if commit_interval is not None else os.getenv('DB_SQLITE_COMMIT_INTERVAL', 0.05)
+        )
+        self.size = 1
+
+        directory = os.path.dirname(self.path)
+        if directory and self.path != ':memory:':
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = None
+        # Reentrante: un método puede pedir otra conexión mientras usa una
+        self._lock = threading.RLock()
+
+    def acquire(self):
+        if not self._lock.acquire(timeout=self.timeout):
+            raise PoolError("Conexión SQLite ocupada")
+        try:
+            if self._conn is None:
+                self._conn = SQLiteConnection(self.path, self.commit_every, self.commit_interval)
+        except sqlite3.Error as e:
+            self._lock.release()
+            raise _wrap_error(e)
+        return self._conn
+
+    def release(self, conn, discard=False):
+        # La conexión es compartida: nunca se descarta
+        try:
+            if conn.pending and time.monotonic() - conn._batch_started >= conn.commit_interval:
+                conn.flush()
+        finally:
+            self._lock.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Confirma el último lote y cierra la conexión"""
+        with self._lock:
+            if self._conn is None:
+                return 0
+            self._conn.close()
+            self._conn = None
+            return 1
+
+    def stats(self):
+        conn = self._conn
+        return {
+            'size': self.size,
+            'open': 1 if conn else 0,
+            'idle': 1 if conn else 0,
+            'backend': 'sqlite',
+            'pending': conn.pending if conn else 0,
+            'commits': conn.commits if conn else 0
+        }
@@ -0,0 +1,253 @@
+# src/structured_logging.py
+"""
+Logging estructurado del pipeline de reservas
+
+Cada subsistema tiene su logger (get_logger('webhook'), 'database',
+'dialogflow'...) y todos escriben a través de una cola: el hilo de la
+petición solo encola el registro y un hilo en segundo plano formatea y
+escribe en consola y en logs/detailed-AAAA-MM-DD.log, con el mismo
+formato JSON lines que scripts/monitoring/phone_test_monitor.js:
+
+    {"timestamp": ..., "level": ..., "category": ..., "message": ..., "data": {...}}
+
+El formateo es perezoso: los mensajes usan argumentos con % y los datos
+estructurados (peticiones, parámetros) se pasan como objeto en
+extra={'data': ...}; solo se serializan en el hilo escritor y nunca si el
+nivel está desactivado. Los objetos pasados en 'data' no deben
+modificarse después de registrarlos.
+
+Importar el módulo o pedir un logger no arranca nada: la configuración se
+hace con el primer registro (o antes, llamando a setup_logging()), así que
+las variables de entorno se leen después del load_dotenv() de cada script.
+
+Configuración:
+    LOG_LEVEL              Nivel general (DEBUG, INFO, WARN, ERROR), como lib/logging.js
+    LOG_LEVEL_<SUBSISTEMA> Nivel de un subsistema (p. ej. LOG_LEVEL_WEBHOOK=DEBUG)
+    LOG_DIR                Directorio de los ficheros detailed-*.log (por
+                           defecto logs/ en la raíz del repositorio)
+    LOG_FILE               Escribir el fichero JSON lines (true/false)
+    LOG_CONSOLE            Escribir los mensajes en consola (true/false)
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT_LOGGER = 'cronosai'
+LEVEL_PREFIX = 'LOG_LEVEL_'
+# logs/ del repositorio, no del directorio desde el que se lanza el script
+DEFAULT_LOG_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'logs'))
+
+_setup_lock = threading.Lock()
+_listener = None
+
+
+def _enabled(name, default):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def _level(value, default=logging.INFO):
+    """Nivel de logging a partir de su nombre (acepta WARN como lib/logging.js)"""
+    name = (value or '').strip().upper()
+    level = logging.getLevelName('WARNING' if name == 'WARN' else name)
+    return level if isinstance(level, int) else default
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Un objeto JSON por línea con el formato de logs/detailed-*.log"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+                                 .replace('+00:00', 'Z'),
+            # Mismos nombres de nivel que lib/logging.js
+            'level': 'WARN' if record.levelno == logging.WARNING else record.levelname,
+            'category': getattr(record, 'category', None) or record.name.rsplit('.', 1)[-1].upper(),
+            'message': record.getMessage()
+        }
+        data = getattr(record, 'data', None)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data = dict(data or {}, exception=record.exc_text)
+        if data is not None:
+            entry['data'] = data
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Solo el mensaje, como los print() de siempre"""
+
+    def format(self, record):
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+        return message
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """Escribe en el sys.stdout actual (los CLI pueden redirigirlo a stderr)"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class DailyFileHandler(logging.Handler):
+    """Fichero detailed-AAAA-MM-DD.log del día en curso (fecha local)"""
+
+    def __init__(self, directory, prefix='detailed'):
+        super().__init__()
+        self.directory = directory
+        self.prefix = prefix
+        self._day = None
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _current_file(self):
+        day = datetime.now().strftime('%Y-%m-%d')
+        if day != self._day:
+            if self._file:
+                self._file.close()
+            self._file = open(os.path.join(self.directory, f"{self.prefix}-{day}.log"), 'a', encoding='utf-8')
+            self._day = day
+        return self._file
+
+    def emit(self, record):
+        try:
+            f = self._current_file()
+            f.write(self.format(record) + '\n')
+            f.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+class SetupOnFirstEmit(logging.Handler):
+    """
+    Handler provisional de los loggers del pipeline hasta configurarlos
+
+    Con el primer registro llama a setup_logging() y se lo pasa a los
+    handlers definitivos, si su nivel configurado lo deja pasar.
+    """
+
+    def emit(self, record):
+        setup_logging()
+        if record.levelno < logging.getLogger(record.name).getEffectiveLevel():
+            return
+        for handler in logging.getLogger(ROOT_LOGGER).handlers:
+            if handler is not self:
+                handler.handle(record)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que registra
+
+    QueueHandler.prepare() formatea el registro completo antes de
+    encolarlo; aquí solo se resuelve el mensaje con sus argumentos (pueden
+    cambiar después) y los datos estructurados se serializan en el hilo
+    escritor.
+    """
+
+    def prepare(self, record):
+        # Este es el único handler de los loggers del pipeline: se puede
+        # reutilizar el registro sin copiarlo
+        record.msg = record.getMessage()
+        record.args = None
+        # Las trazas tienen referencias a los frames del hilo: convertirlas ya
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level=None, directory=None, file_output=None, console=None):
+    """
+    Configura los loggers del pipeline (una sola vez por proceso)
+
+    Se llama sola con el primer registro; solo hace falta llamarla antes
+    para cambiar la configuración por defecto.
+
+    Args:
+        level (str): Nivel general (LOG_LEVEL, por defecto INFO)
+        directory (str): Directorio de detailed-*.log (LOG_DIR)
+        file_output (bool): Escribir el fichero JSON lines (LOG_FILE)
+        console (bool): Escribir en consola (LOG_CONSOLE)
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(_level(level or os.getenv('LOG_LEVEL')))
+        root.propagate = False
+        for name, value in os.environ.items():
+            if name.startswith(LEVEL_PREFIX) and value:
+                logging.getLogger(f"{ROOT_LOGGER}.{name[len(LEVEL_PREFIX):].lower()}").setLevel(_level(value))
+
+        handlers = []
+        if console if console is not None else _enabled('LOG_CONSOLE', 'true'):
+            console_handler = ConsoleHandler()
+            console_handler.setFormatter(ConsoleFormatter())
+            handlers.append(console_handler)
+        if file_output if file_output is not None else _enabled('LOG_FILE', 'true'):
+            file_handler = DailyFileHandler(directory or os.getenv('LOG_DIR', DEFAULT_LOG_DIR))
+            file_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(file_handler)
+
+        log_queue = queue.SimpleQueue()
+        root.handlers = [DeferredQueueHandler(log_queue)]
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Escribe lo que quede en la cola y detiene el hilo escritor"""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def get_logger(subsystem):
+    """
+    Logger de un subsistema ('webhook', 'database', 'dialogflow'...)
+
+    Su categoría en el fichero es el nombre en mayúsculas y su nivel se
+    puede cambiar con LOG_LEVEL_<SUBSISTEMA> (se aplica al configurar).
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
+
+
+# Hasta el primer registro todo llega al handler provisional, que filtra
+# con el nivel configurado
+_root = logging.getLogger(ROOT_LOGGER)
+_root.setLevel(logging.DEBUG)
+_root.propagate = False
+_root.addHandler(SetupOnFirstEmit())
@@ -9,11 +9,16 @@ import threading
 import time
 import os
 import re
+import uuid
 import requests
 import json
 from datetime import datetime, timedelta
 from speech_handler import SpeechToTextHandler
 from dotenv import load_dotenv
+from webhook_client import (RETRYABLE_STATUS, build_payload, get_webhook_client, idempotency_headers,
+                            parse_fulfillment_text, request_not_delivered)
+from webhook_outbox import queue_reservation, reservation_key
+from availability import simulator_availability, slot_alternatives
 
 # Cargar variables de entorno
 load_dotenv()
@@ -33,9 +38,19 @@ AVAILABLE_VOICES = {
 }
 
 class VoiceConversationalSimulator:
-    def __init__(self):
-        """Simulador de llamada telefónica por voz"""
+    def __init__(self, availability=None):
+        """
+        Simulador de llamada telefónica por voz
+        
+        Args:
+            availability (AvailabilityService): Si se indica, se comprueba la
+                capacidad al pedir la hora y se ofrecen alternativas en el mismo turno
+        """
         self.webhook_url = os.getenv('WEBHOOK_URL', 'https://cronosai-webhook.vercel.app/api/webhook')
+        self.webhook_client = get_webhook_client(self.webhook_url)
+        self.availability = availability
+        # Identifica la conversación en el webhook y en la clave de idempotencia
+        self.session_id = f"voice-conversational-{uuid.uuid4().hex}"
         self.speech_handler = SpeechToTextHandler()
         
         # Estados de la conversación
@@ -328,6 +343,9 @@ class VoiceConversationalSimulator:
         elif step == 'ask_time':
             time = self.extract_time(text)
             if time:
+                unavailable = self.check_time_availability(time)
+                if unavailable:
+                    return unavailable
                 self.conversation_state['reservation_data']['HoraReserva'] = time
                 self.conversation_state['step'] = 'ask_name'
                 return f"Perfecto, a las {time}. ¿Su nombre?"
@@ -580,6 +598,24 @@ class VoiceConversationalSimulator:
         
         return None
     
+    def check_time_availability(self, time):
+        """
+        Comprueba si hay sitio a esa hora
+        
+        Returns:
+            str: Mensaje con horas alternativas si está completo, None si hay sitio
+        """
+        data = self.conversation_state['reservation_data']
+        alternativas = slot_alternatives(self.availability, data['FechaReserva'], time, data['NumeroReserva'])
+        if alternativas is None:
+            return None
+        
+        if not alternativas:
+            # La siguiente respuesta es la nueva fecha
+            self.conversation_state['step'] = 'ask_date'
+            return "Lo siento, ese día no nos queda sitio. ¿Quiere otra fecha?"
+        return f"Lo siento, a las {time} está completo. Tengo a las {', '.join(alternativas)}. ¿Cuál prefiere?"
+    
     def extract_name(self, text):
         """Extrae el nombre del texto"""
         # Limpiar y capitalizar
@@ -642,58 +678,55 @@ class VoiceConversationalSimulator:
         """Procesa la reserva final"""
         try:
             data = self.conversation_state['reservation_data']
+            slot = f"{data['FechaReserva']} {data['HoraReserva']}"
             
             # Preparar datos para el webhook
-            webhook_data = {
-                "sessionInfo": {
-                    "session": "voice-conversational-session",
-                    "parameters": {
-                        "nomreserva": data['NomReserva'],
-                        "telefonreserva": data['TelefonReserva'],
-                        "fechareserva": {
-                            "year": int(data['FechaReserva'].split('-')[0]),
-                            "month": int(data['FechaReserva'].split('-')[1]),
-                            "day": int(data['FechaReserva'].split('-')[2])
-                        },
-                        "horareserva": {
-                            "hours": int(data['HoraReserva'].split(':')[0]),
-                            "minutes": int(data['HoraReserva'].split(':')[1]),
-                            "seconds": 0
-                        },
-                        "numeroreserva": data['NumeroReserva'],
-                        "observacions": f"Reserva creada por simulador de voz conversacional"
-                    }
+            webhook_data = build_payload(self.session_id, {
+                "nomreserva": data['NomReserva'],
+                "telefonreserva": data['TelefonReserva'],
+                "fechareserva": {
+                    "year": int(data['FechaReserva'].split('-')[0]),
+                    "month": int(data['FechaReserva'].split('-')[1]),
+                    "day": int(data['FechaReserva'].split('-')[2])
                 },
-                "languageCode": "es-ES"
-            }
+                "horareserva": {
+                    "hours": int(data['HoraReserva'].split(':')[0]),
+                    "minutes": int(data['HoraReserva'].split(':')[1]),
+                    "seconds": 0
+                },
+                "numeroreserva": data['NumeroReserva'],
+                "observacions": f"Reserva creada por simulador de voz conversacional"
+            })
             
             print(f"\n🌐 Enviando reserva al webhook...")
             
-            response = requests.post(
-                self.webhook_url,
-                json=webhook_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
+            # Si el cliente repite la reserva tras un error, el webhook no la duplica
+            response = self.webhook_client.post(webhook_data, headers=idempotency_headers(reservation_key(webhook_data, slot)))
             
             if response.status_code == 200:
                 webhook_response = response.json()
                 print(f"✅ ¡Reserva procesada exitosamente!")
                 
                 # Extraer respuesta del webhook y hablar
-                if 'fulfillment_response' in webhook_response:
-                    messages = webhook_response['fulfillment_response'].get('messages', [])
-                    if messages and 'text' in messages[0]:
-                        confirmation_text = messages[0]['text']['text']
-                        self.say_and_speak(confirmation_text)
-                    else:
-                        self.say_and_speak("¡Reserva confirmada! Recibirá una confirmación por teléfono.")
+                confirmation_text = parse_fulfillment_text(webhook_response)
+                if confirmation_text is not None:
+                    self.say_and_speak(confirmation_text)
                 else:
                     self.say_and_speak("¡Reserva confirmada! Recibirá una confirmación por teléfono.")
             else:
                 print(f"❌ Error procesando reserva: {response.status_code}")
-                self.say_and_speak("Hubo un problema procesando su reserva. Por favor, intente de nuevo.")
+                if response.status_code in RETRYABLE_STATUS and queue_reservation(webhook_data, slot, self.webhook_client):
+                    self.say_and_speak("No he podido confirmar la reserva ahora mismo. La registraremos en cuanto el sistema responda y recibirá la confirmación por teléfono.")
+                else:
+                    self.say_and_speak("Hubo un problema procesando su reserva. Por favor, intente de nuevo.")
                 
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Error de conexión con el webhook: {e}")
+            # Tras un timeout de lectura la reserva puede estar guardada: no reenviarla
+            if request_not_delivered(e) and queue_reservation(webhook_data, slot, self.webhook_client):
+                self.say_and_speak("No he podido confirmar la reserva ahora mismo. La registraremos en cuanto el sistema responda y recibirá la confirmación por teléfono.")
+            else:
+                self.say_and_speak("Hubo un error procesando su reserva. Por favor, intente de nuevo.")
         except Exception as e:
             print(f"❌ Error: {e}")
             self.say_and_speak("Hubo un error procesando su reserva. Por favor, intente de nuevo.")
@@ -760,8 +793,8 @@ def main():
         print("pip install pyaudio wave pygame")
         return
     
-    # Crear y ejecutar simulador
-    simulator = VoiceConversationalSimulator()
+    # Crear y ejecutar simulador (comprueba la capacidad solo con SIMULATOR_DB_BACKEND)
+    simulator = VoiceConversationalSimulator(simulator_availability())
     simulator.start_call_simulation()
 
 if __name__ == "__main__":
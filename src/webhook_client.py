@@ -0,0 +1,188 @@
+# src/webhook_client.py
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
+
+DEFAULT_WEBHOOK_URL = 'https://cronosai-webhook.vercel.app/api/webhook'
+
+# Respuestas que indican que la petición no llegó a procesarse: se puede
+# reintentar o guardar en el outbox sin riesgo de duplicar la reserva
+RETRYABLE_STATUS = (429, 502, 503)
+
+# Parámetros de Dialogflow -> parámetros que espera el webhook
+PARAMETER_MAPPING = {
+    'NomReserva': 'nomreserva',
+    'TelefonReserva': 'telefonreserva',
+    'FechaReserva': 'fechareserva',
+    'HoraReserva': 'horareserva',
+    'NumeroReserva': 'numeroreserva',
+    'Observacions': 'observacions'
+}
+
+
+def format_parameters(parameters):
+    """
+    Renombra los parámetros de Dialogflow a los que espera el webhook
+
+    Args:
+        parameters (dict): Parámetros originales de Dialogflow
+
+    Returns:
+        dict: Parámetros formateados para el webhook
+    """
+    return {
+        webhook_param: parameters[dialogflow_param]
+        for dialogflow_param, webhook_param in PARAMETER_MAPPING.items()
+        if dialogflow_param in parameters
+    }
+
+
+def build_payload(session, parameters, language_code="es-ES"):
+    """
+    Petición en el formato de Dialogflow CX que espera el webhook
+
+    Args:
+        session (str): Identificador de la conversación
+        parameters (dict): sessionInfo.parameters (nomreserva, telefonreserva...)
+        language_code (str): Idioma de la conversación
+    """
+    return {
+        "sessionInfo": {
+            "session": session,
+            "parameters": parameters
+        },
+        "languageCode": language_code
+    }
+
+
+def parse_fulfillment_text(webhook_response):
+    """
+    Texto de fulfillment_response.messages[0].text.text de una respuesta del webhook
+
+    Returns:
+        El texto (str o lista de str, tal como lo devuelve el webhook),
+        None si la respuesta no trae mensaje de texto
+    """
+    if not isinstance(webhook_response, dict):
+        return None
+    messages = (webhook_response.get('fulfillment_response') or {}).get('messages') or []
+    if messages and isinstance(messages[0], dict) and 'text' in messages[0]:
+        return (messages[0]['text'] or {}).get('text')
+    return None
+
+
+def idempotency_headers(idempotency_key):
+    """
+    Cabecera Idempotency-Key de una reserva (make_idempotency_key)
+
+    api/webhook.js la guarda en RESERVA.idempotency_key (índice único): un
+    reintento, un reenvío o el respaldo local con la misma clave devuelven
+    la reserva existente en lugar de duplicarla.
+    """
+    return {'Idempotency-Key': idempotency_key} if idempotency_key else None
+
+
+def request_not_delivered(error):
+    """
+    Indica si un error de requests garantiza que el webhook no recibió la petición
+
+    Solo los fallos al conectar (DNS, conexión rechazada, timeout de
+    conexión). Un timeout de lectura o una conexión cortada mientras se
+    esperaba la respuesta no lo garantizan: la reserva puede estar guardada.
+    """
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    cause = error.args[0] if error.args else None
+    # MaxRetryError lleva la causa real en .reason
+    cause = getattr(cause, 'reason', None) or cause
+    return not isinstance(cause, ProtocolError)
+
+
+class WebhookClient:
+    def __init__(self, webhook_url=None, pool_size=None, connect_timeout=None, read_timeout=None):
+        """
+        Cliente HTTP compartido para el webhook de reservas
+
+        Usa una requests.Session con keep-alive: la conexión TLS con Vercel
+        se abre una vez y se reutiliza en cada turno en lugar de pagar el
+        handshake en cada llamada.
+
+        Args:
+            webhook_url (str): URL del webhook (WEBHOOK_URL)
+            pool_size (int): Conexiones abiertas reutilizables (WEBHOOK_POOL_SIZE)
+            connect_timeout (float): Segundos para conectar (WEBHOOK_CONNECT_TIMEOUT)
+            read_timeout (float): Segundos esperando la respuesta (WEBHOOK_READ_TIMEOUT)
+        """
+        self.webhook_url = webhook_url or os.getenv('WEBHOOK_URL', DEFAULT_WEBHOOK_URL)
+        self.pool_size = int(pool_size or os.getenv('WEBHOOK_POOL_SIZE', 10))
+        self.timeout = (
+            float(connect_timeout or os.getenv('WEBHOOK_CONNECT_TIMEOUT', 3.05)),
+            float(read_timeout or os.getenv('WEBHOOK_READ_TIMEOUT', 30))
+        )
+
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, payload, timeout=None, headers=None):
+        """
+        Envía una petición al webhook
+
+        Args:
+            payload (dict): Cuerpo JSON (ver build_payload)
+            timeout: (conectar, leer) en segundos; por defecto los del cliente
+            headers (dict): Cabeceras adicionales (p. ej. Idempotency-Key)
+
+        Returns:
+            requests.Response: Respuesta del webhook
+
+        Raises:
+            requests.exceptions.RequestException: Si no se puede conectar o
+                se agota el tiempo
+        """
+        return self.session.post(self.webhook_url, json=payload, timeout=timeout or self.timeout, headers=headers)
+
+    def warm_up(self, background=True):
+        """
+        Abre la conexión con el webhook antes del primer turno
+
+        Cualquier respuesta (incluso 405) deja la conexión en el pool; los
+        errores se ignoran y la conexión se abrirá en la primera llamada.
+        """
+        def connect():
+            try:
+                self.session.head(self.webhook_url, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                pass
+
+        if background:
+            threading.Thread(target=connect, daemon=True).start()
+        else:
+            connect()
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_webhook_client(webhook_url=None):
+    """
+    WebhookClient compartido por URL
+
+    Todos los simuladores y el sistema de voz del mismo proceso usan las
+    mismas conexiones abiertas.
+    """
+    webhook_url = webhook_url or os.getenv('WEBHOOK_URL', DEFAULT_WEBHOOK_URL)
+    with _clients_lock:
+        client = _clients.get(webhook_url)
+        if client is None:
+            client = WebhookClient(webhook_url)
+            _clients[webhook_url] = client
+        return client
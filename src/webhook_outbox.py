@@ -0,0 +1,549 @@
+# src/webhook_outbox.py
+"""
+Outbox local (store-and-forward) para las llamadas al webhook de reservas
+
+Cuando el webhook no responde, la petición se guarda en un segmento local
+de solo-anexado (con fsync) junto con su clave de idempotencia y el turno
+sigue sin esperar a la red. Un hilo en segundo plano las reenvía por
+lotes cuando el webhook vuelve a responder: primero una sola petición de
+prueba y, si va bien, la más antigua de cada teléfono en paralelo, así que
+las reservas de un mismo teléfono llegan en el orden en que se hicieron.
+Los segmentos cuyas entradas están todas confirmadas se borran. Cada
+entrada guarda la URL del webhook al que iba, así que un cliente con su
+propia URL (VoiceReservationSystem(webhook_url=...), los simuladores) no
+reenvía a la de WEBHOOK_URL.
+
+Uso:
+    python src/webhook_outbox.py [estado|reenviar|descartadas] [directorio]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from webhook_client import RETRYABLE_STATUS, get_webhook_client, idempotency_headers, request_not_delivered
+from database_handler import make_idempotency_key
+from structured_logging import get_logger
+
+SEGMENT_PREFIX = 'segment-'
+DEAD_FILE = 'descartadas.jsonl'
+LOCK_FILE = 'outbox.lock'
+
+logger = get_logger('webhook')
+
+# Directorios con un outbox abierto en este proceso
+_open_directories = set()
+
+
+def _segment_name(number):
+    return f"{SEGMENT_PREFIX}{number:08d}.jsonl"
+
+
+def _segments(directory):
+    """Segmentos del directorio en orden de creación"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith(SEGMENT_PREFIX) and name.endswith('.jsonl'))
+
+
+def read_backlog(directory):
+    """
+    Lee los segmentos y devuelve las entradas pendientes en orden
+
+    Returns:
+        tuple: (OrderedDict id -> entrada, dict segmento -> entradas pendientes)
+    """
+    entries = OrderedDict()
+    pending_by_segment = {}
+    for segment in _segments(directory):
+        pending_by_segment.setdefault(segment, 0)
+        with open(os.path.join(directory, segment), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última línea a medio escribir tras una caída
+                    continue
+                if record.get('op') == 'put':
+                    entries[record['id']] = {
+                        'id': record['id'],
+                        'key': record.get('key'),
+                        'telefon': record.get('telefon'),
+                        'url': record.get('url'),
+                        'payload': record['payload'],
+                        'ts': record.get('ts'),
+                        'attempts': 0,
+                        'segment': segment
+                    }
+                    pending_by_segment[segment] += 1
+                elif record.get('op') in ('ack', 'dead'):
+                    entry = entries.pop(record.get('id'), None)
+                    if entry is not None:
+                        pending_by_segment[entry['segment']] -= 1
+    return entries, pending_by_segment
+
+
+def payload_key(payload):
+    """Clave de idempotencia derivada de la propia petición"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WebhookOutbox:
+    def __init__(self, client=None, directory=None, batch_size=None, retry_interval=None,
+                 max_attempts=None, segment_bytes=None, start=True):
+        """
+        Outbox de peticiones al webhook con reenvío en segundo plano
+
+        Solo un proceso puede usar cada directorio (outbox.lock).
+
+        Args:
+            client (WebhookClient): Cliente con el que reenviar las entradas
+                sin URL propia (por defecto el compartido de WEBHOOK_URL)
+            directory (str): Directorio de los segmentos (WEBHOOK_OUTBOX_DIR)
+            batch_size (int): Peticiones por lote (WEBHOOK_OUTBOX_BATCH_SIZE)
+            retry_interval (float): Espera inicial entre intentos si el webhook
+                sigue sin responder; se duplica hasta 60 s
+                (WEBHOOK_OUTBOX_RETRY_INTERVAL)
+            max_attempts (int): Intentos antes de descartar una petición
+                (WEBHOOK_OUTBOX_MAX_ATTEMPTS)
+            segment_bytes (int): Tamaño a partir del cual se abre un segmento
+                nuevo (WEBHOOK_OUTBOX_SEGMENT_BYTES)
+            start (bool): Arrancar el hilo de reenvío (False para reenviar a
+                mano con replay_once)
+
+        Raises:
+            RuntimeError: Si otro proceso está usando el mismo directorio
+        """
+        self.client = client or get_webhook_client()
+        self.directory = directory or os.getenv('WEBHOOK_OUTBOX_DIR', 'logs/webhook_outbox')
+        self.batch_size = int(batch_size or os.getenv('WEBHOOK_OUTBOX_BATCH_SIZE', 20))
+        self.retry_interval = float(retry_interval or os.getenv('WEBHOOK_OUTBOX_RETRY_INTERVAL', 2.0))
+        self.max_attempts = int(max_attempts or os.getenv('WEBHOOK_OUTBOX_MAX_ATTEMPTS', 50))
+        self.segment_bytes = int(segment_bytes or os.getenv('WEBHOOK_OUTBOX_SEGMENT_BYTES', 1024 * 1024))
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_path = os.path.join(self.directory, LOCK_FILE)
+        self._acquire_lock()
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._retry_delay = self.retry_interval
+        self._executor = ThreadPoolExecutor(max_workers=self.batch_size, thread_name_prefix='webhook-outbox')
+        self._counters = {'queued': 0, 'sent': 0, 'failed': 0, 'dead': 0}
+
+        self._entries, self._pending_by_segment = read_backlog(self.directory)
+        self._keys = {entry['key']: entry['id'] for entry in self._entries.values() if entry['key']}
+
+        # Nunca se sigue escribiendo en un segmento antiguo (puede acabar a medias)
+        existing = _segments(self.directory)
+        self._segment_number = int(existing[-1][len(SEGMENT_PREFIX):-6]) + 1 if existing else 1
+        self._open_segment()
+        self._compact()
+        if self._entries:
+            logger.warning("📮 %s peticiones al webhook pendientes en el outbox", len(self._entries))
+
+        self._thread = None
+        if start:
+            self._thread = threading.Thread(target=self._run, name='webhook-outbox', daemon=True)
+            self._thread.start()
+
+    def _acquire_lock(self):
+        directory = os.path.abspath(self.directory)
+        if directory in _open_directories:
+            raise RuntimeError(f"El outbox {self.directory} ya está abierto en este proceso")
+        try:
+            fd = os.open(self._lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(self._lock_path, encoding='utf-8') as f:
+                    pid = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                pid = 0
+            if pid and pid != os.getpid() and _pid_alive(pid):
+                raise RuntimeError(f"El outbox {self.directory} está en uso por el proceso {pid}")
+            # Bloqueo de un proceso que ya no existe
+            os.remove(self._lock_path)
+            fd = os.open(self._lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(str(os.getpid()))
+        _open_directories.add(directory)
+
+    def _open_segment(self):
+        # Llamar con el lock tomado (o desde __init__)
+        self._segment = _segment_name(self._segment_number)
+        self._pending_by_segment.setdefault(self._segment, 0)
+        self._file = open(os.path.join(self.directory, self._segment), 'a', encoding='utf-8')
+
+    def _compact(self, include_active=False):
+        """
+        Borra los segmentos iniciales sin entradas pendientes
+
+        Los 'ack' se escriben siempre en el segmento activo y se refieren a
+        entradas de ese segmento o de anteriores, así que solo se puede
+        borrar desde el principio: borrar un segmento con anteriores vivos
+        perdería confirmaciones. Llamar con el lock tomado.
+        """
+        for segment in sorted(self._pending_by_segment):
+            if self._pending_by_segment[segment] or (segment == self._segment and not include_active):
+                break
+            del self._pending_by_segment[segment]
+            try:
+                os.remove(os.path.join(self.directory, segment))
+            except FileNotFoundError:
+                pass
+
+    def _append(self, record):
+        """Añade un registro al segmento activo (con fsync); llamar con el lock tomado"""
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if self._file.tell() >= self.segment_bytes:
+            self._file.close()
+            self._segment_number += 1
+            self._open_segment()
+
+    def _resolve(self, entry, op, error=None):
+        """Marca una entrada como enviada ('ack') o descartada ('dead'); llamar con el lock tomado"""
+        record = {'op': op, 'id': entry['id']}
+        if error:
+            record['error'] = error
+        self._append(record)
+        self._entries.pop(entry['id'], None)
+        if entry['key']:
+            self._keys.pop(entry['key'], None)
+
+        self._pending_by_segment[entry['segment']] -= 1
+        self._compact()
+
+    def submit(self, payload, idempotency_key=None, telefon=None, webhook_url=None):
+        """
+        Guarda una petición para reenviarla al webhook
+
+        Vuelve en cuanto la petición está en disco. Una petición con una
+        clave que ya está pendiente no se duplica.
+
+        Args:
+            payload (dict): Petición completa (ver webhook_client.build_payload)
+            idempotency_key (str): Clave de la reserva (make_idempotency_key);
+                se envía también en la cabecera Idempotency-Key. Por defecto
+                se deriva de la petición (payload_key)
+            telefon (str): Teléfono del cliente, para mantener el orden por teléfono
+            webhook_url (str): Webhook al que reenviarla (por defecto el del
+                cliente del outbox)
+
+        Returns:
+            str: Identificador de la entrada
+        """
+        idempotency_key = idempotency_key or payload_key(payload)
+        with self._lock:
+            if idempotency_key in self._keys:
+                return self._keys[idempotency_key]
+
+            entry = {
+                'id': uuid.uuid4().hex,
+                'key': idempotency_key,
+                'telefon': telefon,
+                'url': webhook_url,
+                'payload': payload,
+                'ts': time.time(),
+                'attempts': 0,
+                'segment': self._segment
+            }
+            self._append({'op': 'put', 'id': entry['id'], 'key': entry['key'], 'telefon': telefon,
+                          'url': webhook_url, 'payload': payload, 'ts': entry['ts']})
+            self._pending_by_segment[entry['segment']] += 1
+            self._entries[entry['id']] = entry
+            self._keys[idempotency_key] = entry['id']
+            self._counters['queued'] += 1
+
+        self._wake.set()
+        return entry['id']
+
+    def pending(self):
+        """Número de peticiones que aún no han llegado al webhook"""
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._counters)
+            result['pending'] = len(self._entries)
+            result['segments'] = len(self._pending_by_segment)
+        return result
+
+    def _heads(self):
+        """La entrada más antigua de cada teléfono, en orden, hasta batch_size"""
+        heads = []
+        seen = set()
+        with self._lock:
+            for entry in self._entries.values():
+                phone = entry['telefon'] or entry['id']
+                if phone in seen:
+                    continue
+                seen.add(phone)
+                heads.append(entry)
+                if len(heads) >= self.batch_size:
+                    break
+        return heads
+
+    def _send(self, entry):
+        """
+        Reenvía una entrada
+
+        Solo se reintenta lo que seguro no llegó a procesarse (no se pudo
+        conectar, 429, 502, 503). Tras un timeout de lectura o un error del
+        servidor ('unknown') la reserva puede estar guardada y la entrada
+        pasa a descartadas para revisarla a mano en lugar de reenviarse.
+
+        Returns:
+            tuple: ('ok' | 'retry' | 'dead' | 'unknown', error)
+        """
+        client = get_webhook_client(entry['url']) if entry['url'] else self.client
+        try:
+            response = client.post(entry['payload'], headers=idempotency_headers(entry['key']))
+        except requests.exceptions.RequestException as e:
+            return ('retry' if request_not_delivered(e) else 'unknown'), str(e)
+        if response.status_code == 200:
+            return 'ok', None
+        error = f"HTTP {response.status_code}: {response.text[:200]}"
+        if response.status_code in RETRYABLE_STATUS:
+            return 'retry', error
+        # Un 4xx no va a ir mejor reintentando
+        if 400 <= response.status_code < 500:
+            return 'dead', error
+        return 'unknown', error
+
+    def _handle(self, entry, outcome, error):
+        with self._lock:
+            if entry['id'] not in self._entries:
+                return
+            if outcome == 'ok':
+                self._resolve(entry, 'ack')
+                self._counters['sent'] += 1
+                return
+            entry['attempts'] += 1
+            self._counters['failed'] += 1
+            if outcome == 'retry' and entry['attempts'] < self.max_attempts:
+                return
+            self._resolve(entry, 'dead', error)
+            self._counters['dead'] += 1
+            record = {key: value for key, value in entry.items() if key != 'segment'}
+            record['error'] = error
+            with open(os.path.join(self.directory, DEAD_FILE), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        logger.error("❌ Petición %s descartada del outbox: %s", entry['id'], error)
+
+    def replay_once(self):
+        """
+        Una ronda de reenvío
+
+        Returns:
+            dict: {'sent': int, 'failed': int} de esta ronda
+        """
+        heads = self._heads()
+        if not heads:
+            return {'sent': 0, 'failed': 0}
+
+        # Una sola petición de prueba mientras el webhook no responda (o
+        # responda con errores del servidor)
+        probe = self._send(heads[0])
+        self._handle(heads[0], *probe)
+        if probe[0] in ('retry', 'unknown'):
+            return {'sent': 0, 'failed': 1}
+
+        results = [probe] + list(self._executor.map(self._send, heads[1:]))
+        for entry, (outcome, error) in zip(heads[1:], results[1:]):
+            self._handle(entry, outcome, error)
+        sent = sum(1 for outcome, _ in results if outcome == 'ok')
+        return {'sent': sent, 'failed': len(heads) - sent}
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.pending():
+                self._wake.wait(self.retry_interval)
+                self._wake.clear()
+                continue
+            try:
+                result = self.replay_once()
+            except Exception as e:
+                # No perder el hilo: las entradas siguen en disco
+                logger.error("❌ Error inesperado reenviando el outbox: %s", e)
+                result = {'sent': 0, 'failed': 1}
+
+            if result['sent']:
+                self._retry_delay = self.retry_interval
+                if result['failed'] == 0:
+                    continue
+            else:
+                self._retry_delay = min(self._retry_delay * 2, 60)
+            self._stop.wait(self._retry_delay)
+
+    def close(self, timeout=10):
+        """Detiene el reenvío; lo pendiente sigue en disco para el siguiente arranque"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            empty = self._file.tell() == 0
+            self._file.close()
+            if empty and not self._pending_by_segment.get(self._segment):
+                del self._pending_by_segment[self._segment]
+                os.remove(os.path.join(self.directory, self._segment))
+            self._compact(include_active=True)
+        try:
+            os.remove(self._lock_path)
+        except FileNotFoundError:
+            pass
+        _open_directories.discard(os.path.abspath(self.directory))
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_webhook_outbox():
+    """
+    Outbox compartido del proceso si WEBHOOK_OUTBOX está activado
+
+    Returns:
+        WebhookOutbox: El outbox, None si está desactivado o el directorio
+            lo usa otro proceso
+    """
+    global _outbox
+    if os.getenv('WEBHOOK_OUTBOX', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _outbox_lock:
+        if _outbox is None:
+            try:
+                _outbox = WebhookOutbox()
+            except RuntimeError as e:
+                logger.warning("⚠️ Outbox del webhook desactivado: %s", e)
+                return None
+        return _outbox
+
+
+def reservation_key(payload, slot):
+    """
+    Clave de idempotencia de una petición de reserva (make_idempotency_key)
+
+    La sesión y el teléfono salen de la propia petición: el envío directo
+    (cabecera Idempotency-Key) y el outbox usan así la misma clave.
+
+    Args:
+        payload (dict): Petición (ver webhook_client.build_payload)
+        slot (str): Fecha y hora de la reserva ('YYYY-MM-DD HH:MM')
+    """
+    info = payload['sessionInfo']
+    return make_idempotency_key(info['session'], info['parameters'].get('telefonreserva', ''), slot)
+
+
+def queue_reservation(payload, slot, client=None, outbox=None):
+    """
+    Guarda en el outbox una reserva que el webhook seguro que no procesó
+
+    Args:
+        payload (dict): Petición (ver webhook_client.build_payload)
+        slot (str): Fecha y hora de la reserva ('YYYY-MM-DD HH:MM')
+        client (WebhookClient): Cliente del envío directo; el reenvío va a
+            su URL
+        outbox (WebhookOutbox): Por defecto get_webhook_outbox()
+
+    Returns:
+        str: Identificador de la entrada, None si el outbox está desactivado
+    """
+    outbox = outbox or get_webhook_outbox()
+    if not outbox:
+        return None
+    entry_id = outbox.submit(
+        payload,
+        reservation_key(payload, slot),
+        payload['sessionInfo']['parameters'].get('telefonreserva'),
+        webhook_url=client.webhook_url if client else None
+    )
+    logger.warning("📮 Reserva guardada en el outbox (%s); se enviará al webhook cuando responda", entry_id)
+    return entry_id
+
+
+def print_backlog(directory):
+    entries, pending_by_segment = read_backlog(directory)
+    size = sum(os.path.getsize(os.path.join(directory, segment)) for segment in pending_by_segment)
+    print(f"📮 {len(entries)} peticiones pendientes en {len(pending_by_segment)} segmentos ({size / 1024:.1f} KB)")
+
+    by_phone = {}
+    for entry in entries.values():
+        by_phone.setdefault(entry['telefon'] or '-', []).append(entry)
+    for telefon, phone_entries in by_phone.items():
+        oldest = min(entry['ts'] or time.time() for entry in phone_entries)
+        print(f"   {telefon}: {len(phone_entries)} (la más antigua hace {time.time() - oldest:.0f} s)")
+
+    dead_path = os.path.join(directory, DEAD_FILE)
+    if os.path.exists(dead_path):
+        with open(dead_path, encoding='utf-8') as f:
+            dead = sum(1 for _ in f)
+        print(f"🗑️ {dead} peticiones descartadas en {dead_path}")
+
+
+def main():
+    from dotenv import load_dotenv
+
+    # Cargar variables de entorno
+    load_dotenv()
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'estado'
+    directory = sys.argv[2] if len(sys.argv) > 2 else os.getenv('WEBHOOK_OUTBOX_DIR', 'logs/webhook_outbox')
+
+    print("OUTBOX DEL WEBHOOK DE RESERVAS")
+    print("=" * 50)
+
+    if command == 'estado':
+        print_backlog(directory)
+    elif command == 'descartadas':
+        dead_path = os.path.join(directory, DEAD_FILE)
+        if os.path.exists(dead_path):
+            with open(dead_path, encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    print(f"{record['id']} {record.get('telefon')} intentos={record.get('attempts')} {record.get('error')}")
+    elif command == 'reenviar':
+        try:
+            outbox = WebhookOutbox(directory=directory, start=False)
+        except RuntimeError as e:
+            print(f"❌ {e}: ese proceso ya lo está reenviando")
+            return
+        try:
+            while outbox.pending():
+                before = outbox.pending()
+                result = outbox.replay_once()
+                print(f"   enviadas {result['sent']}, fallidas {result['failed']}, pendientes {outbox.pending()}")
+                if outbox.pending() == before:
+                    print("❌ El webhook sigue sin responder")
+                    break
+        finally:
+            outbox.close()
+        print_backlog(directory)
+    else:
+        print("Uso: python src/webhook_outbox.py [estado|reenviar|descartadas] [directorio]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+# src/webhook_server.py
+"""
+Servidor local compatible con el webhook de reservas (api/webhook.js)
+
+Sustituto del webhook de Vercel para pruebas de carga sin tocar
+producción: mismo contrato (sessionInfo.parameters en la petición,
+fulfillment_response.messages y session_info en la respuesta), misma
+validación y mismos códigos (400 datos incorrectos, 500 error). Las
+reservas se guardan con DatabaseHandler.book_reservation y la cabecera
+Idempotency-Key se respeta, así que un reenvío del outbox no duplica
+reservas. Por defecto se guardan en un SQLite propio (un fichero temporal
+o WEBHOOK_SERVER_SQLITE_PATH), nunca en la base de datos del .env; MySQL
+solo con WEBHOOK_SERVER_DB_BACKEND=mysql y DB_HOST definido.
+
+Se puede inyectar latencia y una fracción de errores 500/503 para probar
+reintentos, el circuit breaker y el outbox.
+
+Es un servidor HTTP/1.1 mínimo sobre asyncio (keep-alive, sin
+dependencias): el bucle de eventos solo parsea y responde, y las
+escrituras en la base de datos van a un pool de hilos, para que el
+servidor nunca sea el cuello de botella al medir el lado cliente.
+
+Uso:
+    python src/webhook_server.py [puerto]
+
+    WEBHOOK_URL=http://127.0.0.1:8787/api/webhook python src/async_webhook_client.py reservas.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from structured_logging import get_logger
+
+ERROR_TEXT = ("Disculpe, hubo un error procesando su reserva. Por favor, intente de nuevo "
+              "o contacte directamente al restaurante.")
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+MAX_BODY_BYTES = 1024 * 1024
+
+logger = get_logger('webhook_server')
+
+
+def _text_response(text):
+    return {"fulfillment_response": {"messages": [{"text": {"text": text}}]}}
+
+
+def _name(nom):
+    # NomReserva puede llegar como {"name": ...} (entidad @sys.person)
+    return nom.get('name') if isinstance(nom, dict) else nom
+
+
+def _parse_date(fecha):
+    """FechaReserva de Dialogflow ({year, month, day} o texto) como date, None si no es válida"""
+    try:
+        if isinstance(fecha, dict):
+            return datetime(int(fecha['year']), int(fecha['month']), int(fecha['day'])).date()
+        return datetime.strptime(str(fecha)[:10], "%Y-%m-%d").date()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _parse_time(hora):
+    """HoraReserva ({hours, minutes, seconds} o 'HH:MM[:SS]') como (h, m, s), None si no es válida"""
+    try:
+        if isinstance(hora, dict):
+            return int(hora.get('hours', 0)), int(hora.get('minutes', 0)), int(float(hora.get('seconds', 0)))
+        for fmt in ("%H:%M:%S", "%H:%M", "%I:%M %p"):
+            try:
+                value = datetime.strptime(str(hora).strip(), fmt)
+                return value.hour, value.minute, value.second
+            except ValueError:
+                continue
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def validate_reservation(datos):
+    """
+    Misma validación que validarReserva (lib/utils.js)
+
+    Returns:
+        list: Errores (vacía si la reserva es válida)
+    """
+    errores = []
+    nom = _name(datos.get('NomReserva'))
+    if not nom or not isinstance(nom, str) or len(nom) < 2:
+        errores.append('Nombre debe tener al menos 2 caracteres')
+    telefon = datos.get('TelefonReserva')
+    if not telefon or not isinstance(telefon, str) or not all(c.isdigit() or c in ' -+()' for c in telefon):
+        errores.append('Teléfono debe ser válido')
+    if not datos.get('FechaReserva'):
+        errores.append('Fecha es requerida')
+    elif _parse_date(datos['FechaReserva']) is None:
+        errores.append('Fecha debe ser válida')
+    if not datos.get('HoraReserva'):
+        errores.append('Hora es requerida')
+    elif _parse_time(datos['HoraReserva']) is None:
+        errores.append('Hora debe ser válida')
+    try:
+        if not datos.get('NumeroReserva') or int(datos['NumeroReserva']) < 1:
+            errores.append('Número de personas debe ser válido')
+    except (TypeError, ValueError):
+        errores.append('Número de personas debe ser válido')
+    return errores
+
+
+class WebhookServer:
+    def __init__(self, host=None, port=None, latency_ms=None, jitter_ms=None, error_rate=None,
+                 unavailable_rate=None, persist=None, workers=None, database_handler=None):
+        """
+        Webhook local de reservas
+
+        Args:
+            host (str): Dirección de escucha (WEBHOOK_SERVER_HOST)
+            port (int): Puerto; 0 = uno libre (WEBHOOK_SERVER_PORT)
+            latency_ms (float): Latencia añadida a cada POST (WEBHOOK_SERVER_LATENCY_MS)
+            jitter_ms (float): Latencia extra aleatoria entre 0 y este valor
+                (WEBHOOK_SERVER_JITTER_MS)
+            error_rate (float): Fracción de POST que responden 500 sin guardar
+                nada (WEBHOOK_SERVER_ERROR_RATE)
+            unavailable_rate (float): Fracción de POST que responden 503
+                (WEBHOOK_SERVER_UNAVAILABLE_RATE)
+            persist (bool): Guardar las reservas con DatabaseHandler; con False
+                solo se valida y se responde (WEBHOOK_SERVER_PERSIST). La base
+                de datos es SQLite (WEBHOOK_SERVER_SQLITE_PATH, por defecto un
+                fichero temporal) salvo WEBHOOK_SERVER_DB_BACKEND=mysql
+            workers (int): Hilos para las escrituras en la base de datos
+                (WEBHOOK_SERVER_WORKERS, por defecto DB_POOL_SIZE)
+            database_handler (DatabaseHandler): Acceso a la base de datos a
+                reutilizar (por defecto uno nuevo si persist)
+        """
+        self.host = host or os.getenv('WEBHOOK_SERVER_HOST', '127.0.0.1')
+        self.port = int(port if port is not None else os.getenv('WEBHOOK_SERVER_PORT', 8787))
+        self.latency = float(latency_ms if latency_ms is not None else os.getenv('WEBHOOK_SERVER_LATENCY_MS', 0)) / 1000
+        self.jitter = float(jitter_ms if jitter_ms is not None else os.getenv('WEBHOOK_SERVER_JITTER_MS', 0)) / 1000
+        self.error_rate = float(error_rate if error_rate is not None else os.getenv('WEBHOOK_SERVER_ERROR_RATE', 0))
+        self.unavailable_rate = float(
+            unavailable_rate if unavailable_rate is not None else os.getenv('WEBHOOK_SERVER_UNAVAILABLE_RATE', 0)
+        )
+        if persist is None:
+            persist = os.getenv('WEBHOOK_SERVER_PERSIST', 'true').lower() in ('1', 'true', 'yes')
+
+        self.database_handler = database_handler
+        if persist and self.database_handler is None:
+            self.database_handler = self._default_database()
+        if not persist:
+            self.database_handler = None
+        workers = int(workers or os.getenv('WEBHOOK_SERVER_WORKERS') or os.getenv('DB_POOL_SIZE', 5))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook-server-db')
+
+        # Sin base de datos los ID son correlativos en memoria
+        self._next_id = 0
+        self._counters = {'requests': 0, 'booked': 0, 'invalid': 0, 'injected_500': 0,
+                          'injected_503': 0, 'db_errors': 0, 'connections': 0}
+        self._started = time.time()
+        self._server = None
+        self._loop = None
+        self._thread = None
+        # Conexiones abiertas: (tarea, writer)
+        self._connections = {}
+
+    @staticmethod
+    def _default_database():
+        """Base de datos de pruebas: nunca la de producción por omisión"""
+        from database_handler import DatabaseHandler
+
+        backend = os.getenv('WEBHOOK_SERVER_DB_BACKEND', 'sqlite').lower()
+        if backend == 'sqlite':
+            path = os.getenv('WEBHOOK_SERVER_SQLITE_PATH') or os.path.join(
+                tempfile.mkdtemp(prefix='webhook_server_'), 'cronosai.sqlite3'
+            )
+            return DatabaseHandler(backend='sqlite', sqlite_path=path)
+        # Sin DB_HOST, DatabaseHandler usaría el servidor de producción
+        if not os.getenv('DB_HOST'):
+            raise ValueError("WEBHOOK_SERVER_DB_BACKEND=mysql requiere DB_HOST explícito")
+        return DatabaseHandler(backend=backend)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/api/webhook"
+
+    def stats(self):
+        result = dict(self._counters)
+        elapsed = time.time() - self._started
+        result['uptime_s'] = round(elapsed, 1)
+        result['requests_per_s'] = round(self._counters['requests'] / elapsed, 1) if elapsed else 0.0
+        return result
+
+    def _book(self, datos, data_combinada, idempotency_key, conversa):
+        """Escritura en la base de datos (en el pool de hilos)"""
+        return self.database_handler.book_reservation(
+            data_combinada,
+            int(datos['NumeroReserva']),
+            datos['TelefonReserva'],
+            _name(datos['NomReserva']),
+            datos.get('Observacions'),
+            conversa,
+            idempotency_key=idempotency_key
+        )
+
+    async def handle_reservation(self, body, headers):
+        """
+        Procesa un POST como api/webhook.js
+
+        Returns:
+            tuple: (status, dict de respuesta)
+        """
+        self._counters['requests'] += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        roll = random.random()
+        if roll < self.unavailable_rate:
+            self._counters['injected_503'] += 1
+            return 503, {"error": "Servicio no disponible (error inyectado)"}
+        if roll < self.unavailable_rate + self.error_rate:
+            self._counters['injected_500'] += 1
+            return 500, _text_response(ERROR_TEXT)
+
+        try:
+            request = json.loads(body or b'{}')
+            parameters = (request.get('sessionInfo') or {}).get('parameters') or {}
+        except (ValueError, AttributeError):
+            self._counters['invalid'] += 1
+            return 400, _text_response("Disculpe, la petición no es JSON válido")
+
+        datos = {
+            'NumeroReserva': parameters.get('numeroreserva'),
+            'FechaReserva': parameters.get('fechareserva'),
+            'HoraReserva': parameters.get('horareserva'),
+            'NomReserva': parameters.get('nomreserva'),
+            'TelefonReserva': parameters.get('telefonreserva'),
+            'Observacions': parameters.get('observacions') or None
+        }
+        errores = validate_reservation(datos)
+        if errores:
+            self._counters['invalid'] += 1
+            return 400, _text_response(f"Disculpe, hay errores en los datos: {', '.join(errores)}")
+
+        fecha = _parse_date(datos['FechaReserva'])
+        hours, minutes, seconds = _parse_time(datos['HoraReserva'])
+        data_combinada = f"{fecha.isoformat()} {hours:02d}:{minutes:02d}:{seconds:02d}"
+        fecha_formateada = fecha.strftime("%d/%m/%Y")
+        hora_formateada = f"{hours:02d}:{minutes:02d}"
+        nombre = _name(datos['NomReserva'])
+
+        if self.database_handler:
+            conversa = (
+                f"=== RESERVA GENERADA ===\nTimestamp: {datetime.now().isoformat()}\n"
+                f"Sesión: {(request.get('sessionInfo') or {}).get('session')}\n"
+                f"Nombre: {nombre}\nTeléfono: {datos['TelefonReserva']}\n"
+                f"Personas: {datos['NumeroReserva']}\nFecha: {fecha_formateada}\nHora: {hora_formateada}"
+            )
+            loop = asyncio.get_running_loop()
+            try:
+                id_reserva = await loop.run_in_executor(
+                    self._executor, self._book, datos, data_combinada, headers.get('idempotency-key'), conversa
+                )
+            except Exception as e:
+                logger.error("❌ Error guardando la reserva: %s", e)
+                id_reserva = None
+            if id_reserva is None:
+                self._counters['db_errors'] += 1
+                return 500, _text_response(ERROR_TEXT)
+        else:
+            self._next_id += 1
+            id_reserva = self._next_id
+
+        self._counters['booked'] += 1
+        response = _text_response(
+            f"¡Excelente! Su reserva ha sido confirmada exitosamente.\n\n"
+            f"📋 Detalles de la reserva:\n"
+            f"• ID de reserva: {id_reserva}\n"
+            f"• Nombre: {nombre}\n"
+            f"• Fecha: {fecha_formateada}\n"
+            f"• Hora: {hora_formateada}\n"
+            f"• Personas: {datos['NumeroReserva']}\n"
+            f"• Teléfono: {datos['TelefonReserva']}\n\n"
+            f"¡Esperamos darle la bienvenida! ¿Hay algo más en lo que pueda ayudarle?"
+        )
+        response['session_info'] = {
+            'parameters': {
+                'id_reserva': id_reserva,
+                'reserva_confirmada': True,
+                'fecha_reserva': fecha_formateada,
+                'hora_reserva': hora_formateada
+            }
+        }
+        return 200, response
+
+    async def _dispatch(self, method, body, headers):
+        if method == 'POST':
+            return await self.handle_reservation(body, headers)
+        if method in ('GET', 'HEAD'):
+            return 200, {
+                'message': 'Webhook funcionando correctamente',
+                'method': method,
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'service': 'CronosAI Webhook Backend (local)',
+                'stats': self.stats()
+            }
+        return 405, {'error': 'Método no permitido'}
+
+    @staticmethod
+    def _write(writer, status, payload, keep_alive, head=False):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head_lines = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode('latin-1')
+        writer.write(head_lines if head else head_lines + body)
+
+    async def _handle_connection(self, reader, writer):
+        """Atiende las peticiones de una conexión keep-alive en orden"""
+        self._counters['connections'] += 1
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                parts = lines[0].split(' ')
+                if len(parts) != 3:
+                    self._write(writer, 400, {'error': 'Petición HTTP no válida'}, False)
+                    break
+                method, _, version = parts
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(':')
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    self._write(writer, 413, {'error': 'Petición demasiado grande'}, False)
+                    break
+                try:
+                    body = await reader.readexactly(length) if length else b''
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+                status, payload = await self._dispatch(method, body, headers)
+                self._write(writer, status, payload, keep_alive, head=method == 'HEAD')
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def start(self):
+        """Empieza a escuchar en el bucle de eventos actual (port=0 elige uno libre)"""
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started = time.time()
+        return self._server
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_background(self):
+        """
+        Arranca el servidor en un hilo propio (para pruebas y benchmarks
+        en el mismo proceso)
+
+        Returns:
+            str: URL del webhook local
+        """
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start())
+                ready.set()
+                loop.run_forever()
+            finally:
+                ready.set()
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        self._thread = threading.Thread(target=run, name='webhook-server', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.url
+
+    async def _shutdown(self):
+        self._server.close()
+        # Las conexiones keep-alive inactivas terminan al cerrar su socket
+        for writer in list(self._connections.values()):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def close(self, timeout=5):
+        """Deja de aceptar conexiones y libera los hilos y la base de datos"""
+        if self._server is not None and self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout)
+            if self._thread is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            # El hilo cierra su bucle de eventos al salir de run_forever()
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        if self.database_handler:
+            self.database_handler.disconnect()
+
+
+def main():
+    from dotenv import load_dotenv
+
+    # Cargar variables de entorno
+    load_dotenv()
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    server = WebhookServer(port=port)
+
+    async def run():
+        await server.start()
+        print("WEBHOOK LOCAL DE RESERVAS")
+        print("=" * 50)
+        print(f"🔗 {server.url}")
+        print(f"⏱️ Latencia: {server.latency * 1000:.0f} ms (+ hasta {server.jitter * 1000:.0f} ms)")
+        print(f"💥 Errores inyectados: {server.error_rate:.0%} 500, {server.unavailable_rate:.0%} 503")
+        if server.database_handler is None:
+            print("💾 Persistencia: desactivada")
+        elif server.database_handler.backend == 'sqlite':
+            print(f"💾 Persistencia: SQLite en {server.database_handler.pool.path}")
+        else:
+            print(f"💾 Persistencia: {server.database_handler.backend} en {server.database_handler.config['host']}")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"📊 {server.stats()}")
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Comprueba los cambios de estado del circuit breaker del webhook
+(src/circuit_breaker.py): cerrado -> abierto -> semiabierto -> cerrado/abierto
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def _breaker(**kwargs):
+    options = dict(failure_rate=0.5, slow_call_ms=1000, slow_call_rate=0.8, window=10, min_calls=4, open_seconds=0.2)
+    options.update(kwargs)
+    return CircuitBreaker(name='test', **options)
+
+
+def _record(breaker, success, elapsed_ms=10.0):
+    assert breaker.allow(), f"Llamada rechazada en estado {breaker.state}"
+    breaker.record(success, elapsed_ms)
+
+
+def test_breaker_opens_and_recovers():
+    """Se abre con la tasa de fallos, rechaza llamadas y se cierra con una prueba correcta"""
+
+    print("PRUEBA DEL CIRCUIT BREAKER")
+    print("=" * 50)
+
+    breaker = _breaker()
+    for success in (True, False, True):
+        _record(breaker, success)
+    assert breaker.state == CLOSED, "Se abrió antes de min_calls"
+    _record(breaker, False)
+    assert breaker.state == OPEN, f"2 fallos de 4 no lo abrieron: {breaker.state}"
+    print("✅ Se abre al llegar a la tasa de fallos con min_calls llamadas")
+
+    assert not breaker.allow() and not breaker.allow()
+    assert breaker.stats()['rejected'] == 2
+    print("✅ Abierto: las llamadas se rechazan sin esperar a la red")
+
+    time.sleep(0.25)
+    assert breaker.allow(), "Pasado open_seconds no deja pasar la prueba"
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow(), "Semiabierto deja pasar más de una llamada de prueba"
+    breaker.record(True, 10.0)
+    assert breaker.state == CLOSED, f"Una prueba correcta no lo cerró: {breaker.state}"
+    assert breaker.stats()['window_failure_rate'] == 0.0, "Al cerrarse no se vacía la ventana"
+    print("✅ Semiabierto: una sola prueba y, si va bien, se cierra")
+
+
+def test_failed_or_slow_probe_reopens():
+    """Una prueba fallida o lenta vuelve a abrir el circuito"""
+
+    print("PRUEBA DE LA LLAMADA DE PRUEBA")
+    print("=" * 50)
+
+    breaker = _breaker()
+    for _ in range(4):
+        _record(breaker, True, elapsed_ms=2000)
+    assert breaker.state == OPEN, f"Las llamadas lentas no lo abrieron: {breaker.state}"
+    print("✅ Se abre con la tasa de llamadas lentas")
+
+    time.sleep(0.25)
+    _record(breaker, False)
+    assert breaker.state == OPEN, f"Una prueba fallida no lo reabrió: {breaker.state}"
+    assert not breaker.allow()
+
+    time.sleep(0.25)
+    _record(breaker, True, elapsed_ms=2000)
+    assert breaker.state == OPEN, f"Una prueba lenta no lo reabrió: {breaker.state}"
+
+    time.sleep(0.25)
+    assert breaker.allow()
+    breaker.cancel()
+    assert breaker.allow(), "cancel() no liberó la llamada de prueba"
+    breaker.record(True, 10.0)
+    assert breaker.state == CLOSED
+    assert breaker.stats()['opened'] == 3
+    print("✅ Las pruebas fallidas o lentas lo reabren y cancel() libera la prueba")
+
+
+if __name__ == "__main__":
+    try:
+        test_breaker_opens_and_recovers()
+        test_failed_or_slow_probe_reopens()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Comprueba que ConnectionPool despierta a quien espera cuando se descarta
+una conexión rota (no hace falta MySQL: las conexiones son simuladas)
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from connection_pool import ConnectionPool
+
+
+class FakeConnection:
+    def close(self):
+        pass
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+
+class FakePool(ConnectionPool):
+    def _new_connection(self):
+        return FakeConnection()
+
+
+def test_waiter_opens_connection_after_discard():
+    """Un hilo esperando con el pool lleno abre una conexión nueva si otro descarta la suya"""
+
+    print("PRUEBA DEL POOL DE CONEXIONES")
+    print("=" * 50)
+
+    pool = FakePool({}, size=1, timeout=2)
+    conn = pool.acquire()
+    result = {}
+
+    def waiter():
+        try:
+            result['conn'] = pool.acquire()
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.1)
+    pool.release(conn, discard=True)
+    thread.join(3)
+
+    assert 'error' not in result, f"El hilo en espera falló: {result.get('error')}"
+    assert result.get('conn') is not None and result['conn'] is not conn
+    assert pool.stats()['open'] == 1
+    print("✅ El hilo en espera abrió una conexión nueva")
+
+
+if __name__ == "__main__":
+    try:
+        test_waiter_opens_connection_after_discard()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
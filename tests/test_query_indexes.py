@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Comprueba que todas las consultas de DatabaseHandler usan índices
+
+Ejecuta src/index_advisor.py contra la base de datos local del .env
+(con DB_BACKEND=sqlite no hace falta MySQL) y falla si alguna consulta
+recorre una tabla entera o necesita un filesort. En MySQL también falla si
+el optimizador recorre la tabla aunque tenga un índice utilizable ('index
+not used'), lo que con una base de datos casi vacía puede ser normal.
+Los índices que falten se pueden generar con:
+python src/index_advisor.py database/fichero.sql
+
+La carga de trabajo inserta y borra reservas y reconstruye OCUPACION_TRAMO,
+así que solo se ejecuta con DB_BACKEND=sqlite o con DB_HOST apuntando a
+esta máquina; con cualquier otra configuración se omite.
+"""
+
+import os
+import sys
+import unittest
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from database_handler import DatabaseHandler
+from index_advisor import IndexAdvisor, print_report
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def _local_database():
+    """La base de datos del .env es SQLite o un MySQL en esta máquina"""
+    if os.getenv('DB_BACKEND', 'mysql').lower() == 'sqlite':
+        return True
+    return os.getenv('DB_HOST') in LOCAL_HOSTS
+
+
+def test_query_indexes():
+    """Ninguna consulta de DatabaseHandler sin índice"""
+
+    if not _local_database():
+        raise unittest.SkipTest("Solo con DB_BACKEND=sqlite o DB_HOST local (la prueba escribe en la base de datos)")
+
+    print("COMPROBANDO ÍNDICES DE LAS CONSULTAS")
+    print("=" * 50)
+
+    db = DatabaseHandler()
+    try:
+        report = IndexAdvisor(db).check()
+    finally:
+        db.disconnect()
+
+    print_report(report)
+    assert report['explained'] > 0, "No se ha podido analizar ninguna consulta"
+    assert not report['findings'], f"{len(report['findings'])} consultas sin índice adecuado"
+
+
+if __name__ == "__main__":
+    try:
+        test_query_indexes()
+    except unittest.SkipTest as e:
+        print(f"⏭️ {e}")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
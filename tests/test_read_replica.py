@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Comprueba el reparto de lecturas entre primario y réplica de DatabaseHandler
+(no hace falta MySQL: primario y réplica son dos ficheros SQLite)
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from database_handler import DatabaseHandler
+
+TELEFON = "+34600000015"
+
+
+def _handler(path, **kwargs):
+    os.environ['DB_SQLITE_PATH'] = path
+    return DatabaseHandler(backend='sqlite', **kwargs)
+
+
+def _names(db):
+    return [reserva['nom_persona_reserva'] for reserva in db.get_reservas_by_telefon(TELEFON)]
+
+
+def test_reads_go_to_replica_until_the_thread_writes():
+    """Las lecturas van a la réplica salvo justo después de escribir en el mismo hilo"""
+
+    print("PRUEBA DE LECTURAS EN LA RÉPLICA")
+    print("=" * 50)
+
+    directory = tempfile.mkdtemp()
+    previous_path = os.environ.get('DB_SQLITE_PATH')
+    replica = _handler(os.path.join(directory, 'replica.sqlite3'))
+    db = _handler(os.path.join(directory, 'primary.sqlite3'), read_your_writes=60)
+    # La réplica es otro fichero: lo que se lea de ella no está en el primario
+    db.replica_pool = replica.pool
+    try:
+        replica.insert_reserva("2030-01-10 20:00:00", 2, TELEFON, "Réplica")
+
+        result = {}
+        thread = threading.Thread(target=lambda: result.setdefault('names', _names(db)))
+        thread.start()
+        thread.join()
+        assert result.get('names') == ["Réplica"], f"Lectura sin escritura previa: {result.get('names')}"
+        print("✅ Sin escrituras previas se lee de la réplica")
+
+        db.insert_reserva("2030-01-11 20:00:00", 2, TELEFON, "Primario")
+        assert _names(db) == ["Primario"], f"Lectura tras escribir: {_names(db)}"
+        print("✅ Justo después de escribir, el mismo hilo lee del primario")
+
+        db.reservas_cache.clear()
+        thread = threading.Thread(target=lambda: result.update(names=_names(db)))
+        thread.start()
+        thread.join()
+        assert result['names'] == ["Réplica"], f"Lectura desde otro hilo: {result['names']}"
+        print("✅ Los demás hilos siguen leyendo de la réplica")
+    finally:
+        db.disconnect()
+        replica.disconnect()
+        if previous_path is None:
+            os.environ.pop('DB_SQLITE_PATH', None)
+        else:
+            os.environ['DB_SQLITE_PATH'] = previous_path
+
+
+if __name__ == "__main__":
+    try:
+        test_reads_go_to_replica_until_the_thread_writes()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Comprueba el reenvío del outbox del webhook (src/webhook_outbox.py): orden
+por teléfono, reintentos mientras el webhook no responde, persistencia en
+disco y reenvío a la URL del cliente que guardó la reserva
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from webhook_client import WebhookClient, build_payload
+from webhook_outbox import WebhookOutbox, queue_reservation, read_backlog, reservation_key
+from webhook_server import WebhookServer
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ''
+
+
+class FakeClient:
+    """Cliente que anota las peticiones y responde con `status`"""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.posts = []
+        self._lock = threading.Lock()
+
+    def post(self, payload, timeout=None, headers=None):
+        with self._lock:
+            self.posts.append((payload['sessionInfo']['parameters']['telefonreserva'],
+                               payload['sessionInfo']['parameters']['orden'],
+                               (headers or {}).get('Idempotency-Key')))
+        return FakeResponse(self.status)
+
+
+def _payload(telefon, orden):
+    return build_payload("test-outbox", {"telefonreserva": telefon, "orden": orden})
+
+
+def test_replay_keeps_order_per_phone():
+    """Las reservas de un mismo teléfono se reenvían en el orden en que se guardaron"""
+
+    print("PRUEBA DEL ORDEN DE REENVÍO DEL OUTBOX")
+    print("=" * 50)
+
+    directory = tempfile.mkdtemp()
+    client = FakeClient(status=503)
+    outbox = WebhookOutbox(client=client, directory=directory, start=False, batch_size=10)
+    try:
+        queued = [("+34600000001", 1), ("+34600000002", 1), ("+34600000001", 2),
+                  ("+34600000003", 1), ("+34600000001", 3), ("+34600000002", 2)]
+        for telefon, orden in queued:
+            outbox.submit(_payload(telefon, orden), f"clave-{telefon}-{orden}", telefon)
+        outbox.submit(_payload("+34600000001", 1), "clave-+34600000001-1", "+34600000001")
+        assert outbox.pending() == len(queued), "Una clave repetida se guardó dos veces"
+
+        result = outbox.replay_once()
+        assert result == {'sent': 0, 'failed': 1}, f"Webhook caído: {result}"
+        assert len(client.posts) == 1 and outbox.pending() == len(queued)
+        print("✅ Con el webhook caído solo se envía la petición de prueba y nada se pierde")
+
+        # Un proceso nuevo recupera lo pendiente del disco
+        outbox.close()
+        entries, _ = read_backlog(directory)
+        assert [(entry['telefon'], entry['payload']['sessionInfo']['parameters']['orden'])
+                for entry in entries.values()] == queued
+        client = FakeClient()
+        outbox = WebhookOutbox(client=client, directory=directory, start=False, batch_size=10)
+        print("✅ Las entradas pendientes se recuperan del disco en orden")
+
+        rounds = 0
+        while outbox.pending():
+            before = len(client.posts)
+            outbox.replay_once()
+            rounds += 1
+            # Nunca dos peticiones del mismo teléfono en la misma ronda
+            phones = [telefon for telefon, _, _ in client.posts[before:]]
+            assert len(phones) == len(set(phones)), f"Ronda {rounds} con teléfonos repetidos: {phones}"
+        assert rounds == 3, f"Rondas: {rounds}"
+
+        for telefon in ("+34600000001", "+34600000002", "+34600000003"):
+            sent = [orden for phone, orden, _ in client.posts if phone == telefon]
+            expected = [orden for phone, orden in queued if phone == telefon]
+            assert sent == expected, f"Orden de {telefon}: {sent}"
+        assert all(key == f"clave-{telefon}-{orden}" for telefon, orden, key in client.posts)
+        assert outbox.stats()['sent'] == len(queued)
+        print(f"✅ {len(queued)} reservas reenviadas en {rounds} rondas, en orden por teléfono y con su clave")
+    finally:
+        outbox.close()
+
+    assert not any(name.startswith('segment-') for name in os.listdir(directory)), "Quedan segmentos confirmados"
+    print("✅ Los segmentos confirmados se borran")
+
+
+def test_replay_goes_to_the_callers_webhook():
+    """queue_reservation guarda la URL del cliente y el reenvío va a ese webhook"""
+
+    print("PRUEBA DEL WEBHOOK DE CADA ENTRADA")
+    print("=" * 50)
+
+    default_server = WebhookServer(port=0, persist=False)
+    caller_server = WebhookServer(port=0, persist=False)
+    default_client = WebhookClient(default_server.start_background())
+    caller_client = WebhookClient(caller_server.start_background())
+    outbox = WebhookOutbox(client=default_client, directory=tempfile.mkdtemp(), start=False)
+    try:
+        payload = build_payload("test-outbox-url", {
+            "nomreserva": "Juan Pérez",
+            "telefonreserva": "+49123456789",
+            "fechareserva": {"year": 2030, "month": 3, "day": 25},
+            "horareserva": {"hours": 20, "minutes": 0, "seconds": 0},
+            "numeroreserva": 4
+        })
+        entry_id = queue_reservation(payload, "2030-03-25 20:00", caller_client, outbox)
+        entry = outbox._entries[entry_id]
+        assert entry['url'] == caller_client.webhook_url
+        assert entry['key'] == reservation_key(payload, "2030-03-25 20:00:00")
+        print("✅ La entrada guarda la URL del cliente y la clave de la reserva")
+
+        assert outbox.replay_once() == {'sent': 1, 'failed': 0}
+        assert caller_server.stats()['booked'] == 1, f"Webhook del cliente: {caller_server.stats()}"
+        assert default_server.stats()['requests'] == 0, f"Webhook por defecto: {default_server.stats()}"
+        print("✅ El reenvío va al webhook del cliente, no al de WEBHOOK_URL")
+    finally:
+        outbox.close()
+        default_client.close()
+        caller_client.close()
+        default_server.close()
+        caller_server.close()
+
+
+if __name__ == "__main__":
+    try:
+        test_replay_keeps_order_per_phone()
+        test_replay_goes_to_the_callers_webhook()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Comprueba que el webhook local (src/webhook_server.py) cumple el mismo
+contrato que api/webhook.js
+
+Arranca el servidor en un hilo sin base de datos y le envía reservas con
+el mismo cliente que usan los simuladores.
+"""
+
+import os
+import sys
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from webhook_client import WebhookClient, build_payload, parse_fulfillment_text
+from webhook_server import WebhookServer
+
+
+def test_webhook_server():
+    """Respuestas del webhook local: reserva válida, datos incorrectos y errores inyectados"""
+
+    print("🌐 PRUEBA DEL WEBHOOK LOCAL")
+    print("=" * 50)
+
+    server = WebhookServer(port=0, persist=False)
+    url = server.start_background()
+    client = WebhookClient(url)
+    try:
+        response = client.post(build_payload("test-session-123", {
+            "nomreserva": "Juan Pérez",
+            "telefonreserva": "+49123456789",
+            "fechareserva": {"year": 2030, "month": 3, "day": 25},
+            "horareserva": {"hours": 20, "minutes": 0, "seconds": 0},
+            "numeroreserva": 4,
+            "observacions": "Mesa cerca de la ventana"
+        }))
+        assert response.status_code == 200, f"Status {response.status_code}"
+        data = response.json()
+        assert "confirmada" in parse_fulfillment_text(data)
+        parameters = data['session_info']['parameters']
+        assert parameters['reserva_confirmada'] is True
+        assert parameters['fecha_reserva'] == "25/03/2030" and parameters['hora_reserva'] == "20:00"
+        print(f"✅ Reserva confirmada con ID {parameters['id_reserva']}")
+
+        response = client.post(build_payload("test-session-123", {"nomreserva": "J"}))
+        assert response.status_code == 400, f"Status {response.status_code}"
+        assert "errores en los datos" in parse_fulfillment_text(response.json())
+        print("✅ Datos incorrectos rechazados con 400")
+
+        assert requests.get(url, timeout=5).json()['message'] == 'Webhook funcionando correctamente'
+
+        server.error_rate = 1.0
+        response = client.post(build_payload("test-session-123", {}))
+        assert response.status_code == 500, f"Status {response.status_code}"
+        print("✅ Error inyectado con 500")
+        print(f"📊 {server.stats()}")
+    finally:
+        client.close()
+        server.close()
+
+
+if __name__ == "__main__":
+    try:
+        test_webhook_server()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)